@@ -3,6 +3,57 @@ import pandas as pd
 from engine import FiscalEngine
 from dgt_classifier import DGTAnalyzer
 
+
+# Motor y analizador se construyen una vez por proceso y se comparten entre sesiones y reruns
+@st.cache_resource
+def get_engine():
+    return FiscalEngine()
+
+
+@st.cache_resource
+def get_analyzer():
+    return DGTAnalyzer()
+
+
+@st.cache_data(max_entries=4096)
+def classify_expense(description, cnae):
+    """Clasificación memoizada por gasto: al añadir uno nuevo solo se clasifica ese."""
+    return get_analyzer().classify_descriptions([description], cnae)[0]
+
+
+@st.cache_data(max_entries=64)
+def analyze_expenses(expenses, cnae):
+    """
+    Análisis DGT de la lista de gastos; expenses es una tupla de (descripción, importe).
+    Solo se recalcula si cambian los gastos o el CNAE (no al cambiar la comunidad o los sueldos).
+    """
+    dgt = get_analyzer()
+    analyzed = [
+        dgt.analyze_expense({"description": d, "amount": a}, cnae, classify_expense(d, cnae))
+        for d, a in expenses
+    ]
+    return {
+        "analyzed_expenses": analyzed,
+        "fiscal_risk_score": dgt.calculate_risk_score(analyzed),
+        "total_deductible_suggested": sum(e["deductible_amount"] for e in analyzed),
+        "table": pd.DataFrame(analyzed, columns=["description", "amount", "category", "reason", "deductible_amount"]),
+    }
+
+
+@st.cache_data(max_entries=256)
+def simulate(employee_gross, employee_ss, company_ss, employee_personal_expenses, autonomo_gross,
+             autonomo_expenses, region):
+    return get_engine().run_simulation(
+        employee_gross=employee_gross,
+        employee_ss=employee_ss,
+        company_ss=company_ss,
+        employee_personal_expenses=employee_personal_expenses,
+        autonomo_gross=autonomo_gross,
+        autonomo_expenses=autonomo_expenses,
+        region=region
+    )
+
+
 # Configuración de la página
 st.set_page_config(page_title="Fiscal Navigator 2026", layout="wide")
 
@@ -12,7 +63,7 @@ st.markdown("Comparador de eficiencia fiscal: **Asalariado vs Autónomo vs Socie
 # Sidebar: Configuración de Datos
 st.sidebar.header("📍 Configuración General")
 # Initialize engine to get available regions
-engine = FiscalEngine() 
+engine = get_engine()
 available_regions = list(engine.data["irpf_tables_autonomicas"].keys())
 default_index = available_regions.index("Madrid") if "Madrid" in available_regions else 0
 region = st.sidebar.selectbox("Comunidad Autónoma", available_regions, index=default_index)
@@ -58,8 +109,7 @@ with st.sidebar.expander("Añadir Gastos Actividad", expanded=False):
 
 # Mostrar Gastos y Análisis
 if st.session_state.expenses:
-    dgt = DGTAnalyzer()
-    processed = dgt.process_expenses(st.session_state.expenses, cnae)
+    processed = analyze_expenses(tuple((e["description"], e["amount"]) for e in st.session_state.expenses), cnae)
     
     st.subheader("🕵️ Análisis de Inteligencia DGT")
     
@@ -68,116 +118,96 @@ if st.session_state.expenses:
     color = "green" if risk_score < 4 else "orange" if risk_score < 7 else "red"
     st.metric("Score de Riesgo Fiscal", f"{risk_score}/10")
     
-    # Tabla de gastos clasificados
-    df_expenses = pd.DataFrame(processed["analyzed_expenses"])
-    # Traducir columnas para visualización
-    df_show = df_expenses[["description", "amount", "category", "reason", "deductible_amount"]]
-    st.dataframe(df_show, use_container_width=True)
-    
-    total_deductible = processed["total_deductible_suggested"]
-else:
-    total_deductible = 0
+    # Tabla de gastos clasificados (construida una vez por lista de gastos)
+    st.dataframe(processed["table"], use_container_width=True)
 
-# Simulación Principal
-if st.button("🚀 Ejecutar Simulación Fiscal", type="primary"):
-    engine = FiscalEngine()
-    
-    # Calculate total expenses from session
-    # Note: engine expects 'autonomo_expenses'. 
-    
-    total_deductible = 0
-    employee_personal_expenses = 0
-    
-    for e in st.session_state.expenses:
-        total_deductible += e["amount"]
-        if e.get("also_employee"):
-            employee_personal_expenses += e["amount"]
-    
-    result = engine.run_simulation(
-        employee_gross=employee_gross, 
-        employee_ss=employee_ss,
-        company_ss=company_ss,
-        employee_personal_expenses=employee_personal_expenses,
-        autonomo_gross=autonomo_gross, 
-        autonomo_expenses=total_deductible, 
-        region=region
-    )
-    
-    res = result["results"]
-    
-    st.divider()
-    
-    # Tarjetas de Resultados
-    c1, c2, c3 = st.columns(3)
+# Simulación Principal: se recalcula en vivo con cada cambio (memoizada por entradas)
+# Calculate total expenses from session (sin prorrateo: todo gasto introducido es deducible)
+total_deductible = 0
+employee_personal_expenses = 0
+
+for e in st.session_state.expenses:
+    total_deductible += e["amount"]
+    if e.get("also_employee"):
+        employee_personal_expenses += e["amount"]
+
+result = simulate(employee_gross, employee_ss, company_ss, employee_personal_expenses,
+                  autonomo_gross, total_deductible, region)
+res = result["results"]
+
+st.divider()
+
+# Tarjetas de Resultados
+c1, c2, c3 = st.columns(3)
+
+with c1:
+    st.header("👨‍💼 Asalariado")
+    st.metric("Neto en Bolsillo", f"{res['asalariado']['neto']:,.2f} €", help="Incluye resta de gastos personales no deducibles si los has marcado.")
+    st.caption(f"IRPF pagado: {res['asalariado']['irpf']:,.2f} €")
     
-    with c1:
-        st.header("👨‍💼 Asalariado")
-        st.metric("Neto en Bolsillo", f"{res['asalariado']['neto']:,.2f} €", help="Incluye resta de gastos personales no deducibles si los has marcado.")
-        st.caption(f"IRPF pagado: {res['asalariado']['irpf']:,.2f} €")
-        
-    with c2:
-        st.header("💻 Autónomo")
-        st.metric("Neto en Bolsillo", f"{res['autonomo']['neto']:,.2f} €", 
-                  delta=f"{res['autonomo']['neto'] - res['asalariado']['neto']:,.2f} € vs Asalariado")
-        st.caption(f"Cuota RETA: {res['autonomo']['reta']:,.2f} €")
-        
-    with c3:
-        st.header("🏢 Sociedad Limitada")
-        st.metric("Neto en Bolsillo", f"{res['sociedad_limitada']['neto']:,.2f} €",
-                  delta=f"{res['sociedad_limitada']['neto'] - res['asalariado']['neto']:,.2f} € vs Asalariado")
-        st.caption(f"Impuesto Sociedades: {res['sociedad_limitada']['is']:,.2f} €")
-
-    # Gráfica
-    st.subheader("Comparativa Visual")
-    chart_data = pd.DataFrame({
-        "Régimen": ["Asalariado", "Autónomo", "Sociedad Limitada"],
-        "Neto Anual": [res['asalariado']['neto'], res['autonomo']['neto'], res['sociedad_limitada']['neto']]
-    })
-    st.bar_chart(chart_data, x="Régimen", y="Neto Anual", color="Régimen")
-
-    st.markdown("---")
-    st.subheader("📝 Desglose de Cálculos")
+with c2:
+    st.header("💻 Autónomo")
+    st.metric("Neto en Bolsillo", f"{res['autonomo']['neto']:,.2f} €", 
+              delta=f"{res['autonomo']['neto'] - res['asalariado']['neto']:,.2f} € vs Asalariado")
+    st.caption(f"Cuota RETA: {res['autonomo']['reta']:,.2f} €")
     
-    with st.expander("Ver detalle: Asalariado"):
-        d = res['asalariado']['details']
-        st.write(f"**Ingresos Brutos**: {d['bruto']:,.2f} €")
-        st.write(f"- Seguridad Social (aprox 6.35%): {d['ss_cuota']:,.2f} €")
-        st.write(f"- Reducción por Trabajo: {d['reduccion_trabajo']:,.2f} €")
-        st.markdown(f"**= Base Liquidable IRPF**: `{d['base_imponible']:,.2f} €`")
-        st.write(f"  * Cuota Estatal: {d['cuota_estatal']:,.2f} €")
-        st.write(f"  * Cuota Autonómica ({region}): {d['cuota_autonomica']:,.2f} €")
-        st.markdown(f"**Total IRPF**: `{d['total_irpf']:,.2f} €`")
-        st.write("---")
-        st.write(f"Neto en Nómina: {d['neto_oficial']:,.2f} €")
-        if d['gastos_personales_asumidos'] > 0:
-            st.write(f"- Gastos Personales (No Deducibles): {d['gastos_personales_asumidos']:,.2f} €")
-            st.caption("Estos son gastos que has marcado como 'incurridos también por asalariado'.")
-        st.success(f"**Neto Real en Bolsillo**: {res['asalariado']['neto']:,.2f} €")
-
-    with st.expander("Ver detalle: Autónomo (Est. Directa Simplificada)"):
-        d = res['autonomo']['details']
-        st.write(f"**Ingresos**: {d['ingresos']:,.2f} €")
-        st.write(f"- Gastos Deducibles: {d['gastos']:,.2f} €")
-        st.write(f"- Cuota RETA Anual: {d['reta_anual']:,.2f} €")
-        st.write(f"= Rendimiento Neto Previo: {d['rendimiento_neto_previo']:,.2f} €")
-        st.write(f"- 7% Gastos Difícil Justificación (Tope 2k): {d['reduccion_7_porciento']:,.2f} €")
-        st.markdown(f"**= Base Liquidable IRPF**: `{d['base_imponible']:,.2f} €`")
-        st.write(f"  * Cuota Estatal: {d['cuota_estatal']:,.2f} €")
-        st.write(f"  * Cuota Autonómica ({region}): {d['cuota_autonomica']:,.2f} €")
-        st.markdown(f"**Total IRPF**: `{d['total_irpf']:,.2f} €`")
-        st.success(f"**Neto Final**: {res['autonomo']['neto']:,.2f} €")
-
-    with st.expander("Ver detalle: Sociedad Limitada"):
-        d = res['sociedad_limitada']['details']
-        st.write(f"**Ingresos**: {d['ingresos']:,.2f} €")
-        st.write(f"- Gastos Deducibles: {d['gastos']:,.2f} €")
-        st.write(f"- SS Societario / Admin: {d['ss_societario']:,.2f} €")
-        st.markdown(f"**= Base Imponible IS**: `{d['base_imponible_is']:,.2f} €`")
-        st.write(f"  * Tipo IS: {d['tipo_is']*100}%")
-        st.markdown(f"**Cuota Impuesto Sociedades**: `{d['cuota_is']:,.2f} €`")
-        st.write(f"Beneficio Distribuible: {d['dividendo_bruto']:,.2f} €")
-        st.write(f"- Impuesto s/ Dividendos (Ahorro): {d['retencion_dividendo']:,.2f} €")
-        st.success(f"**Neto Final (Dividendo + Sueldo)**: {res['sociedad_limitada']['neto']:,.2f} €")
+with c3:
+    st.header("🏢 Sociedad Limitada")
+    st.metric("Neto en Bolsillo", f"{res['sociedad_limitada']['neto']:,.2f} €",
+              delta=f"{res['sociedad_limitada']['neto'] - res['asalariado']['neto']:,.2f} € vs Asalariado")
+    st.caption(f"Impuesto Sociedades: {res['sociedad_limitada']['is']:,.2f} €")
+
+# Gráfica
+st.subheader("Comparativa Visual")
+chart_data = pd.DataFrame({
+    "Régimen": ["Asalariado", "Autónomo", "Sociedad Limitada"],
+    "Neto Anual": [res['asalariado']['neto'], res['autonomo']['neto'], res['sociedad_limitada']['neto']]
+})
+st.bar_chart(chart_data, x="Régimen", y="Neto Anual", color="Régimen")
+
+st.markdown("---")
+st.subheader("📝 Desglose de Cálculos")
+
+with st.expander("Ver detalle: Asalariado"):
+    d = res['asalariado']['details']
+    st.write(f"**Ingresos Brutos**: {d['bruto']:,.2f} €")
+    st.write(f"- Seguridad Social (aprox 6.35%): {d['ss_cuota']:,.2f} €")
+    st.write(f"- Reducción por Trabajo: {d['reduccion_trabajo']:,.2f} €")
+    st.markdown(f"**= Base Liquidable IRPF**: `{d['base_imponible']:,.2f} €`")
+    st.write(f"  * Cuota Estatal: {d['cuota_estatal']:,.2f} €")
+    st.write(f"  * Cuota Autonómica ({region}): {d['cuota_autonomica']:,.2f} €")
+    st.markdown(f"**Total IRPF**: `{d['total_irpf']:,.2f} €`")
+    st.write("---")
+    st.write(f"Neto en Nómina: {d['neto_oficial']:,.2f} €")
+    if d['gastos_personales_asumidos'] > 0:
+        st.write(f"- Gastos Personales (No Deducibles): {d['gastos_personales_asumidos']:,.2f} €")
+        st.caption("Estos son gastos que has marcado como 'incurridos también por asalariado'.")
+    st.success(f"**Neto Real en Bolsillo**: {res['asalariado']['neto']:,.2f} €")
+
+with st.expander("Ver detalle: Autónomo (Est. Directa Simplificada)"):
+    d = res['autonomo']['details']
+    st.write(f"**Ingresos**: {d['ingresos']:,.2f} €")
+    st.write(f"- Gastos Deducibles: {d['gastos']:,.2f} €")
+    st.write(f"- Cuota RETA Anual: {d['reta_anual']:,.2f} €")
+    st.write(f"= Rendimiento Neto Previo: {d['rendimiento_neto_previo']:,.2f} €")
+    st.write(f"- 7% Gastos Difícil Justificación (Tope 2k): {d['reduccion_7_porciento']:,.2f} €")
+    st.markdown(f"**= Base Liquidable IRPF**: `{d['base_imponible']:,.2f} €`")
+    st.write(f"  * Cuota Estatal: {d['cuota_estatal']:,.2f} €")
+    st.write(f"  * Cuota Autonómica ({region}): {d['cuota_autonomica']:,.2f} €")
+    st.markdown(f"**Total IRPF**: `{d['total_irpf']:,.2f} €`")
+    st.success(f"**Neto Final**: {res['autonomo']['neto']:,.2f} €")
+
+with st.expander("Ver detalle: Sociedad Limitada"):
+    d = res['sociedad_limitada']['details']
+    st.write(f"**Ingresos**: {d['ingresos']:,.2f} €")
+    st.write(f"- Gastos Deducibles: {d['gastos']:,.2f} €")
+    st.write(f"- SS Societario / Admin: {d['ss_societario']:,.2f} €")
+    st.markdown(f"**= Base Imponible IS**: `{d['base_imponible_is']:,.2f} €`")
+    st.write(f"  * Tipo IS: {d['tipo_is']*100}%")
+    st.markdown(f"**Cuota Impuesto Sociedades**: `{d['cuota_is']:,.2f} €`")
+    st.write(f"Beneficio Distribuible: {d['dividendo_bruto']:,.2f} €")
+    st.write(f"- Impuesto s/ Dividendos (Ahorro): {d['retencion_dividendo']:,.2f} €")
+    st.success(f"**Neto Final (Dividendo + Sueldo)**: {res['sociedad_limitada']['neto']:,.2f} €")
 
 st.markdown("---")
 st.caption("Los datos impositivos se cargan desde `tax_data.json`. Las reglas de deducción se cargan desde `rules.json`.")
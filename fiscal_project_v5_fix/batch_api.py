@@ -0,0 +1,153 @@
+"""
+Peticiones de simulación y ejecución de lotes, compartidas por la API (main.py) y el
+procesado de carteras por línea de comandos (portfolio_runner.py).
+Sin dependencias de Cloud Functions ni de BigQuery: solo el motor y el clasificador.
+"""
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Optional
+import json
+import logging
+
+import numpy as np
+
+import instrumentation
+
+# Supuestos para construir el perfil asalariado a partir del bruto (igual que test_simulation.py)
+EMPLOYEE_SS_RATE = 0.0635
+COMPANY_SS_RATE = 0.299
+
+# Pydantic Models for Validation
+class ExpenseItem(BaseModel):
+    description: str
+    amount: float = Field(..., gt=0, description="Amount in EUR")
+
+class SimulationRequest(BaseModel):
+    gross_income: float = Field(..., gt=0, description="Annual Gross Income")
+    expenses: List[ExpenseItem] = []
+    region: str = "Madrid"
+    cnae: str = Field(..., description="CNAE Activity Code")
+    is_new_company: bool = False
+    year: Optional[int] = Field(None, description="Tax year (default: engine data year)")
+
+
+class ItemError(ValueError):
+    """Elemento del lote que no se pudo leer; conserva su id para la línea de error."""
+
+    def __init__(self, message, item_id=None):
+        super().__init__(message)
+        self.item_id = item_id
+
+    def __reduce__(self):
+        # Viaja a los workers del pool con su id
+        return ItemError, (str(self), self.item_id)
+
+
+def validation_details(error):
+    """
+    Errores de Pydantic en el formato común de la petición individual y de los lotes:
+    sin URL de documentación y ya serializables (loc como lista, ctx como texto).
+    """
+    return json.loads(error.json(include_url=False))
+
+
+def year_error(engine, year):
+    """Mensaje de error si no hay datos fiscales para el año pedido (None si es válido)."""
+    if year is None or year == engine.dataset.year:
+        return None
+    try:
+        engine.store.resolve_year(year)
+    except KeyError as e:
+        return str(e.args[0])
+    return None
+
+
+def run_batch_chunk(engine, dgt, chunk, offset):
+    """
+    Valida, clasifica y simula un bloque del lote. Los errores son por elemento: cada
+    línea de salida lleva su "index" (y el "id" del elemento, si lo trae).
+    Un elemento puede ser una excepción (p.ej. una línea que no es JSON): sale como error.
+    """
+    lines = [None] * len(chunk)
+    valid = []  # (posición en el bloque, SimulationRequest)
+
+    with instrumentation.stage("validation"):
+        for i, raw in enumerate(chunk):
+            line = {"index": offset + i}
+            if isinstance(raw, dict) and "id" in raw:
+                line["id"] = raw["id"]
+            elif isinstance(raw, ItemError) and raw.item_id is not None:
+                line["id"] = raw.item_id
+            lines[i] = line
+            try:
+                if isinstance(raw, Exception):
+                    raise raw
+                if not isinstance(raw, dict):
+                    raise ValueError("Each batch item must be a JSON object")
+                data = SimulationRequest(**raw)
+                error = year_error(engine, data.year)
+                if error:
+                    raise ValueError(error)
+                valid.append((i, data))
+            except ValidationError as e:
+                line.update(status="error", error="Validation Error", details=validation_details(e))
+            except Exception as e:
+                line.update(status="error", error=f"Bad Request: {str(e)}")
+
+    if valid:
+        try:
+            with instrumentation.stage("classification"):
+                dgt_results = _classify_batch(dgt, [data for _, data in valid])
+            with instrumentation.stage("simulation"):
+                results = _simulate_batch(engine, [data for _, data in valid], dgt_results)
+        except Exception as e:
+            logging.error(f"Internal Error in batch chunk: {e}")
+            for i, _ in valid:
+                lines[i].update(status="error", error=str(e))
+        else:
+            for (i, data), dgt_result, result in zip(valid, dgt_results, results):
+                lines[i].update(
+                    status="success",
+                    dgt_analysis={
+                        "risk_score": dgt_result["fiscal_risk_score"],
+                        "details": dgt_result["analyzed_expenses"],
+                        "total_deductible": dgt_result["total_deductible_suggested"]
+                    },
+                    financial_simulation=result["results"],
+                    inputs=result["inputs"]
+                )
+    return lines
+
+
+def _classify_batch(dgt, requests):
+    """Una clasificación por CNAE para todos los gastos del bloque y un resumen por elemento."""
+    by_cnae = {}
+    for k, data in enumerate(requests):
+        by_cnae.setdefault(data.cnae, []).append(k)
+
+    summaries = [None] * len(requests)
+    for cnae, positions in by_cnae.items():
+        expenses = [[e.model_dump() for e in requests[k].expenses] for k in positions]
+        analyses = dgt.classify_descriptions([e["description"] for items in expenses for e in items], cnae)
+        start = 0
+        for k, items in zip(positions, expenses):
+            summaries[k] = dgt.summarize(items, analyses[start:start + len(items)], cnae)
+            start += len(items)
+    return summaries
+
+
+def _simulate_batch(engine, requests, dgt_results):
+    """
+    Todas las simulaciones del bloque en una llamada vectorizada (agrupa por año y comunidad).
+    Cada elemento es el dict de run_simulation: el mismo payload que la petición individual.
+    """
+    gross = np.array([data.gross_income for data in requests], dtype=np.float64)
+    results = engine.simulate_batch({
+        "employee_gross": gross,
+        "employee_ss": gross * EMPLOYEE_SS_RATE,
+        "autonomo_gross": gross,
+        "autonomo_expenses": np.array([r["total_deductible_suggested"] for r in dgt_results], dtype=np.float64),
+        "region": np.array([data.region for data in requests], dtype=object),
+        "is_new_company": np.array([data.is_new_company for data in requests], dtype=bool),
+        "year": np.array([engine.dataset.year if data.year is None else data.year for data in requests]),
+    })
+    return [result.to_dict() for result in results]
@@ -0,0 +1,68 @@
+"""
+Benchmark del clasificador de gastos: autómata compilado frente al recorrido
+original de las listas (`any(k in texto ...)`), escalando el número de reglas
+y de gastos.
+
+    python benchmarks/bench_classifier.py
+"""
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dgt_classifier import RULE_LISTS  # noqa: E402
+from keyword_matcher import KeywordMatcher  # noqa: E402
+
+
+def synthetic_rules(n_keywords, seed=0):
+    rng = random.Random(seed)
+    words = {"".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10))) for _ in range(n_keywords)}
+    words = sorted(words)
+    rng.shuffle(words)
+    third = len(words) // 3
+    return {RULE_LISTS[0]: words[:third], RULE_LISTS[1]: words[third:2 * third], RULE_LISTS[2]: words[2 * third:]}
+
+
+def synthetic_expenses(rules, n_expenses, seed=1):
+    rng = random.Random(seed)
+    keywords = [k for name in RULE_LISTS for k in rules[name]]
+    expenses = []
+    for _ in range(n_expenses):
+        filler = " ".join("".join(rng.choices(string.ascii_lowercase, k=5)) for _ in range(3))
+        # La mitad de los gastos contienen alguna keyword
+        expenses.append(f"{filler} {rng.choice(keywords)}" if rng.random() < 0.5 else filler)
+    return expenses
+
+
+def naive_classify(rules, text):
+    for priority, name in enumerate(RULE_LISTS):
+        if any(k in text for k in rules[name]):
+            return priority
+    return None
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def run(rule_counts=(10, 100, 1000, 5000), expense_counts=(1000, 10000)):
+    print(f"{'reglas':>8} {'gastos':>8} {'compilar (ms)':>14} {'lineal (ms)':>12} {'autómata (ms)':>14} {'x':>7}")
+    for n_rules in rule_counts:
+        rules = synthetic_rules(n_rules)
+        matcher, compile_s = timed(KeywordMatcher, [rules[name] for name in RULE_LISTS])
+        for n_expenses in expense_counts:
+            expenses = synthetic_expenses(rules, n_expenses)
+            naive, naive_s = timed(lambda: [naive_classify(rules, e) for e in expenses])
+            fast, fast_s = timed(lambda: [matcher.match(e) for e in expenses])
+            assert naive == fast
+            print(f"{n_rules:>8} {n_expenses:>8} {compile_s * 1000:>14.1f} {naive_s * 1000:>12.1f} "
+                  f"{fast_s * 1000:>14.1f} {naive_s / fast_s:>7.1f}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,175 @@
+"""
+Suite de benchmarks: motor fiscal, clasificador DGT y Cloud Function.
+
+    python benchmarks/bench_suite.py --save-baseline      # crea/actualiza benchmarks/baseline.json
+    python benchmarks/bench_suite.py -o results.json      # mide y compara con el baseline
+    python benchmarks/bench_suite.py -k engine --threshold 0.1
+
+Sale con código 1 si algún caso empeora más del umbral frente al baseline.
+Los tiempos dependen de la máquina: el baseline debe generarse donde se va a comparar.
+"""
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main as cloud_function  # noqa: E402
+from bench_classifier import synthetic_expenses, synthetic_rules  # noqa: E402
+from dgt_classifier import DGTAnalyzer  # noqa: E402
+from engine import FiscalEngine  # noqa: E402
+from harness import benchmark, main  # noqa: E402
+from money import CentsEngine  # noqa: E402
+
+# La Cloud Function registra una línea INFO por petición
+logging.disable(logging.INFO)
+
+engine = FiscalEngine()
+SCALAR_PROFILE = (60000, 3810, 0, 5000, 60000, 8000, "Madrid", False)
+
+
+def _bases(n=1000, seed=0):
+    rng = random.Random(seed)
+    return [rng.uniform(0, 300000) for _ in range(n)]
+
+
+# --- Motor ---
+
+@benchmark("engine.progressive_tax.reference")
+def bench_progressive_reference():
+    table = engine.data["irpf_table_estatal"]
+    bases = _bases()
+    return lambda: [engine._calculate_progressive_tax(b, table) for b in bases]
+
+
+@benchmark("engine.progressive_tax.compiled")
+def bench_progressive_compiled():
+    tax = engine._state_table.tax
+    bases = _bases()
+    return lambda: [tax(b) for b in bases]
+
+
+@benchmark("engine.calculate_reta")
+def bench_calculate_reta():
+    yields = [b - 20000 for b in _bases()]
+    return lambda: [engine.calculate_reta(y) for y in yields]
+
+
+@benchmark("engine.run_simulation")
+def bench_run_simulation():
+    return lambda: engine.run_simulation(*SCALAR_PROFILE)
+
+
+@benchmark("engine.simulate")
+def bench_simulate():
+    employee_gross, employee_ss, _, *rest = SCALAR_PROFILE
+    return lambda: engine.simulate(employee_gross, employee_ss, *rest)
+
+
+@benchmark("engine.compare_regions")
+def bench_compare_regions():
+    employee_gross, employee_ss, _, personal, autonomo_gross, autonomo_expenses, _, is_new = SCALAR_PROFILE
+    return lambda: engine.compare_regions(employee_gross, employee_ss, personal, autonomo_gross, autonomo_expenses, is_new)
+
+
+@benchmark("engine.compare_regions.per_region_loop")
+def bench_compare_regions_loop():
+    regions = list(engine.data["irpf_tables_autonomicas"])
+    return lambda: [engine.run_simulation(*SCALAR_PROFILE[:6], region) for region in regions]
+
+
+@benchmark("engine.run_simulation_batch", params=[1000, 100000])
+def bench_run_simulation_batch(n):
+    rng = np.random.default_rng(0)
+    gross = rng.uniform(15000, 200000, n)
+    regions = np.array(list(engine.data["irpf_tables_autonomicas"]), dtype=object)
+    profiles = {
+        "employee_gross": gross,
+        "employee_ss": gross * 0.0635,
+        "autonomo_gross": gross,
+        "autonomo_expenses": rng.uniform(0, 20000, n),
+        "region": rng.choice(regions, n),
+        "is_new_company": rng.random(n) < 0.3,
+    }
+    return lambda: engine.run_simulation_batch(profiles)
+
+
+@benchmark("money.simulate_batch", params=[100000])
+def bench_cents_batch(n):
+    rng = np.random.default_rng(0)
+    gross = np.round(rng.uniform(15000, 200000, n), 2)
+    regions = np.array(list(engine.data["irpf_tables_autonomicas"]), dtype=object)
+    profiles = {
+        "employee_gross": gross,
+        "employee_ss_rate": 0.0635,
+        "autonomo_gross": gross,
+        "autonomo_expenses": np.round(rng.uniform(0, 20000, n), 2),
+        "region": rng.choice(regions, n),
+        "is_new_company": rng.random(n) < 0.3,
+    }
+    cents = CentsEngine(engine)
+    return lambda: cents.simulate_batch(profiles)
+
+
+# --- Clasificador ---
+
+_rules_dir = tempfile.mkdtemp(prefix="fiscal-bench-")
+
+
+def _analyzer(n_rules):
+    path = os.path.join(_rules_dir, f"rules_{n_rules}.json")
+    rules = synthetic_rules(n_rules)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(rules, f)
+    # Sin caché: se mide la clasificación, no los aciertos de la LRU
+    return DGTAnalyzer(rules_path=path, cache=False), rules
+
+
+@benchmark("dgt.process_expenses", params=[(10, 100), (10, 10000), (1000, 100), (1000, 10000)])
+def bench_process_expenses(case):
+    n_rules, n_expenses = case
+    dgt, rules = _analyzer(n_rules)
+    ledger = [{"description": d, "amount": 100.0} for d in synthetic_expenses(rules, n_expenses)]
+    return lambda: dgt.process_expenses(ledger, "6201")
+
+
+@benchmark("dgt.process_expenses.cached", params=[10000])
+def bench_process_expenses_cached(n_expenses):
+    dgt = DGTAnalyzer()
+    ledger = [{"description": d, "amount": 100.0} for d in synthetic_expenses(dgt.rules, n_expenses)]
+    dgt.process_expenses(ledger, "6201")
+    return lambda: dgt.process_expenses(ledger, "6201")
+
+
+# --- Cloud Function ---
+
+class FakeRequest:
+    method = "POST"
+
+    def __init__(self, payload):
+        self._payload = payload
+
+    def get_json(self, silent=False):
+        return self._payload
+
+
+@benchmark("api.fiscal_navigator_api", params=[1, 100])
+def bench_api(n_expenses):
+    cloud_function.get_runtime()
+    descriptions = ["AWS Hosting", "Comida cliente", "Luz oficina", "Material oficina"]
+    request = FakeRequest({
+        "gross_income": 65000,
+        "cnae": "6201",
+        "region": "Madrid",
+        "expenses": [{"description": descriptions[i % 4], "amount": 100} for i in range(n_expenses)],
+    })
+    return lambda: cloud_function.fiscal_navigator_api(request)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
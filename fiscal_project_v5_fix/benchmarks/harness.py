@@ -0,0 +1,148 @@
+"""
+Mini arnés de benchmarks (estilo asv, sin dependencias externas).
+
+Cada caso es una función registrada con @benchmark que prepara sus datos y
+devuelve el callable a medir; con params se registra un caso por valor
+(p.ej. tamaños de lote). El arnés calibra el número de llamadas por medida
+(como timeit.autorange), repite la medida y guarda mínimo, mediana y media por
+llamada en JSON. Comparando la mediana con un baseline guardado marca como
+regresión todo caso que empeore más de `threshold`.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_THRESHOLD = 0.20
+
+_registry = []
+
+
+def benchmark(name, params=None):
+    """Registra un caso. fn(param) -> callable sin argumentos que se mide."""
+    def register(fn):
+        for param in params if params is not None else (None,):
+            case_name = name if param is None else f"{name}[{param}]"
+            _registry.append((case_name, fn, param))
+        return fn
+    return register
+
+
+def _calibrate(fn, min_time):
+    """Número de llamadas por medida para que cada medida dure al menos min_time."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return number
+        number *= 10 if elapsed < min_time / 10 else 2
+
+
+def measure(fn, repeat=5, min_time=0.1):
+    number = _calibrate(fn, min_time)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def run(pattern=None, repeat=5, min_time=0.1, out=sys.stdout):
+    results = {}
+    for name, fn, param in _registry:
+        if pattern and pattern not in name:
+            continue
+        target = fn() if param is None else fn(param)
+        stats = measure(target, repeat, min_time)
+        results[name] = stats
+        print(f"{name:<55} {_format(stats['median']):>10}  (min {_format(stats['min'])})", file=out)
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Casos cuya mediana empeora más de threshold frente al baseline: [(nombre, antes, ahora, ratio)]."""
+    regressions = []
+    for name, stats in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        ratio = stats["median"] / before["median"]
+        if ratio > 1 + threshold:
+            regressions.append((name, before["median"], stats["median"], ratio))
+    return regressions
+
+
+def _format(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e3), ("us", 1e6)):
+        if seconds >= 1 / scale:
+            return f"{seconds * scale:.2f} {unit}"
+    return f"{seconds * 1e9:.0f} ns"
+
+
+def _document(results):
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "machine": platform.node(),
+        "python": platform.python_version(),
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks del simulador fiscal")
+    parser.add_argument("-k", "--filter", help="solo los casos cuyo nombre contiene este texto")
+    parser.add_argument("-o", "--output", help="guarda los resultados en este JSON")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="JSON de referencia para detectar regresiones")
+    parser.add_argument("--save-baseline", action="store_true", help="guarda estos resultados como baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="empeoramiento de la mediana tolerado (0.2 = 20%%)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.1, help="segundos mínimos por medida")
+    args = parser.parse_args(argv)
+
+    results = run(args.filter, args.repeat, args.min_time)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(_document(results), f, indent=2)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)["results"]
+        baseline.update(results)  # con --filter solo se actualizan los casos medidos
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(_document(baseline), f, indent=2)
+        print(f"Baseline guardado en {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"Sin baseline ({args.baseline}); ejecutar con --save-baseline para crearlo")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.threshold)
+    for name, before, now, ratio in regressions:
+        print(f"REGRESIÓN {name}: {_format(before)} -> {_format(now)} (x{ratio:.2f})")
+    if not regressions:
+        print(f"Sin regresiones frente a {args.baseline} (umbral {args.threshold:.0%})")
+    return 1 if regressions else 0
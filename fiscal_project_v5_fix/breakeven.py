@@ -0,0 +1,138 @@
+"""
+Puntos de equilibrio entre Asalariado, Autónomo y SL en función de los ingresos.
+
+Todas las piezas del modelo son lineales a trozos en los ingresos brutos x
+(tramos IRPF y del ahorro, tramos RETA, reducción del 7% con tope, tipo de IS),
+así que los puntos donde cambia la pendiente se calculan analíticamente. Entre
+dos puntos consecutivos cada curva de neto es una recta: se obtiene evaluando el
+motor en dos puntos interiores y los cruces se resuelven de forma exacta.
+"""
+from itertools import combinations
+
+from engine import (
+    DIFFICULT_JUSTIFICATION_CAP, DIFFICULT_JUSTIFICATION_RATE, REGIMES, SS_SOCIETARIO, WORK_INCOME_REDUCTION,
+)
+
+# Tolerancia (en euros) para decidir el signo de una diferencia de netos
+_EPS = 1e-7
+
+
+def breakpoints(engine, region, autonomo_expenses=0.0, employee_ss_rate=0.0635, is_new_company=False):
+    """Ingresos brutos donde alguna de las tres curvas de neto cambia de pendiente o salta."""
+    irpf_limits = set(engine.dataset.state_table.limits()) | set(engine.dataset.regional_table(region).limits())
+    points = set()
+
+    # Asalariado: base = x * (1 - ss) - reducción
+    for base in irpf_limits | {0}:
+        points.add((base + WORK_INCOME_REDUCTION) / (1 - employee_ss_rate))
+
+    # Autónomo: saltos de cuota RETA y, dentro de cada cuota R, z = x - gastos - R
+    cap_yield = DIFFICULT_JUSTIFICATION_CAP / DIFFICULT_JUSTIFICATION_RATE
+    for limit in engine.dataset.reta_table.lowers.tolist() + engine.dataset.reta_table.uppers.tolist():
+        points.add(limit * 12 + autonomo_expenses)
+    z_points = {0, cap_yield}
+    for base in irpf_limits:
+        linear = base / (1 - DIFFICULT_JUSTIFICATION_RATE)
+        z_points.add(linear if linear <= cap_yield else base + DIFFICULT_JUSTIFICATION_CAP)
+    for quota in set(engine.dataset.reta_table.quotas.tolist()):
+        for z in z_points:
+            points.add(z + quota * 12 + autonomo_expenses)
+
+    # SL: beneficio p = x - gastos - SS; dividendo = p * (1 - IS)
+    is_rate = engine.data["is_rates"]["new_entity"] if is_new_company else engine.data["is_rates"]["general"]
+    for dividend in set(engine.dataset.savings_table.limits()) | {0}:
+        points.add(dividend / (1 - is_rate) + autonomo_expenses + SS_SOCIETARIO)
+
+    return sorted(points)
+
+
+def net_income_curves(engine, region="Madrid", autonomo_expenses=0.0, employee_personal_expenses=0.0,
+                      employee_ss_rate=0.0635, is_new_company=False, income_min=0.0, income_max=500000.0):
+    """
+    Curvas de neto por régimen como lista de tramos (x_desde, x_hasta, pendiente, ordenada).
+    x son los ingresos brutos anuales: el salario bruto del asalariado (cotización
+    employee_ss_rate) y la facturación del autónomo/SL (con autonomo_expenses fijos).
+    """
+    cuts = [income_min] + [p for p in breakpoints(engine, region, autonomo_expenses, employee_ss_rate, is_new_company)
+                           if income_min < p < income_max] + [income_max]
+
+    def nets(x):
+        return engine.net_incomes(x, x * employee_ss_rate, employee_personal_expenses,
+                                  x, autonomo_expenses, region, is_new_company)
+
+    curves = {regime: [] for regime in REGIMES}
+    for a, b in zip(cuts, cuts[1:]):
+        if b - a < 1e-6:
+            continue
+        # Dos puntos interiores: evita los saltos que hay justo en los extremos
+        x1, x2 = a + (b - a) / 4, a + 3 * (b - a) / 4
+        for regime, y1, y2 in zip(REGIMES, nets(x1), nets(x2)):
+            slope = (y2 - y1) / (x2 - x1)
+            curves[regime].append((a, b, slope, y1 - slope * x1))
+    return curves
+
+
+def evaluate_curve(segments, x):
+    """Neto de una curva en x (en un salto se toma el tramo de la derecha)."""
+    for a, b, slope, intercept in segments:
+        if a <= x < b or (x == b and (a, b, slope, intercept) == segments[-1]):
+            return slope * x + intercept
+    raise ValueError(f"Income {x} outside the curve range")
+
+
+def _sign(value):
+    return 0 if abs(value) <= _EPS else (1 if value > 0 else -1)
+
+
+def _crossings(first, second, name_first, name_second):
+    """
+    Cruces entre dos curvas definidas sobre los mismos tramos: cambios de signo de la
+    diferencia, también cuando pasa exactamente por 0 en un corte entre tramos.
+    """
+    found = []
+    last = 0       # signo de la última diferencia no nula
+    touch = None   # primer punto con diferencia nula desde entonces
+    for (a, b, m1, c1), (_, _, m2, c2) in zip(first, second):
+        slope, intercept = m1 - m2, c1 - c2
+        for x in (a, b):
+            sign = _sign(slope * x + intercept)
+            if sign == 0:
+                if touch is None:
+                    touch = x
+                continue
+            if last and sign != last:
+                if touch is not None:
+                    found.append((touch, sign))               # pasa por 0 (p.ej. en un corte)
+                elif x == b:
+                    found.append((-intercept / slope, sign))  # cruce dentro del tramo
+                else:
+                    found.append((a, sign))                   # cruce en un salto (cambio de tramo RETA)
+            last, touch = sign, None
+
+    return [{
+        "income": round(float(x), 2),
+        "regimes": (name_first, name_second),
+        "above": name_first if direction > 0 else name_second,
+    } for x, direction in found]
+
+
+def solve_break_even(engine, region="Madrid", autonomo_expenses=0.0, employee_personal_expenses=0.0,
+                     employee_ss_rate=0.0635, is_new_company=False, income_min=0.0, income_max=500000.0):
+    """
+    Ingresos exactos en los que dos regímenes empatan, para una comunidad y un perfil de gastos.
+    Devuelve {"break_even": [...], "curves": {...}}; cada punto indica los dos regímenes y
+    cuál ("above") gana justo por encima de esos ingresos.
+    """
+    curves = net_income_curves(engine, region, autonomo_expenses, employee_personal_expenses,
+                               employee_ss_rate, is_new_company, income_min, income_max)
+    points = []
+    for first, second in combinations(REGIMES, 2):
+        points.extend(_crossings(curves[first], curves[second], first, second))
+    points.sort(key=lambda p: p["income"])
+
+    return {
+        "region": region,
+        "autonomo_expenses": autonomo_expenses,
+        "break_even": points,
+        "curves": curves,
+    }
@@ -0,0 +1,141 @@
+"""
+Calendario mensual de caja por régimen (12 meses del ejercicio).
+
+Los impuestos anuales salen de run_simulation_batch con los totales del año (RETA,
+tramos IRPF, IS y ahorro); aquí se reparten en el mes en que se pagan:
+  - Asalariado: retención mensual proporcional al bruto del mes (sin regularización).
+  - Autónomo: cuota RETA cada mes y modelo 130 (20% del rendimiento neto acumulado
+    menos los pagos anteriores) en abril, julio y octubre.
+  - SL: SS del administrador cada mes y pagos fraccionados de IS (modelo 202 por la
+    base del periodo: 5/7 del tipo, redondeado a la baja) en abril, octubre y diciembre.
+Lo que se liquida después del año (130 del cuarto trimestre y renta; resto del IS,
+dividendo y su retención) va en "pendiente", así que flujo.sum() + pendiente es la
+caja del año completo.
+
+Todo se calcula con arrays (clientes x 12): una cartera entera en una llamada.
+"""
+import numpy as np
+
+from engine import (
+    DIFFICULT_JUSTIFICATION_CAP, DIFFICULT_JUSTIFICATION_RATE, REGIMES, SS_SOCIETARIO, _round_cents,
+)
+
+MONTHS = 12
+MODELO_130_RATE = 0.20
+MODELO_130_MONTHS = (3, 6, 9)  # abril, julio y octubre (índice 0 = enero): acumulado hasta el mes anterior
+IS_INSTALLMENT_MONTHS = (3, 9, 11)  # abril, octubre y diciembre
+IS_INSTALLMENT_FACTOR = 5 / 7
+
+
+def _monthly(values, n=None):
+    """Número, (12,) o (n, 12) -> array (n, 12)."""
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 0:
+        return np.full((n or 1, MONTHS), values / MONTHS)
+    values = np.atleast_2d(values)
+    if values.shape[1] != MONTHS:
+        raise ValueError(f"Monthly series must have {MONTHS} columns, got {values.shape[1]}")
+    return values
+
+
+def _quarterly_130(net_yield):
+    """Pagos del modelo 130 (n, 12) a partir del rendimiento neto mensual (n, 12)."""
+    payments = np.zeros_like(net_yield)
+    paid = np.zeros(len(net_yield))
+    cumulative = np.cumsum(net_yield, axis=1)
+    for month in MODELO_130_MONTHS:
+        cum_yield = cumulative[:, month - 1]
+        reduction = np.minimum(np.maximum(cum_yield, 0) * DIFFICULT_JUSTIFICATION_RATE, DIFFICULT_JUSTIFICATION_CAP)
+        due = np.maximum((cum_yield - reduction) * MODELO_130_RATE - paid, 0)
+        payments[:, month] = due
+        paid += due
+    return payments
+
+
+def _is_installments(profit, is_rate):
+    """Pagos fraccionados de IS (n, 12) por la base acumulada del periodo."""
+    rate = np.floor(is_rate * IS_INSTALLMENT_FACTOR * 100) / 100
+    payments = np.zeros_like(profit)
+    paid = np.zeros(len(profit))
+    cumulative = np.cumsum(profit, axis=1)
+    for month in IS_INSTALLMENT_MONTHS:
+        due = np.maximum(cumulative[:, month - 1] * rate - paid, 0)
+        payments[:, month] = due
+        paid += due
+    return payments
+
+
+def simulate_timeline(engine, income, expenses, employee_income=None, employee_ss_rate=0.0635,
+                      employee_personal_expenses=0, region="Madrid", is_new_company=False, year=None):
+    """
+    Flujo de caja mensual de cada régimen.
+    income / expenses: facturación y gastos del autónomo o la SL, (12,) para un cliente
+    o (n, 12) para una cartera; un número se reparte a partes iguales.
+    employee_income: bruto mensual como asalariado (por defecto, income).
+    region e is_new_company: valor único o uno por cliente.
+    Devuelve por régimen "flujo" e "impuestos" (n, 12), "pendiente" y "neto_caja" (n,);
+    con income (12,) o un número las filas se devuelven sin la dimensión de clientes.
+    """
+    single = np.ndim(income) <= 1
+    income = _monthly(income)
+    n = len(income)
+    expenses = _monthly(expenses, n)
+    employee_income = income if employee_income is None else _monthly(employee_income, n)
+    personal = _monthly(employee_personal_expenses, n)
+    if not (len(expenses) == len(employee_income) == len(personal) == n):
+        raise ValueError("All monthly series must have the same number of clients")
+
+    employee_ss = employee_income * employee_ss_rate
+    is_new_company = np.broadcast_to(np.asarray(is_new_company, dtype=bool), (n,))
+    annual = engine.run_simulation_batch({
+        "employee_gross": employee_income.sum(axis=1),
+        "employee_ss": employee_ss.sum(axis=1),
+        "employee_personal_expenses": personal.sum(axis=1),
+        "autonomo_gross": income.sum(axis=1),
+        "autonomo_expenses": expenses.sum(axis=1),
+        "region": np.broadcast_to(np.asarray(region, dtype=object), (n,)),
+        "is_new_company": is_new_company,
+    }, year=year)
+    engine = engine.for_year(year)
+
+    # 1. Asalariado: retención = IRPF anual en proporción al bruto de cada mes
+    annual_gross = employee_income.sum(axis=1, keepdims=True)
+    share = np.divide(employee_income, annual_gross, out=np.zeros_like(employee_income), where=annual_gross > 0)
+    withholding = annual["asalariado_irpf"][:, None] * share
+    employee_taxes = employee_ss + withholding
+    employee_flow = employee_income - employee_taxes - personal
+    employee_pending = np.zeros(n)
+
+    # 2. Autónomo: RETA mensual (tramo según el rendimiento anual) y modelo 130
+    reta = np.repeat(annual["autonomo_reta"][:, None] / MONTHS, MONTHS, axis=1)
+    payments_130 = _quarterly_130(income - expenses - reta)
+    autonomo_taxes = reta + payments_130
+    autonomo_flow = income - expenses - autonomo_taxes
+    autonomo_pending = payments_130.sum(axis=1) - annual["autonomo_irpf"]  # positivo = devolución
+
+    # 3. SL: la caja del año es la de la sociedad; el dividendo se reparte al cerrar
+    is_rate = np.where(is_new_company, engine.data["is_rates"]["new_entity"], engine.data["is_rates"]["general"])
+    profit = income - expenses - SS_SOCIETARIO / MONTHS
+    installments = _is_installments(profit, is_rate)
+    sl_taxes = SS_SOCIETARIO / MONTHS + installments
+    sl_flow = income - expenses - sl_taxes
+    sl_pending = installments.sum(axis=1) - annual["sl_is"] - annual["sl_dividend_tax"]
+
+    series = {
+        "asalariado": (employee_flow, employee_taxes, employee_pending),
+        "autonomo": (autonomo_flow, autonomo_taxes, autonomo_pending),
+        "sociedad_limitada": (sl_flow, sl_taxes, sl_pending),
+    }
+    result = {}
+    for regime, (flow, taxes, pending) in series.items():
+        flow = _round_cents(flow)
+        pending = _round_cents(pending)
+        columns = {
+            "flujo": flow,
+            "impuestos": _round_cents(taxes),
+            "acumulado": _round_cents(np.cumsum(flow, axis=1)),
+            "pendiente": pending,
+            "neto_caja": _round_cents(flow.sum(axis=1) + pending),
+        }
+        result[regime] = {k: v[0] for k, v in columns.items()} if single else columns
+    return result
@@ -0,0 +1,116 @@
+"""
+Caché LRU de clasificaciones de gastos compartida entre instancias de DGTAnalyzer.
+La clave es (descripción normalizada, CNAE, versión de reglas). Opcionalmente
+persiste en SQLite para que los aciertos sobrevivan a reinicios.
+"""
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAXSIZE = int(os.environ.get("FISCAL_CLASSIFICATION_CACHE_SIZE", "10000"))
+DEFAULT_DB_PATH = os.environ.get("FISCAL_CLASSIFICATION_CACHE_DB") or None
+
+
+def normalize_description(description: str) -> str:
+    """Minúsculas y espacios colapsados: 'AWS  Hosting ' y 'aws hosting' comparten entrada."""
+    return " ".join(description.lower().split())
+
+
+class ClassificationCache:
+    """
+    LRU en memoria acotada a maxsize entradas, con contadores de aciertos,
+    fallos y desalojos. Con path, las clasificaciones se guardan también en SQLite
+    (un commit por lote, ver put_many) y los fallos en memoria se buscan allí antes de reclasificar.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE, path: str = None):
+        self.maxsize = maxsize
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS classifications (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._db.commit()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value FROM classifications WHERE key = ?", (json.dumps(key),)
+                ).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._store(key, value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        self.put_many([(key, value)])
+
+    def put_many(self, items):
+        """Guarda varias clasificaciones (pares (clave, valor)) con un solo commit en SQLite."""
+        items = list(items)
+        if not items:
+            return
+        with self._lock:
+            for key, value in items:
+                self._store(key, value)
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO classifications (key, value) VALUES (?, ?)",
+                    [(json.dumps(key), json.dumps(value, ensure_ascii=False)) for key, value in items],
+                )
+                self._db.commit()
+
+    def _store(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def clear(self):
+        """Vacía la memoria y los contadores (la base de datos en disco se conserva)."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = self.evictions = 0
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+# Caché por defecto, compartida por todos los analizadores del proceso
+shared_cache = ClassificationCache(DEFAULT_MAXSIZE, DEFAULT_DB_PATH)
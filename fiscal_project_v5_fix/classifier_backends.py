@@ -0,0 +1,165 @@
+"""
+Backends de clasificación para DGTAnalyzer.
+Un backend recibe un lote de descripciones (ya normalizadas) y un CNAE y devuelve
+un análisis {"category", "reason", "confidence"} por descripción.
+El backend por defecto son las reglas de rules.json (dgt_classifier.KeywordBackend);
+AsyncLLMBackend agrupa los gastos en prompts por lotes y los envía en paralelo.
+"""
+import asyncio
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import urllib.request
+from typing import Dict, List
+
+VALID_CATEGORIES = ("DEDUCCIÓN_TOTAL", "DEDUCCIÓN_PARCIAL", "DEDUCCIÓN_CONFLICTIVA")
+
+
+class ClassifierBackend:
+    """Interfaz común. name forma parte de la clave de la caché de clasificaciones."""
+
+    name = "base"
+
+    def classify_batch(self, descriptions: List[str], cnae: str) -> List[Dict]:
+        raise NotImplementedError
+
+    async def aclassify_batch(self, descriptions: List[str], cnae: str) -> List[Dict]:
+        return self.classify_batch(descriptions, cnae)
+
+
+class AsyncLLMBackend(ClassifierBackend):
+    """
+    Clasificación con un LLM vía asyncio.
+    - Agrupa las descripciones en prompts de batch_size gastos.
+    - Limita las peticiones en vuelo a max_concurrency con un semáforo del backend:
+      el límite vale para todas las llamadas a la vez, no para cada lote.
+    - Cada petición tiene un timeout; si vence, falla o la respuesta no es válida,
+      ese lote se clasifica con el backend fallback (reglas de rules.json) y el
+      resultado se marca con "fallback": True para no guardarlo en caché.
+    Todas las llamadas se ejecutan en un event loop propio del backend (en un hilo) con
+    su propio pool de hilos para los transportes bloqueantes: un lote que vence su
+    timeout vuelve sin esperar al hilo que sigue colgado.
+    transport: coroutine (descriptions, cnae) -> lista de análisis, p.ej. GeminiTransport.
+    """
+
+    def __init__(self, transport, fallback: ClassifierBackend = None, batch_size: int = 100,
+                 max_concurrency: int = 8, timeout: float = 30.0):
+        self.transport = transport
+        self.fallback = fallback
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.name = "llm:" + getattr(transport, "name", type(transport).__name__)
+        self.requests_sent = 0
+        self.fallbacks = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._loop = None
+        self._executor = None
+        self._loop_lock = threading.Lock()
+
+    def _backend_loop(self):
+        """Event loop del backend (se arranca en un hilo daemon la primera vez)."""
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                # Pool propio: asyncio.to_thread de los transportes usa estos hilos
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                    thread_name_prefix="llm-backend")
+                loop.set_default_executor(self._executor)
+                threading.Thread(target=loop.run_forever, name="llm-backend-loop", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def close(self):
+        """Para el loop del backend sin esperar a las peticiones colgadas."""
+        with self._loop_lock:
+            loop, executor = self._loop, self._executor
+            self._loop = self._executor = None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def classify_batch(self, descriptions: List[str], cnae: str) -> List[Dict]:
+        """
+        Versión síncrona (también desde un hilo con un event loop en marcha, aunque
+        entonces es preferible await aclassify_batch, que no bloquea el loop).
+        """
+        future = asyncio.run_coroutine_threadsafe(self._classify_all(descriptions, cnae), self._backend_loop())
+        return future.result()
+
+    async def aclassify_batch(self, descriptions: List[str], cnae: str) -> List[Dict]:
+        loop = self._backend_loop()
+        if asyncio.get_running_loop() is loop:
+            return await self._classify_all(descriptions, cnae)
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._classify_all(descriptions, cnae), loop))
+
+    async def _classify_all(self, descriptions, cnae):
+        chunks = [descriptions[i:i + self.batch_size] for i in range(0, len(descriptions), self.batch_size)]
+        results = await asyncio.gather(*(self._classify_chunk(chunk, cnae) for chunk in chunks))
+        return [analysis for chunk_result in results for analysis in chunk_result]
+
+    async def _classify_chunk(self, chunk, cnae):
+        async with self._semaphore:
+            self.requests_sent += 1
+            try:
+                analyses = await asyncio.wait_for(self.transport(chunk, cnae), self.timeout)
+                if _valid_response(analyses, len(chunk)):
+                    return analyses
+                logging.warning("LLM response did not match the batch; using keyword rules")
+            except asyncio.TimeoutError:
+                logging.warning(f"LLM batch timed out after {self.timeout}s; using keyword rules")
+            except Exception as e:
+                logging.warning(f"LLM batch failed: {e}; using keyword rules")
+
+        self.fallbacks += 1
+        if self.fallback is None:
+            raise RuntimeError("LLM classification failed and no fallback backend is configured")
+        return [dict(analysis, fallback=True) for analysis in self.fallback.classify_batch(chunk, cnae)]
+
+
+def _valid_response(analyses, expected):
+    return (
+        isinstance(analyses, list)
+        and len(analyses) == expected
+        and all(isinstance(a, dict) and a.get("category") in VALID_CATEGORIES for a in analyses)
+    )
+
+
+class GeminiTransport:
+    """Transporte para la API REST de Gemini (generateContent): un prompt por lote de gastos."""
+
+    name = "gemini"
+    URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={key}"
+
+    def __init__(self, api_key: str, model: str = "gemini-1.5-pro", timeout: float = 30.0):
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout  # de la conexión HTTP: libera el hilo aunque el backend ya no espere
+
+    def build_prompt(self, descriptions: List[str], cnae: str) -> str:
+        items = "\n".join(f"{i}. {d}" for i, d in enumerate(descriptions))
+        return (
+            f"Eres un asesor fiscal español. Para una actividad con CNAE {cnae}, clasifica cada gasto "
+            f"en una de estas categorías: {', '.join(VALID_CATEGORIES)}.\n"
+            "Responde solo con un array JSON, un objeto por gasto y en el mismo orden, con las claves "
+            '"category", "reason" y "confidence" (0-1).\n'
+            f"Gastos:\n{items}"
+        )
+
+    def _post(self, prompt: str) -> List[Dict]:
+        body = json.dumps({
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": {"responseMimeType": "application/json"},
+        }).encode("utf-8")
+        request = urllib.request.Request(
+            self.URL.format(model=self.model, key=self.api_key), data=body,
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            payload = json.loads(response.read().decode("utf-8"))
+        return json.loads(payload["candidates"][0]["content"]["parts"][0]["text"])
+
+    async def __call__(self, descriptions: List[str], cnae: str) -> List[Dict]:
+        # urllib es bloqueante: cada petición va en un hilo para no parar el event loop
+        return await asyncio.to_thread(self._post, self.build_prompt(descriptions, cnae))
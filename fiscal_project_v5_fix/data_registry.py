@@ -0,0 +1,206 @@
+"""
+Registro de datos compartido por todo el proceso.
+Cada fichero JSON (tax_data.json, rules.json...) se lee y se parsea una única vez,
+se congela en estructuras de solo lectura y se entrega la misma instancia a todos
+los llamantes e hilos. Solo se recarga cuando cambia el fichero en disco.
+Los datos fiscales se cargan del snapshot compilado (tax_snapshot.py) si está al día
+con el JSON: sin parsear ni recompilar tablas.
+"""
+import glob
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+
+import tax_snapshot
+from tax_tables import TaxDataset
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_lock = threading.Lock()
+_json_cache = {}     # ruta absoluta -> (firma del fichero, datos congelados)
+_dataset_cache = {}  # ruta absoluta -> (firma del fichero, TaxDataset)
+_memory_datasets = OrderedDict()  # clave de versión -> TaxDataset (datos que no vienen de fichero, p.ej. BigQuery)
+# Versiones en memoria que se conservan (LRU): cada recarga de BigQuery con datos nuevos añade una
+MAX_MEMORY_DATASETS = int(os.environ.get("FISCAL_MAX_MEMORY_DATASETS", "4"))
+_default_store = None  # TaxDataStore con todos los tax_data*.json (ver default_store)
+
+
+def resolve_path(path):
+    """Ruta absoluta; las relativas se resuelven respecto al directorio del proyecto."""
+    return os.path.join(BASE_DIR, path)
+
+
+def freeze(obj):
+    """Copia de solo lectura: dict -> MappingProxyType, list -> tuple."""
+    if isinstance(obj, dict):
+        return MappingProxyType({k: freeze(v) for k, v in obj.items()})
+    if isinstance(obj, list):
+        return tuple(freeze(v) for v in obj)
+    return obj
+
+
+def thaw(obj):
+    """Operación inversa de freeze (p.ej. para serializar con json.dumps)."""
+    if isinstance(obj, MappingProxyType):
+        return {k: thaw(v) for k, v in obj.items()}
+    if isinstance(obj, tuple):
+        return [thaw(v) for v in obj]
+    return obj
+
+
+def _signature(abs_path):
+    stat = os.stat(abs_path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _get_cached(cache, path, load):
+    abs_path = resolve_path(path)
+    signature = _signature(abs_path)
+
+    entry = cache.get(abs_path)
+    if entry is not None and entry[0] == signature:
+        return entry[1]
+
+    with _lock:
+        # Otro hilo puede haberlo cargado mientras esperábamos el lock
+        entry = cache.get(abs_path)
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+
+        value = load(abs_path)
+        cache[abs_path] = (signature, value)
+        return value
+
+
+def _read_json(abs_path):
+    with open(abs_path, 'r', encoding='utf-8') as f:
+        return freeze(json.load(f))
+
+
+def _read_tax_dataset(abs_path):
+    with open(abs_path, 'rb') as f:
+        raw = f.read()
+    snapshot = tax_snapshot.load_snapshot(abs_path, raw)
+    if snapshot is not None:
+        data, compiled = snapshot
+        return TaxDataset(freeze(data), source=abs_path, compiled=compiled)
+    return TaxDataset(freeze(json.loads(raw)), source=abs_path)
+
+
+def load_json(path):
+    """Contenido congelado de un fichero JSON, compartido por todo el proceso."""
+    return _get_cached(_json_cache, path, _read_json)
+
+
+def get_tax_dataset(path="tax_data.json"):
+    """
+    TaxDataset (datos congelados + tablas compiladas) compartido para un fichero de datos fiscales.
+    Usa el snapshot compilado si existe y corresponde al JSON; si no, valida y compila el JSON.
+    """
+    return _get_cached(_dataset_cache, path, _read_tax_dataset)
+
+
+def register_tax_dataset(version, data):
+    """
+    TaxDataset para datos ya cargados en memoria (p.ej. desde BigQuery).
+    version identifica el contenido: la misma versión devuelve la misma instancia mientras
+    siga entre las MAX_MEMORY_DATASETS usadas más recientemente.
+    """
+    with _lock:
+        dataset = _memory_datasets.get(version)
+        if dataset is not None:
+            _memory_datasets.move_to_end(version)
+            return dataset
+
+        dataset = TaxDataset(freeze(data), source=version)
+        _memory_datasets[version] = dataset
+        while len(_memory_datasets) > MAX_MEMORY_DATASETS:
+            _memory_datasets.popitem(last=False)
+        return dataset
+
+
+def clear():
+    """Vacía el registro (tests o recarga forzada)."""
+    global _default_store
+    with _lock:
+        _json_cache.clear()
+        _dataset_cache.clear()
+        _memory_datasets.clear()
+        _default_store = None
+
+
+def _dataset_key(abs_path):
+    """(año, escenario) de un fichero de datos fiscales, sin validar ni compilar sus tablas."""
+    with open(abs_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return data["tax_year"], data.get("scenario", "base")
+
+
+class TaxDataStore:
+    """
+    Varios años/escenarios de datos fiscales a la vez (p.ej. 2025, 2026 y la propuesta 2027).
+    Los ficheros se indexan por (año, escenario) y cada uno se valida y compila solo
+    cuando se pide ese año, a través del registro (una vez por proceso, recarga si cambia):
+    un fichero inválido afecta únicamente a su año.
+    """
+
+    def __init__(self, paths=()):
+        self._paths = {}  # (año, escenario) -> ruta
+        for path in paths:
+            self.add_path(path)
+
+    @classmethod
+    def from_directory(cls, directory=BASE_DIR, pattern="tax_data*.json"):
+        """Los ficheros ilegibles (JSON roto, sin tax_year) se omiten con un aviso."""
+        store = cls()
+        for path in sorted(glob.glob(os.path.join(directory, pattern))):
+            try:
+                store.add_path(path)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logging.warning(f"Skipping tax data file {path}: {e!r}")
+        return store
+
+    def add_path(self, path):
+        key = _dataset_key(resolve_path(path))
+        self._paths[key] = path
+        return key
+
+    def years(self, scenario="base"):
+        return sorted(year for year, s in self._paths if s == scenario)
+
+    def scenarios(self):
+        return sorted({s for _, s in self._paths})
+
+    def resolve_year(self, year=None, scenario="base", carry_forward=False):
+        """
+        Año de datos a usar: el pedido si existe; si no, el último anterior. None = el año
+        más reciente. Un año posterior al más reciente es un KeyError salvo con
+        carry_forward=True (proyecciones: se arrastran las reglas del último año).
+        """
+        years = self.years(scenario)
+        if not years:
+            raise KeyError(f"No tax data for scenario {scenario!r}")
+        if year is None:
+            return years[-1]
+        if year > years[-1] and not carry_forward:
+            raise KeyError(f"No tax data for year {year} (scenario {scenario!r}); latest is {years[-1]}")
+        candidates = [y for y in years if y <= year]
+        if not candidates:
+            raise KeyError(f"No tax data for year {year} (scenario {scenario!r})")
+        return candidates[-1]
+
+    def dataset(self, year=None, scenario="base", carry_forward=False):
+        return get_tax_dataset(self._paths[(self.resolve_year(year, scenario, carry_forward), scenario)])
+
+
+def default_store():
+    """Almacén con todos los tax_data*.json del directorio del proyecto."""
+    global _default_store
+    if _default_store is None:
+        with _lock:
+            if _default_store is None:
+                _default_store = TaxDataStore.from_directory()
+    return _default_store
@@ -1,6 +1,82 @@
+from functools import lru_cache
+from itertools import islice
 from typing import List, Dict
-import random
+import hashlib
 import json
+import os
+import random
+
+import data_registry
+import instrumentation
+from classification_cache import ClassificationCache, normalize_description, shared_cache
+from classifier_backends import ClassifierBackend
+from expense_io import iter_expense_rows
+from keyword_matcher import KeywordMatcher
+from rule_packs import PACKS_DIR, shared_pack_set
+
+# Listas de rules.json en orden de prioridad y el resultado asociado a cada una
+RULE_LISTS = ("deduccion_total_keywords", "deduccion_parcial_keywords", "deduccion_conflictiva_keywords")
+RULE_OUTCOMES = (
+    ("DEDUCCIÓN_TOTAL", "Coincidencia con lista verde (Tecnología/Directo).", 0.95),
+    ("DEDUCCIÓN_PARCIAL", "Coincidencia con lista amarilla (Suministros/Vivienda).", 0.8),
+    ("DEDUCCIÓN_CONFLICTIVA", "Coincidencia con lista roja (Ocio/Personal).", 0.6),
+)
+NO_MATCH_OUTCOME = ("DEDUCCIÓN_PARCIAL", "No encontrado en listas. Revisión manual requerida.", 0.5)
+
+
+@lru_cache(maxsize=32)
+def _compile_keyword_lists(keyword_lists):
+    return KeywordMatcher(keyword_lists)
+
+
+@lru_cache(maxsize=32)
+def _keyword_lists_version(keyword_lists):
+    return hashlib.sha1(json.dumps(keyword_lists, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+def _keyword_lists(rules):
+    return tuple(tuple(rules.get(name, ())) for name in RULE_LISTS)
+
+
+def compile_rules(rules) -> KeywordMatcher:
+    """Compila las listas de reglas en un único autómata (cacheado por contenido)."""
+    return _compile_keyword_lists(_keyword_lists(rules))
+
+
+def rules_version(rules) -> str:
+    """Huella del contenido de las reglas: forma parte de la clave de la caché de clasificaciones."""
+    return _keyword_lists_version(_keyword_lists(rules))
+
+
+class KeywordBackend(ClassifierBackend):
+    """
+    Backend por defecto: las listas de rules.json compiladas en un KeywordMatcher.
+    packs (rule_packs.RulePackSet): autómata por CNAE con las reglas específicas de la actividad.
+    """
+
+    name = "rules"
+
+    def __init__(self, rules, packs=None):
+        self._matcher = compile_rules(rules)
+        self.packs = packs
+
+    def matcher_for(self, cnae: str) -> KeywordMatcher:
+        return self.packs.matcher(cnae) if self.packs is not None else self._matcher
+
+    def classify(self, expense_lower: str, cnae: str) -> Dict:
+        return _classify(self.matcher_for(cnae), expense_lower)
+
+    def classify_batch(self, descriptions: List[str], cnae: str) -> List[Dict]:
+        matcher = self.matcher_for(cnae)
+        return [_classify(matcher, d) for d in descriptions]
+
+
+def _classify(matcher, expense_lower):
+    # Heurística basada en JSON: una sola pasada del autómata, prioridad total > parcial > conflictiva
+    match = matcher.match(expense_lower)
+    category, reason, confidence = RULE_OUTCOMES[match] if match is not None else NO_MATCH_OUTCOME
+    return {"category": category, "reason": reason, "confidence": confidence}
+
 
 class DGTAnalyzer:
     """
@@ -8,12 +84,23 @@ class DGTAnalyzer:
     Uses a (mocked) LLM to analyze expenses based on CNAE and description.
     """
     
-    def __init__(self, api_key: str = None, rules_path: str = "rules.json"):
+    # Tamaño de los grupos en que stream_expenses envía gastos al backend
+    STREAM_CHUNK_SIZE = 1000
+
+    def __init__(self, api_key: str = None, rules_path: str = "rules.json", cache: ClassificationCache = None,
+                 backend: ClassifierBackend = None, rule_packs_dir: str = PACKS_DIR):
+        """
+        rule_packs_dir: directorio de paquetes de reglas por CNAE (ver rule_packs); None los desactiva.
+        cache: caché de clasificaciones; por defecto la compartida del proceso
+        (classification_cache.shared_cache). False desactiva la caché.
+        backend: backend de clasificación (p.ej. classifier_backends.AsyncLLMBackend);
+        por defecto las reglas de rules.json, que también son el fallback del backend LLM.
+        """
         self.api_key = api_key
         # In a real scenario, we would initialize Vertex AI or Gemini client here.
         try:
-            with open(rules_path, 'r', encoding='utf-8') as f:
-                self.rules = json.load(f)
+            # Reglas compartidas (solo lectura) por todos los analizadores del proceso
+            self.rules = data_registry.load_json(rules_path)
         except Exception:
             # Fallback si no encuentra el archivo (para tests rápidos)
             self.rules = {
@@ -21,33 +108,73 @@ class DGTAnalyzer:
                 "deduccion_parcial_keywords": ["luz", "agua", "internet", "casa", "alquiler"],
                 "deduccion_conflictiva_keywords": ["comida", "restaurante", "viaje", "ropa", "traje"]
             }
+
+        packs = shared_pack_set(self.rules, RULE_LISTS, rule_packs_dir) if rule_packs_dir else None
+        if packs is not None and not packs.prefixes:
+            packs = None  # sin paquetes: todas las actividades usan rules.json
+        self.keyword_backend = KeywordBackend(self.rules, packs)
+        self.backend = backend or self.keyword_backend
+        if getattr(self.backend, "fallback", False) is None:
+            self.backend.fallback = self.keyword_backend
+
+        # La clave de caché distingue reglas y backend: un cambio en cualquiera invalida las entradas
+        self.rules_version = packs.version if packs is not None else rules_version(self.rules)
+        self._cache_version = f"{self.backend.name}:{self.rules_version}"
+        self.cache = shared_cache if cache is None else (cache or None)
         
     def _mock_llm_classification(self, expense_desc: str, cnae: str) -> Dict:
         """
         Simula la respuesta de Gemini 1.5 Pro usando reglas cargadas.
         """
-        expense_lower = expense_desc.lower()
-        
-        # Heurística basada en JSON
-        if any(x in expense_lower for x in self.rules["deduccion_total_keywords"]):
-            return {"category": "DEDUCCIÓN_TOTAL", "reason": "Coincidencia con lista verde (Tecnología/Directo).", "confidence": 0.95}
-        
-        elif any(x in expense_lower for x in self.rules["deduccion_parcial_keywords"]):
-            return {"category": "DEDUCCIÓN_PARCIAL", "reason": "Coincidencia con lista amarilla (Suministros/Vivienda).", "confidence": 0.8}
-            
-        elif any(x in expense_lower for x in self.rules["deduccion_conflictiva_keywords"]):
-            return {"category": "DEDUCCIÓN_CONFLICTIVA", "reason": "Coincidencia con lista roja (Ocio/Personal).", "confidence": 0.6}
-            
-        else:
-            return {"category": "DEDUCCIÓN_PARCIAL", "reason": "No encontrado en listas. Revisión manual requerida.", "confidence": 0.5}
+        return self.keyword_backend.classify(expense_desc.lower(), cnae)
+
+    def _lookup(self, descriptions: List[str], cnae: str):
+        """Normaliza y busca en caché. Devuelve (normalizadas, encontradas, pendientes únicas)."""
+        normalized = [normalize_description(d) for d in descriptions]
+        found = {}
+        pending = []
+        # Los ledgers repiten mucho las mismas descripciones: solo se clasifica (LLM) la primera vez
+        for text in dict.fromkeys(normalized):
+            analysis = self.cache.get((text, cnae, self._cache_version)) if self.cache is not None else None
+            if analysis is None:
+                pending.append(text)
+            else:
+                found[text] = analysis
+        instrumentation.count("expenses_classified", len(descriptions))
+        instrumentation.count("classification_cache_hits", len(found))
+        instrumentation.count("classification_cache_misses", len(pending))
+        return normalized, found, pending
+
+    def _store(self, found: Dict, pending: List[str], analyses: List[Dict], cnae: str):
+        found.update(zip(pending, analyses))
+        if self.cache is not None:
+            # Los resultados de fallback (timeout del LLM) no se cachean: se reintentarán
+            self.cache.put_many(((text, cnae, self._cache_version), analysis)
+                                for text, analysis in zip(pending, analyses) if not analysis.get("fallback"))
 
-    def analyze_expense(self, expense: Dict, cnae: str) -> Dict:
+    def classify_descriptions(self, descriptions: List[str], cnae: str) -> List[Dict]:
+        """Clasifica un lote: una sola llamada al backend con las descripciones que no están en caché."""
+        normalized, found, pending = self._lookup(descriptions, cnae)
+        if pending:
+            self._store(found, pending, self.backend.classify_batch(pending, cnae), cnae)
+        return [found[text] for text in normalized]
+
+    async def aclassify_descriptions(self, descriptions: List[str], cnae: str) -> List[Dict]:
+        """Versión asíncrona de classify_descriptions (para usar dentro de un event loop)."""
+        normalized, found, pending = self._lookup(descriptions, cnae)
+        if pending:
+            self._store(found, pending, await self.backend.aclassify_batch(pending, cnae), cnae)
+        return [found[text] for text in normalized]
+
+    def analyze_expense(self, expense: Dict, cnae: str, analysis: Dict = None) -> Dict:
         """
         Analyzes a single expense.
         expense: {"description": "...", "amount": ...}
+        analysis: clasificación ya obtenida en lote (si no, se clasifica aquí).
         """
-        # Call LLM (Mocked)
-        analysis = self._mock_llm_classification(expense["description"], cnae)
+        if analysis is None:
+            # Call LLM (Mocked)
+            analysis = self.classify_descriptions([expense["description"]], cnae)[0]
         
         result = {
             "description": expense["description"],
@@ -69,46 +196,131 @@ class DGTAnalyzer:
         Calcula un 'Score de Riesgo Fiscal' del 1 (Seguro) al 10 (Alto Riesgo).
         Basado en el ratio de gastos Conflictivos/Parciales reclamados.
         """
-        total_claimed = 0
-        risk_weighted_sum = 0
-        
+        totals = RiskAccumulator()
         for exp in analyzed_expenses:
-            amount = exp["amount"]
-            cat = exp["category"]
-            
-            # Si el usuario lo reclama (asumiendo que intenta reclamar logicamente)
-            # Aquí calculamos el riesgo de la estrategia.
-            
-            total_claimed += amount
-            
-            if cat == "DEDUCCIÓN_CONFLICTIVA":
-                risk_weighted_sum += amount * 10 # Alto riesgo
-            elif cat == "DEDUCCIÓN_PARCIAL":
-                risk_weighted_sum += amount * 5 # Riesgo medio
-            else:
-                risk_weighted_sum += amount * 1 # Riesgo bajo
-                
-        if total_claimed == 0:
-            return 1
-            
-        avg_risk = risk_weighted_sum / total_claimed
-        return min(10, max(1, int(avg_risk)))
+            totals.add(exp)
+        return totals.risk_score
 
     def process_expenses(self, expenses: List[Dict], cnae: str) -> Dict:
         """
         Punto de entrada principal para el módulo 2.
         """
-        analyzed = [self.analyze_expense(e, cnae) for e in expenses]
-        risk_score = self.calculate_risk_score(analyzed)
-        
-        total_deductible = sum(e["deductible_amount"] for e in analyzed)
+        analyses = self.classify_descriptions([e["description"] for e in expenses], cnae)
+        return self.summarize(expenses, analyses, cnae)
+
+    async def aprocess_expenses(self, expenses: List[Dict], cnae: str) -> Dict:
+        """Versión asíncrona de process_expenses: los lotes al LLM se envían en paralelo."""
+        analyses = await self.aclassify_descriptions([e["description"] for e in expenses], cnae)
+        return self.summarize(expenses, analyses, cnae)
+
+    def summarize(self, expenses: List[Dict], analyses: List[Dict], cnae: str) -> Dict:
+        """
+        Resultado de process_expenses a partir de clasificaciones ya obtenidas (una por gasto,
+        p.ej. de un classify_descriptions compartido por varias peticiones).
+        """
+        # Una sola pasada: resultado, score y total deducible a la vez
+        totals = RiskAccumulator()
+        analyzed = []
+        for e, analysis in zip(expenses, analyses):
+            result = self.analyze_expense(e, cnae, analysis)
+            totals.add(result)
+            analyzed.append(result)
         
         return {
             "analyzed_expenses": analyzed,
-            "fiscal_risk_score": risk_score,
-            "total_deductible_suggested": total_deductible
+            "fiscal_risk_score": totals.risk_score,
+            "total_deductible_suggested": totals.total_deductible
+        }
+
+    def stream_expenses(self, source, cnae: str, fmt: str = None) -> "ExpenseStream":
+        """
+        Versión en streaming de process_expenses para libros de gastos grandes.
+        source: ruta o fichero CSV/JSONL (ver expense_io.iter_expense_rows).
+        """
+        return ExpenseStream(self, iter_expense_rows(source, fmt), cnae)
+
+
+class RiskAccumulator:
+    """Agregados de calculate_risk_score y del total deducible, en memoria O(1)."""
+
+    # Si el usuario lo reclama (asumiendo que intenta reclamar logicamente)
+    # Aquí calculamos el riesgo de la estrategia.
+    RISK_WEIGHTS = {
+        "DEDUCCIÓN_CONFLICTIVA": 10, # Alto riesgo
+        "DEDUCCIÓN_PARCIAL": 5, # Riesgo medio
+    }
+
+    def __init__(self):
+        self.count = 0
+        self.total_claimed = 0
+        self.risk_weighted_sum = 0
+        self.total_deductible = 0
+
+    def add(self, analyzed_expense: Dict):
+        amount = analyzed_expense["amount"]
+        self.count += 1
+        self.total_claimed += amount
+        self.risk_weighted_sum += amount * self.RISK_WEIGHTS.get(analyzed_expense["category"], 1) # Riesgo bajo por defecto
+        self.total_deductible += analyzed_expense["deductible_amount"]
+
+    @property
+    def risk_score(self) -> int:
+        if self.total_claimed == 0:
+            return 1
+        avg_risk = self.risk_weighted_sum / self.total_claimed
+        return min(10, max(1, int(avg_risk)))
+
+
+class ExpenseStream:
+    """
+    Iterador de gastos clasificados. Mientras se recorre mantiene los agregados, de modo
+    que al terminar fiscal_risk_score y total_deductible_suggested están disponibles
+    sin haber guardado ninguna fila.
+    """
+
+    def __init__(self, analyzer: DGTAnalyzer, expenses, cnae: str):
+        self._analyzer = analyzer
+        self._expenses = expenses
+        self._cnae = cnae
+        self.totals = RiskAccumulator()
+
+    def __iter__(self):
+        # Se clasifica por grupos para que un backend LLM reciba lotes y no gasto a gasto
+        expenses = iter(self._expenses)
+        while True:
+            chunk = list(islice(expenses, self._analyzer.STREAM_CHUNK_SIZE))
+            if not chunk:
+                return
+            analyses = self._analyzer.classify_descriptions([e["description"] for e in chunk], self._cnae)
+            for expense, analysis in zip(chunk, analyses):
+                result = self._analyzer.analyze_expense(expense, self._cnae, analysis)
+                self.totals.add(result)
+                yield result
+
+    @property
+    def fiscal_risk_score(self) -> int:
+        return self.totals.risk_score
+
+    @property
+    def total_deductible_suggested(self):
+        return self.totals.total_deductible
+
+    def summary(self) -> Dict:
+        return {
+            "expenses_processed": self.totals.count,
+            "fiscal_risk_score": self.fiscal_risk_score,
+            "total_deductible_suggested": self.total_deductible_suggested
         }
 
+    def write_jsonl(self, destination) -> Dict:
+        """Escribe cada gasto clasificado como una línea JSON según se procesa y devuelve el resumen."""
+        if isinstance(destination, (str, os.PathLike)):
+            with open(destination, "w", encoding="utf-8") as f:
+                return self.write_jsonl(f)
+        for result in self:
+            destination.write(json.dumps(result, ensure_ascii=False) + "\n")
+        return self.summary()
+
 if __name__ == "__main__":
     dgt = DGTAnalyzer()
     expenses = [
@@ -1,17 +1,248 @@
 import json
-import os
+
+import numpy as np
+
+import data_registry
+from tax_tables import DEFAULT_REGION_TABLE
+
+# Supuestos del modelo (compartidos por la simulación escalar, la de lotes y los solvers)
+WORK_INCOME_REDUCTION = 2000  # Reducción estándar por rendimientos del trabajo
+DIFFICULT_JUSTIFICATION_RATE = 0.07  # Gastos de difícil justificación del autónomo...
+DIFFICULT_JUSTIFICATION_CAP = 2000  # ...con tope anual
+SS_SOCIETARIO = 4500  # Coste fijo anual SS del administrador en la SL
+
+REGIMES = ("asalariado", "autonomo", "sociedad_limitada")
+
+BATCH_OUTPUT_COLUMNS = (
+    "asalariado_neto", "asalariado_irpf",
+    "autonomo_neto", "autonomo_irpf", "autonomo_reta",
+    "sl_neto", "sl_is", "sl_dividend_tax",
+)
+
+
+def _employee_base(employee_gross, employee_ss):
+    """Base Imponible IRPF = Sueldo Base - Cotizaciones Trabajador - 2000 (Reducción standard)."""
+    base = employee_gross - employee_ss - WORK_INCOME_REDUCTION
+    return base if base > 0 else 0
+
+
+def _autonomo_yield(autonomo_gross, autonomo_expenses, reta_annual):
+    """
+    (Rendimiento neto previo, reducción 7%, base imponible) del autónomo.
+    Orden: (Ingresos - Gastos - RETA) = Rendimiento Neto Previo; sobre él la reducción
+    por gastos de difícil justificación (7%, tope 2000).
+    """
+    net_yield_before_reduction = autonomo_gross - autonomo_expenses - reta_annual
+    difficult_justification_expenses = net_yield_before_reduction * DIFFICULT_JUSTIFICATION_RATE
+    if difficult_justification_expenses > DIFFICULT_JUSTIFICATION_CAP:
+        difficult_justification_expenses = DIFFICULT_JUSTIFICATION_CAP
+    base = net_yield_before_reduction - difficult_justification_expenses
+    return net_yield_before_reduction, difficult_justification_expenses, (base if base > 0 else 0)
+
+
+def _sl_profit_base(autonomo_gross, autonomo_expenses, admin_salary_gross=0):
+    """Beneficio = Ingresos - Gastos - SalarioAdmin - SS_Societario."""
+    return autonomo_gross - autonomo_expenses - admin_salary_gross - SS_SOCIETARIO
+
+
+def _round_cents(values):
+    """
+    np.round(values, 2) con el mismo resultado que round(x, 2) de la simulación escalar:
+    np.round escala por 100 y falla algunos empates de medio céntimo (17322.825 -> .82),
+    así que esos pocos valores se redondean uno a uno.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    rounded = np.round(values, 2)
+    scaled = values * 100
+    for i in np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6):
+        rounded.flat[i] = round(float(values.flat[i]), 2)
+    return rounded
+
+
+class SimulationResult:
+    """
+    Resultado compacto de una simulación: entradas, cuotas principales y netos sin
+    redondear, en __slots__ (sin dicts por resultado). El desglose (cuota estatal y
+    autonómica, bases, dividendo...) se recalcula con las tablas del motor la primera
+    vez que se pide y to_dict() devuelve la estructura de siempre de run_simulation.
+    """
+
+    __slots__ = (
+        "_engine", "region", "is_rate",
+        "employee_gross", "employee_ss", "employee_personal_expenses", "autonomo_gross", "autonomo_expenses",
+        "asalariado_irpf", "autonomo_reta", "autonomo_irpf", "sl_is", "sl_dividend_tax",
+        "asalariado_neto", "autonomo_neto", "sl_neto",
+        "_details",
+    )
+
+    def __init__(self, engine, region, is_rate,
+                 employee_gross, employee_ss, employee_personal_expenses, autonomo_gross, autonomo_expenses,
+                 asalariado_irpf, autonomo_reta, autonomo_irpf, sl_is, sl_dividend_tax,
+                 asalariado_neto, autonomo_neto, sl_neto):
+        self._engine = engine
+        self.region = region
+        self.is_rate = is_rate
+        self.employee_gross = employee_gross
+        self.employee_ss = employee_ss
+        self.employee_personal_expenses = employee_personal_expenses
+        self.autonomo_gross = autonomo_gross
+        self.autonomo_expenses = autonomo_expenses
+        self.asalariado_irpf = asalariado_irpf
+        self.autonomo_reta = autonomo_reta
+        self.autonomo_irpf = autonomo_irpf
+        self.sl_is = sl_is
+        self.sl_dividend_tax = sl_dividend_tax
+        self.asalariado_neto = asalariado_neto
+        self.autonomo_neto = autonomo_neto
+        self.sl_neto = sl_neto
+        self._details = None
+
+    @property
+    def tax_year(self):
+        return self._engine.dataset.year
+
+    @property
+    def nets(self):
+        """(asalariado, autónomo, SL) sin redondear."""
+        return self.asalariado_neto, self.autonomo_neto, self.sl_neto
+
+    @property
+    def details(self):
+        """Desglose por régimen (los "details" de run_simulation), calculado una sola vez."""
+        if self._details is None:
+            self._details = self._build_details()
+        return self._details
+
+    def _build_details(self):
+        state_table = self._engine._state_table
+        regional_table = self._engine._regional_table(self.region)
+
+        base_employee = _employee_base(self.employee_gross, self.employee_ss)
+        net_yield_before_reduction, difficult_justification_expenses, base_autonomo = _autonomo_yield(
+            self.autonomo_gross, self.autonomo_expenses, self.autonomo_reta)
+        corporate_profit_base = _sl_profit_base(self.autonomo_gross, self.autonomo_expenses)
+        dividend_gross = corporate_profit_base - self.sl_is
+
+        return {
+            "asalariado": {
+                "bruto": self.employee_gross,
+                "ss_cuota": self.employee_ss,
+                "reduccion_trabajo": WORK_INCOME_REDUCTION,
+                "base_imponible": base_employee,
+                "cuota_estatal": state_table.tax(base_employee),
+                "cuota_autonomica": regional_table.tax(base_employee),
+                "total_irpf": self.asalariado_irpf,
+                "neto_oficial": self.employee_gross - self.employee_ss - self.asalariado_irpf,
+                "gastos_personales_asumidos": self.employee_personal_expenses
+            },
+            "autonomo": {
+                "ingresos": self.autonomo_gross,
+                "gastos": self.autonomo_expenses,
+                "reta_anual": self.autonomo_reta,
+                "rendimiento_neto_previo": net_yield_before_reduction,
+                "reduccion_7_porciento": difficult_justification_expenses,
+                "base_imponible": base_autonomo,
+                "cuota_estatal": state_table.tax(base_autonomo),
+                "cuota_autonomica": regional_table.tax(base_autonomo),
+                "total_irpf": self.autonomo_irpf
+            },
+            "sociedad_limitada": {
+                "ingresos": self.autonomo_gross,
+                "gastos": self.autonomo_expenses,
+                "ss_societario": SS_SOCIETARIO,
+                "base_imponible_is": corporate_profit_base,
+                "tipo_is": self.is_rate,
+                "cuota_is": self.sl_is,
+                "dividendo_bruto": dividend_gross,
+                "retencion_dividendo": self.sl_dividend_tax,
+                "dividendo_neto": dividend_gross - self.sl_dividend_tax
+            }
+        }
+
+    def to_dict(self):
+        """Misma estructura JSON que run_simulation (app_ui.py, main.py)."""
+        details = self.details
+        return {
+            "inputs": {
+                "employee_gross": self.employee_gross,
+                "autonomo_gross": self.autonomo_gross,
+                "region": self.region,
+                "tax_year": self.tax_year
+            },
+            "results": {
+                "asalariado": {
+                    "neto": round(self.asalariado_neto, 2),
+                    "irpf": round(self.asalariado_irpf, 2),
+                    "ss": round(self.employee_ss, 2),
+                    "details": dict(details["asalariado"])
+                },
+                "autonomo": {
+                    "neto": round(self.autonomo_neto, 2),
+                    "irpf": round(self.autonomo_irpf, 2),
+                    "reta": round(self.autonomo_reta, 2),
+                    "details": dict(details["autonomo"])
+                },
+                "sociedad_limitada": {
+                    "neto": round(self.sl_neto, 2),
+                    "is": round(self.sl_is, 2),
+                    "dividend_tax": round(self.sl_dividend_tax, 2),
+                    "ss_societario": SS_SOCIETARIO,
+                    "admin_salary_net": 0,
+                    "details": dict(details["sociedad_limitada"])
+                }
+            }
+        }
+
 
 class FiscalEngine:
-    def __init__(self, data_path="tax_data.json"):
-        # Resolve absolute path relative to this script file
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        abs_data_path = os.path.join(base_dir, data_path)
-        
-        with open(abs_data_path, 'r', encoding='utf-8') as f:
-            self.data = json.load(f)
+    def __init__(self, data_path="tax_data.json", dataset=None, store=None):
+        # El registro resuelve la ruta respecto a este directorio, carga el JSON una sola vez
+        # por proceso (se recarga solo si cambia el fichero) y comparte las tablas compiladas.
+        # dataset permite pasar un TaxDataset ya registrado (p.ej. datos de BigQuery).
+        # store (TaxDataStore) da acceso a otros años/escenarios; por defecto los tax_data*.json del proyecto.
+        self.dataset = dataset if dataset is not None else data_registry.get_tax_dataset(data_path)
+        self.data = self.dataset.data
+        self._store = store
+        self._year_engines = {}
+
+        # Tablas compiladas una sola vez: cuota acumulada por límite para búsqueda binaria
+        # (run_simulation) y cálculo vectorizado (run_simulation_batch)
+        self._state_table = self.dataset.state_table
+        self._regional_tables = self.dataset.regional_tables
+        self._savings_table = self.dataset.savings_table
+        self._reta_table = self.dataset.reta_table
+
+    def _regional_table(self, region):
+        """Tabla autonómica compilada, con fallback a "Otros" si la comunidad no existe."""
+        return self.dataset.regional_table(region)
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = data_registry.default_store()
+        return self._store
+
+    def for_year(self, year=None, scenario="base", carry_forward=False):
+        """
+        Motor para otro año/escenario del almacén (sin recargar nada: datasets y motores se reutilizan).
+        year None, o el año del propio motor en el escenario base, devuelve este mismo motor.
+        Un año posterior a los datos disponibles es un KeyError salvo con carry_forward (ver
+        TaxDataStore.resolve_year); el año aplicado se devuelve como tax_year en los resultados.
+        """
+        if year is None or (year == self.dataset.year and scenario == self.dataset.scenario):
+            return self
+        dataset = self.store.dataset(year, scenario, carry_forward)
+        engine = self._year_engines.get(dataset)
+        if engine is None:
+            engine = FiscalEngine(dataset=dataset, store=self.store)
+            self._year_engines[dataset] = engine
+        return engine
 
     def _calculate_progressive_tax(self, base, table):
-        """Calcula el impuesto basado en una tabla progresiva."""
+        """
+        Calcula el impuesto basado en una tabla progresiva.
+        Implementación de referencia (recorre los tramos): el cálculo usa BracketTable.tax.
+        """
         tax = 0
         remaining_base = base
         previous_limit = 0
@@ -54,42 +285,23 @@ class FiscalEngine:
         if net_taxable_base < 0: net_taxable_base = 0
         
         # 1. State Tax
-        state_tax = self._calculate_progressive_tax(net_taxable_base, self.data["irpf_table_estatal"])
+        state_tax = self._state_table.tax(net_taxable_base)
         
         # 2. Regional Tax
         # Get table for Region, fallback to "Otros" (Generic) if not found
-        regional_table_name = region
-        if regional_table_name not in self.data["irpf_tables_autonomicas"]:
-            regional_table_name = "Otros (Ceuta/Melilla/Resto)"
-            
-        regional_tax = self._calculate_progressive_tax(net_taxable_base, self.data["irpf_tables_autonomicas"][regional_table_name])
+        regional_tax = self._regional_table(region).tax(net_taxable_base)
 
         total_tax = state_tax + regional_tax
         
         return total_tax, ss_employee
 
     def calculate_reta(self, net_yield_estimated):
-        """Calcula la cuota mensual RETA basada en ingresos reales."""
-        # Buscar tramo
-        monthly_yield = net_yield_estimated / 12
-        quota = 0
-        
-        tramos = self.data["reta_2026_provisional"]["tramos"]
-        
-        for tramo in tramos:
-            if tramo["ingresos_min"] <= monthly_yield <= tramo["ingresos_max"]:
-                quota = tramo["cuota"] if isinstance(tramo["cuota"], (int, float)) else 590 # fallback
-                break
-        
-        if quota == 0:
-             # Fallback si supera el rango máximo
-             quota = 590
-
-        return quota * 12
+        """Calcula la cuota RETA anual basada en ingresos reales (tramos ya compilados)."""
+        return self._reta_table.annual_quota(net_yield_estimated)
 
     def calculate_savings_tax(self, amount):
         """Calcula el impuesto sobre el ahorro (Dividendos)."""
-        return self._calculate_progressive_tax(amount, self.data["ahorro_table"])
+        return self._savings_table.tax(amount)
 
     def run_simulation(self, 
                        employee_gross: float, 
@@ -99,175 +311,370 @@ class FiscalEngine:
                        autonomo_gross: float, 
                        autonomo_expenses: float, 
                        region: str = "Madrid", 
-                       is_new_company: bool = False):
+                       is_new_company: bool = False,
+                       year: int = None):
         """
         Compara los 3 regímenes: Asalariado, Autónomo, SL.
+        year: año fiscal a usar (ver for_year); por defecto el del motor.
+        Devuelve el dict anidado con el desglose completo (ver simulate para el resultado compacto).
         """
-        
+        return self.simulate(employee_gross, employee_ss, employee_personal_expenses,
+                             autonomo_gross, autonomo_expenses, region, is_new_company, year).to_dict()
+
+    def simulate(self,
+                 employee_gross: float,
+                 employee_ss: float,
+                 employee_personal_expenses: float,
+                 autonomo_gross: float,
+                 autonomo_expenses: float,
+                 region: str = "Madrid",
+                 is_new_company: bool = False,
+                 year: int = None):
+        """
+        Igual que run_simulation pero devuelve un SimulationResult: solo las cifras
+        principales; el desglose se calcula si se pide (details / to_dict).
+        """
+        engine = self.for_year(year)
+        if engine is not self:
+            return engine.simulate(employee_gross, employee_ss, employee_personal_expenses,
+                                   autonomo_gross, autonomo_expenses, region, is_new_company)
+
+        regional_table = self._regional_table(region)
+
         # 1. Asalariado
         # Neto = Sueldo Base - Cotizaciones Trabajador - IRPF
-        # Base Imponible IRPF = Sueldo Base - Cotizaciones Trabajador - 2000 (Reducción standard)
-        
-        net_taxable_base_employee = employee_gross - employee_ss - 2000
-        if net_taxable_base_employee < 0: net_taxable_base_employee = 0
-        
-        state_tax_employee = self._calculate_progressive_tax(net_taxable_base_employee, self.data["irpf_table_estatal"])
-        
-        regional_tbl = region if region in self.data["irpf_tables_autonomicas"] else "Otros (Ceuta/Melilla/Resto)"
-        regional_tax_employee = self._calculate_progressive_tax(net_taxable_base_employee, self.data["irpf_tables_autonomicas"][regional_tbl])
-        
-        
-        irpf_employee = state_tax_employee + regional_tax_employee
-        net_employee_official = employee_gross - employee_ss - irpf_employee
-        
+        base_employee = _employee_base(employee_gross, employee_ss)
+        irpf_employee = self._state_table.tax(base_employee) + regional_table.tax(base_employee)
         # Apply "Fair Comparison": Subtract expenses that employee pays but cannot deduct
-        net_employee_pocket = net_employee_official - employee_personal_expenses
-        
-        # 2. Autónomo
-        # Base Imponible = Ingresos - Gastos - RETA
-        # RETA se basa en Rendimiento Neto (Ingreso - Gasto)
-        
+        net_employee_pocket = employee_gross - employee_ss - irpf_employee - employee_personal_expenses
+
         # 2. Autónomo
-        # Base Imponible = Ingresos - Gastos - RETA
-        
-        net_yield_pre_reta = autonomo_gross - autonomo_expenses
-        reta_annual = self.calculate_reta(net_yield_pre_reta)
-        
-        # IRPF Autónomo: Misma escala que Empleado (Base General)
-        # 1. Aplicar Gastos de Difícil Justificación (7% del Rendimiento Neto previo, tope 2000€)
-        # Rendimiento previo = Ingresos - Gastos (deductibles) - RETA
-        # NOTA: RETA es gasto deducible. 
-        # La norma suele ser: (Ingresos - Gastos) -> Restar 7% -> Restar RETA? 
-        # NO: RETA es un gasto más para el rendimiento neto.
-        # Orden: (Ingresos - Gastos - RETA) = Rendimiento Neto Previo.
-        # Reducción 7% sobre (Ingresos - Gastos - RETA positives).
-        
-        # Reducción 7% sobre (Ingresos - Gastos - RETA positives).
-        
-        net_yield_before_reduction = net_yield_pre_reta - reta_annual
-        
-        difficult_justification_expenses = net_yield_before_reduction * 0.07
-        if difficult_justification_expenses > 2000:
-            difficult_justification_expenses = 2000
-            
-        base_imponible_autonomo = net_yield_before_reduction - difficult_justification_expenses
-        
-        if base_imponible_autonomo < 0: base_imponible_autonomo = 0
-        
-        state_tax_auto = self._calculate_progressive_tax(base_imponible_autonomo, self.data["irpf_table_estatal"])
-        
-        # Look up regional table again
-        regional_table_name_auto = region
-        if regional_table_name_auto not in self.data["irpf_tables_autonomicas"]:
-             regional_table_name_auto = "Otros (Ceuta/Melilla/Resto)"
-             
-        regional_tax_auto = self._calculate_progressive_tax(base_imponible_autonomo, self.data["irpf_tables_autonomicas"][regional_table_name_auto])
-        
-        irpf_autonomo = state_tax_auto + regional_tax_auto
-        
-        net_autonomo = base_imponible_autonomo - irpf_autonomo
-        
+        # RETA se basa en Rendimiento Neto (Ingreso - Gasto) y es un gasto deducible más
+        reta_annual = self.calculate_reta(autonomo_gross - autonomo_expenses)
+        _, _, base_autonomo = _autonomo_yield(autonomo_gross, autonomo_expenses, reta_annual)
+        irpf_autonomo = self._state_table.tax(base_autonomo) + regional_table.tax(base_autonomo)
+        net_autonomo = base_autonomo - irpf_autonomo
+
         # 3. Sociedad Limitada (SL)
-        # Beneficio = Ingresos - Gastos - SalarioAdmin - SS_Societario
-        # Asumimos coste fijo SS Societario ~ 4500/año
-        
-        ss_societario = 4500
-        
-        # Admin Salary strategy:
-        # Prompt: "Neto = SalarioAdministrador(Neto) + [Beneficio x (1-IS) x (1-Dividendo)]"
-        # We need to decide SalarioAdministrador.
-        # Strategy: Set Salary to 0 to test specific 'Dividend' efficiency?
-        # Or set Salary = 20,000 as base living?
-        # Let's assume Salary = 0 for pure contrast, acknowledging the risk.
-        # Or better, Salary = 25% of Profit?
-        # To make it deterministic for the user prompt which didn't specify:
-        # We will assume Administrator Salary = 0 (Pure Capital gain focus) OR
-        # We will assume a minimal salary.
-        # Let's set admin_salary = 0 for this version, maximizing the IS+Dividend route difference.
-        
-        admin_salary_gross = 0
-        admin_salary_net = 0 # If 0 gross
-        
-        admin_salary_gross = 0
-        admin_salary_net = 0 # If 0 gross
-        
-        corporate_profit_base = autonomo_gross - autonomo_expenses - admin_salary_gross - ss_societario
-        
+        # Salario de administrador = 0 (todo el beneficio sale como dividendo; ver sl_optimizer)
         is_rate = self.data["is_rates"]["new_entity"] if is_new_company else self.data["is_rates"]["general"]
-        
+        corporate_profit_base = _sl_profit_base(autonomo_gross, autonomo_expenses)
         corporate_tax = corporate_profit_base * is_rate
         if corporate_tax < 0: corporate_tax = 0
-        
-        net_profit_available = corporate_profit_base - corporate_tax
-        
-        # Dividends
-        dividend_gross = net_profit_available
+        dividend_gross = corporate_profit_base - corporate_tax
         dividend_tax = self.calculate_savings_tax(dividend_gross)
-        dividend_net = dividend_gross - dividend_tax
-        
-        net_sl = admin_salary_net + dividend_net
-        
-        return {
-            "inputs": {
-                "employee_gross": employee_gross,
-                "autonomo_gross": autonomo_gross,
-                "region": region
-            },
-            "results": {
-                "asalariado": {
-                    "neto": round(net_employee_pocket, 2),
-                    "irpf": round(irpf_employee, 2),
-                    "ss": round(employee_ss, 2),
-                    "details": {
-                        "bruto": employee_gross,
-                        "ss_cuota": employee_ss,
-                        "reduccion_trabajo": 2000,
-                        "base_imponible": net_taxable_base_employee,
-                        "cuota_estatal": state_tax_employee,
-                        "cuota_autonomica": regional_tax_employee,
-                        "total_irpf": irpf_employee,
-                        "neto_oficial": net_employee_official,
-                        "gastos_personales_asumidos": employee_personal_expenses
-                    }
-                },
-                "autonomo": {
-                    "neto": round(net_autonomo, 2),
-                    "irpf": round(irpf_autonomo, 2),
-                    "reta": round(reta_annual, 2),
-                    "details": {
-                        "ingresos": autonomo_gross,
-                        "gastos": autonomo_expenses,
-                        "reta_anual": reta_annual,
-                        "rendimiento_neto_previo": net_yield_before_reduction,
-                        "reduccion_7_porciento": difficult_justification_expenses,
-                        "base_imponible": base_imponible_autonomo,
-                        "cuota_estatal": state_tax_auto,
-                        "cuota_autonomica": regional_tax_auto,
-                        "total_irpf": irpf_autonomo
-                    }
-                },
-                "sociedad_limitada": {
-                    "neto": round(net_sl, 2),
-                    "is": round(corporate_tax, 2),
-                    "dividend_tax": round(dividend_tax, 2),
-                    "ss_societario": ss_societario,
-                    "admin_salary_net": admin_salary_net,
-                    "details": {
-                        "ingresos": autonomo_gross,
-                        "gastos": autonomo_expenses,
-                        "ss_societario": ss_societario,
-                        "base_imponible_is": corporate_profit_base,
-                        "tipo_is": is_rate,
-                        "cuota_is": corporate_tax,
-                        "dividendo_bruto": dividend_gross,
-                        "retencion_dividendo": dividend_tax,
-                        "dividendo_neto": dividend_net
-                    }
-                }
+        net_sl = dividend_gross - dividend_tax
+
+        return SimulationResult(
+            self, region, is_rate,
+            employee_gross, employee_ss, employee_personal_expenses, autonomo_gross, autonomo_expenses,
+            irpf_employee, reta_annual, irpf_autonomo, corporate_tax, dividend_tax,
+            net_employee_pocket, net_autonomo, net_sl,
+        )
+
+    def net_incomes(self,
+                    employee_gross: float,
+                    employee_ss: float,
+                    employee_personal_expenses: float,
+                    autonomo_gross: float,
+                    autonomo_expenses: float,
+                    region: str = "Madrid",
+                    is_new_company: bool = False):
+        """
+        Netos sin redondear (asalariado, autónomo, SL) de run_simulation.
+        Para análisis numéricos (barridos, puntos de equilibrio) donde el redondeo a céntimos molesta.
+        """
+        return self.simulate(employee_gross, employee_ss, employee_personal_expenses,
+                             autonomo_gross, autonomo_expenses, region, is_new_company).nets
+
+    def _reta_array(self, net_yield_estimated):
+        """Versión vectorizada de calculate_reta (cuota anual)."""
+        return self._reta_table.annual_quota_array(net_yield_estimated)
+
+    def _regional_tax_array(self, bases, regions):
+        """Cuota autonómica agrupando las filas por comunidad."""
+        regions = np.asarray(regions)
+        if regions.ndim == 0:
+            regions = np.full(len(bases), regions.item(), dtype=object)
+
+        tax = np.zeros(len(bases), dtype=np.float64)
+        unique_regions, inverse = np.unique(regions.astype(str), return_inverse=True)
+        for k, name in enumerate(unique_regions):
+            table = self._regional_table(name)
+            mask = inverse == k
+            tax[mask] = table.tax_array(bases[mask])
+        return tax
+
+    def run_simulation_batch(self, profiles, year: int = None):
+        """
+        Versión columnar de run_simulation para lotes grandes (nóminas completas).
+        profiles: pandas.DataFrame o dict de arrays con las columnas
+        employee_gross, employee_ss, autonomo_gross, autonomo_expenses y,
+        opcionalmente, region (Madrid), is_new_company (False),
+        employee_personal_expenses (0) y year (año fiscal de cada fila).
+        year: año fiscal para todo el lote (si no hay columna year).
+        Devuelve las columnas de BATCH_OUTPUT_COLUMNS (DataFrame si la entrada lo es).
+        """
+        columns = {name: np.asarray(profiles[name]) for name in profiles}
+
+        if "year" in columns and year is None:
+            # Filas de varios años: cada grupo con las tablas de su año
+            years = columns.pop("year")
+            result = {name: np.zeros(len(years)) for name in BATCH_OUTPUT_COLUMNS}
+            for y in np.unique(years):
+                rows = np.flatnonzero(years == y)
+                part = self.for_year(int(y))._simulate_columns({k: v[rows] for k, v in columns.items()})
+                for name in BATCH_OUTPUT_COLUMNS:
+                    result[name][rows] = part[name]
+        else:
+            columns.pop("year", None)
+            result = self.for_year(year)._simulate_columns(columns)
+
+        if hasattr(profiles, "index") and hasattr(profiles, "columns"):
+            import pandas as pd
+            return pd.DataFrame(result, index=profiles.index)
+        return result
+
+    def _regionless_columns(self, profiles):
+        """
+        Parte de run_simulation_batch que no depende de la comunidad: bases, cuota
+        estatal, RETA y SL. Devuelve (columnas de entrada, resultados intermedios).
+        """
+        def column(name, default=None):
+            if name in profiles:
+                return np.asarray(profiles[name])
+            if default is None:
+                raise KeyError(f"Missing column: {name}")
+            return default
+
+        employee_gross = column("employee_gross").astype(np.float64)
+        n = len(employee_gross)
+        inputs = {
+            "employee_gross": employee_gross,
+            "employee_ss": column("employee_ss").astype(np.float64),
+            "autonomo_gross": column("autonomo_gross").astype(np.float64),
+            "autonomo_expenses": column("autonomo_expenses").astype(np.float64),
+            "region": column("region", np.full(n, "Madrid", dtype=object)),
+            "is_new_company": column("is_new_company", np.zeros(n, dtype=bool)).astype(bool),
+            "employee_personal_expenses": column("employee_personal_expenses", np.zeros(n)).astype(np.float64),
+        }
+
+        # 1. Asalariado
+        base_employee = np.maximum(inputs["employee_gross"] - inputs["employee_ss"] - WORK_INCOME_REDUCTION, 0)
+
+        # 2. Autónomo
+        net_yield_pre_reta = inputs["autonomo_gross"] - inputs["autonomo_expenses"]
+        reta_annual = self._reta_array(net_yield_pre_reta)
+        net_yield_before_reduction = net_yield_pre_reta - reta_annual
+        difficult_justification_expenses = np.minimum(
+            net_yield_before_reduction * DIFFICULT_JUSTIFICATION_RATE, DIFFICULT_JUSTIFICATION_CAP
+        )
+        base_autonomo = np.maximum(net_yield_before_reduction - difficult_justification_expenses, 0)
+
+        # 3. Sociedad Limitada (mismas hipótesis que run_simulation: salario admin 0, SS societario fijo)
+        corporate_profit_base = inputs["autonomo_gross"] - inputs["autonomo_expenses"] - SS_SOCIETARIO
+        is_rate = np.where(inputs["is_new_company"], self.data["is_rates"]["new_entity"],
+                           self.data["is_rates"]["general"])
+        corporate_tax = np.maximum(corporate_profit_base * is_rate, 0)
+        net_profit_available = corporate_profit_base - corporate_tax
+        dividend_tax = self._savings_table.tax_array(net_profit_available)
+
+        parts = {
+            "base_employee": base_employee,
+            "state_employee": self._state_table.tax_array(base_employee),
+            "base_autonomo": base_autonomo,
+            "state_autonomo": self._state_table.tax_array(base_autonomo),
+            "reta_annual": reta_annual,
+            "net_sl": net_profit_available - dividend_tax,
+            "corporate_tax": corporate_tax,
+            "dividend_tax": dividend_tax,
+        }
+        return inputs, parts
+
+    def simulate_batch(self, profiles, year: int = None):
+        """
+        Como run_simulation_batch (mismas columnas de entrada, incluida year), pero devuelve
+        un SimulationResult por fila: las mismas cifras que simulate, calculadas con el camino
+        vectorizado, y to_dict() con la estructura de run_simulation.
+        """
+        columns = {name: np.asarray(profiles[name]) for name in profiles}
+        years = columns.pop("year", None)
+        if years is None or year is not None:
+            return self.for_year(year)._simulation_results(columns)
+
+        results = [None] * len(years)
+        for y in np.unique(years):
+            rows = np.flatnonzero(years == y)
+            part = self.for_year(int(y))._simulation_results({k: v[rows] for k, v in columns.items()})
+            for i, result in zip(rows.tolist(), part):
+                results[i] = result
+        return results
+
+    def _simulation_results(self, profiles):
+        inputs, values = self._unrounded_columns(profiles)
+        is_rate = np.where(inputs["is_new_company"], self.data["is_rates"]["new_entity"],
+                           self.data["is_rates"]["general"])
+        rows = zip(
+            inputs["region"].tolist(), is_rate.tolist(),
+            *(inputs[name].tolist() for name in ("employee_gross", "employee_ss", "employee_personal_expenses",
+                                                 "autonomo_gross", "autonomo_expenses")),
+            *(values[name].tolist() for name in ("asalariado_irpf", "autonomo_reta", "autonomo_irpf", "sl_is",
+                                                 "sl_dividend_tax", "asalariado_neto", "autonomo_neto", "sl_neto")),
+        )
+        return [SimulationResult(self, *row) for row in rows]
+
+    def _simulate_columns(self, profiles):
+        _, values = self._unrounded_columns(profiles)
+        return {name: _round_cents(v) for name, v in values.items()}
+
+    def _unrounded_columns(self, profiles):
+        inputs, parts = self._regionless_columns(profiles)
+        region = inputs["region"]
+
+        irpf_employee = parts["state_employee"] + self._regional_tax_array(parts["base_employee"], region)
+        net_employee_pocket = (inputs["employee_gross"] - inputs["employee_ss"] - irpf_employee
+                               - inputs["employee_personal_expenses"])
+        irpf_autonomo = parts["state_autonomo"] + self._regional_tax_array(parts["base_autonomo"], region)
+        net_autonomo = parts["base_autonomo"] - irpf_autonomo
+
+        values = (
+            net_employee_pocket, irpf_employee,
+            net_autonomo, irpf_autonomo, parts["reta_annual"],
+            parts["net_sl"], parts["corporate_tax"], parts["dividend_tax"],
+        )
+        return inputs, dict(zip(BATCH_OUTPUT_COLUMNS, values))
+
+    def compare_regions_batch(self, profiles, year: int = None):
+        """
+        run_simulation_batch en todas las comunidades de irpf_tables_autonomicas a la vez.
+        profiles: las columnas de run_simulation_batch (region, si viene, se ignora).
+        Lo que no depende de la comunidad se calcula una vez por fila y la escala
+        autonómica se evalúa como una matriz filas x comunidades.
+        Devuelve "regions" (orden de las columnas) y las columnas de BATCH_OUTPUT_COLUMNS
+        como arrays (filas, comunidades); la columna r coincide con run_simulation_batch
+        con region = regions[r].
+        """
+        engine = self.for_year(year)
+        inputs, parts = engine._regionless_columns(profiles)
+        matrix = engine.dataset.regional_matrix
+        n, n_regions = len(inputs["region"]), len(matrix.regions)
+
+        irpf_employee = parts["state_employee"][:, None] + matrix.tax_matrix(parts["base_employee"])
+        net_employee_pocket = ((inputs["employee_gross"] - inputs["employee_ss"])[:, None] - irpf_employee
+                               - inputs["employee_personal_expenses"][:, None])
+        irpf_autonomo = parts["state_autonomo"][:, None] + matrix.tax_matrix(parts["base_autonomo"])
+        net_autonomo = parts["base_autonomo"][:, None] - irpf_autonomo
+
+        values = (
+            net_employee_pocket, irpf_employee,
+            net_autonomo, irpf_autonomo, parts["reta_annual"],
+            parts["net_sl"], parts["corporate_tax"], parts["dividend_tax"],
+        )
+        result = {"regions": matrix.regions}
+        for name, v in zip(BATCH_OUTPUT_COLUMNS, values):
+            # Las columnas que no dependen de la comunidad se repiten (vista, sin copia)
+            result[name] = _round_cents(v) if v.ndim == 2 else np.broadcast_to(_round_cents(v)[:, None], (n, n_regions))
+        return result
+
+    def compare_regions(self,
+                        employee_gross: float,
+                        employee_ss: float,
+                        employee_personal_expenses: float,
+                        autonomo_gross: float,
+                        autonomo_expenses: float,
+                        is_new_company: bool = False,
+                        year: int = None):
+        """
+        Neto de los tres regímenes en cada comunidad de irpf_tables_autonomicas en una
+        sola llamada (mismas cifras que run_simulation comunidad a comunidad): la cuota
+        estatal, la RETA y la SL se calculan una vez y solo se recorre la escala
+        autonómica de cada comunidad.
+        Devuelve {"regions": {comunidad: {régimen: neto}}, "best": {régimen: comunidad}};
+        en "best" el empate (p.ej. la SL, que no depende de la comunidad) se queda con la primera.
+        """
+        engine = self.for_year(year)
+        if engine is not self:
+            return engine.compare_regions(employee_gross, employee_ss, employee_personal_expenses,
+                                          autonomo_gross, autonomo_expenses, is_new_company)
+
+        regional_tables = self._regional_tables
+
+        base_employee = _employee_base(employee_gross, employee_ss)
+        state_employee = self._state_table.tax(base_employee)
+        reta_annual = self.calculate_reta(autonomo_gross - autonomo_expenses)
+        _, _, base_autonomo = _autonomo_yield(autonomo_gross, autonomo_expenses, reta_annual)
+        state_autonomo = self._state_table.tax(base_autonomo)
+
+        is_rate = self.data["is_rates"]["new_entity"] if is_new_company else self.data["is_rates"]["general"]
+        corporate_profit_base = _sl_profit_base(autonomo_gross, autonomo_expenses)
+        corporate_tax = corporate_profit_base * is_rate
+        if corporate_tax < 0: corporate_tax = 0
+        dividend_gross = corporate_profit_base - corporate_tax
+        net_sl = round(dividend_gross - self.calculate_savings_tax(dividend_gross), 2)
+
+        regions = {}
+        for region, table in regional_tables.items():
+            irpf_employee = state_employee + table.tax(base_employee)
+            irpf_autonomo = state_autonomo + table.tax(base_autonomo)
+            regions[region] = {
+                "asalariado": round(employee_gross - employee_ss - irpf_employee - employee_personal_expenses, 2),
+                "autonomo": round(base_autonomo - irpf_autonomo, 2),
+                "sociedad_limitada": net_sl,
             }
+        return {
+            "tax_year": self.dataset.year,
+            "regions": regions,
+            "best": {regime: max(regions, key=lambda r: regions[r][regime]) for regime in REGIMES},
+        }
+
+    def run_projection(self,
+                       years,
+                       employee_gross,
+                       employee_ss,
+                       autonomo_gross,
+                       autonomo_expenses,
+                       region: str = "Madrid",
+                       new_company_years: int = 0,
+                       employee_personal_expenses=0,
+                       scenario: str = "base"):
+        """
+        Proyección plurianual en una sola llamada, con las tablas de cada año del almacén
+        (los años sin datos usan las del último disponible; ver "tax_year" en by_year).
+        Los importes pueden ser un número (igual todos los años) o una lista por año.
+        new_company_years: primeros ejercicios con el tipo de IS de entidad de nueva creación
+        (p.ej. 3 -> 15% los tres primeros años y tipo general después).
+        """
+        def for_index(value, i):
+            return value[i] if isinstance(value, (list, tuple, np.ndarray)) else value
+
+        by_year = []
+        totals = {"asalariado": 0, "autonomo": 0, "sociedad_limitada": 0}
+        for i, year in enumerate(years):
+            engine = self.for_year(year, scenario, carry_forward=True)
+            results = engine.run_simulation(
+                employee_gross=for_index(employee_gross, i),
+                employee_ss=for_index(employee_ss, i),
+                company_ss=0,
+                employee_personal_expenses=for_index(employee_personal_expenses, i),
+                autonomo_gross=for_index(autonomo_gross, i),
+                autonomo_expenses=for_index(autonomo_expenses, i),
+                region=region,
+                is_new_company=i < new_company_years
+            )["results"]
+            by_year.append({"year": year, "tax_year": engine.dataset.year, "results": results})
+            for regime in totals:
+                totals[regime] += results[regime]["neto"]
+
+        return {
+            "years": list(years),
+            "by_year": by_year,
+            "totals": {regime: round(total, 2) for regime, total in totals.items()}
         }
 
 if __name__ == "__main__":
     # Quick Test
     engine = FiscalEngine()
-    print(json.dumps(engine.run_simulation(60000, 5000), indent=2))
+    print(json.dumps(engine.run_simulation(
+        employee_gross=60000, employee_ss=60000 * 0.0635, company_ss=0, employee_personal_expenses=0,
+        autonomo_gross=60000, autonomo_expenses=5000,
+    ), indent=2))
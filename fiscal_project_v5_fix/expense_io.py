@@ -0,0 +1,66 @@
+"""
+Lectura en streaming de libros de gastos (CSV o JSONL) sin cargarlos enteros en memoria.
+"""
+import csv
+import io
+import json
+import os
+
+
+def detect_format(source, fmt=None):
+    """'csv' o 'jsonl' a partir de fmt explícito o de la extensión del fichero."""
+    if fmt:
+        return fmt.lower()
+    name = source if isinstance(source, (str, os.PathLike)) else getattr(source, "name", "")
+    extension = os.path.splitext(str(name))[1].lower()
+    if extension in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    return "csv"
+
+
+def parse_amount(value):
+    """Importe como float; acepta también el formato español '1.234,56'."""
+    if isinstance(value, (int, float)):
+        return value
+    text = str(value).strip()
+    try:
+        return float(text)
+    except ValueError:
+        return float(text.replace(".", "").replace(",", "."))
+
+
+def _text_stream(source):
+    """Fichero de texto abierto a partir de una ruta o de un objeto fichero (texto o binario)."""
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, "r", encoding="utf-8", newline=""), "owned"
+    if isinstance(source, (io.RawIOBase, io.BufferedIOBase)) or "b" in getattr(source, "mode", ""):
+        return io.TextIOWrapper(source, encoding="utf-8", newline=""), "wrapped"
+    return source, None
+
+
+def iter_expense_rows(source, fmt=None):
+    """
+    Genera los gastos {"description": ..., "amount": ...} de uno en uno.
+    source: ruta o fichero (CSV con cabecera description,amount o JSONL con un objeto por línea).
+    """
+    fmt = detect_format(source, fmt)
+    stream, ownership = _text_stream(source)
+    try:
+        if fmt == "csv":
+            for row in csv.DictReader(stream):
+                yield {"description": row["description"], "amount": parse_amount(row["amount"])}
+        elif fmt == "jsonl":
+            for line in stream:
+                line = line.strip()
+                if not line:
+                    continue
+                row = json.loads(line)
+                yield {"description": row["description"], "amount": parse_amount(row["amount"])}
+        else:
+            raise ValueError(f"Unsupported expense format: {fmt}")
+    finally:
+        if ownership == "owned":
+            stream.close()
+        elif ownership == "wrapped":
+            # El fichero binario es del llamante: no cerrarlo al liberar el wrapper
+            stream.detach()
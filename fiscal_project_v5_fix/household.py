@@ -0,0 +1,158 @@
+"""
+Simulación de un hogar: qué combinación de regímenes (asalariado / autónomo / SL)
+da más neto a la unidad familiar.
+
+Cada miembro se evalúa una vez en los tres regímenes (una sola llamada a
+run_simulation_batch con N filas: N x 3 resultados) y las 3^N combinaciones se
+forman con numpy a partir de esa matriz, sin volver a simular a nadie.
+
+Con joint_filing también se calcula la tributación conjunta de cada combinación:
+se suman las bases generales (trabajo y actividad) y las del ahorro (dividendos de
+la SL) de los miembros, se aplica la reducción por tributación conjunta (primero a
+la base general y el resto a la del ahorro) y se recalcula el IRPF del hogar con
+tax_array sobre todas las combinaciones a la vez. La Seguridad Social, la RETA y
+el IS no cambian con la forma de declarar.
+"""
+from itertools import product
+
+import numpy as np
+
+from engine import REGIMES, WORK_INCOME_REDUCTION
+
+NET_COLUMNS = ("asalariado_neto", "autonomo_neto", "sl_neto")
+
+JOINT_FILING_REDUCTION = 3400  # Reducción por tributación conjunta (unidad familiar biparental)
+DEFAULT_EMPLOYEE_SS_RATE = 0.0635
+MAX_MEMBERS = 10  # 3^10 = 59.049 combinaciones
+
+
+def _member_columns(members, region):
+    """Columnas de run_simulation_batch: la misma facturación como sueldo, autónomo o SL."""
+    gross = np.array([float(m["gross"]) for m in members])
+    return {
+        "employee_gross": gross,
+        "employee_ss": np.array([
+            float(m["employee_ss"]) if m.get("employee_ss") is not None else m["gross"] * DEFAULT_EMPLOYEE_SS_RATE
+            for m in members
+        ]),
+        "employee_personal_expenses": np.array([float(m.get("employee_personal_expenses", 0)) for m in members]),
+        "autonomo_gross": gross,
+        "autonomo_expenses": np.array([float(m.get("expenses", 0)) for m in members]),
+        "region": np.full(len(members), region, dtype=object),
+        "is_new_company": np.array([bool(m.get("is_new_company", False)) for m in members]),
+    }
+
+
+def _allowed_mask(members):
+    """(N, 3): regímenes permitidos a cada miembro (clave "regimes"; por defecto los tres)."""
+    mask = np.ones((len(members), len(REGIMES)), dtype=bool)
+    for i, member in enumerate(members):
+        allowed = member.get("regimes")
+        if allowed is not None:
+            unknown = set(allowed) - set(REGIMES)
+            if unknown:
+                raise ValueError(f"Unknown regimes for member {i}: {sorted(unknown)}")
+            mask[i] = [regime in allowed for regime in REGIMES]
+    return mask
+
+
+def member_results(engine, members, region="Madrid", year=None):
+    """
+    Matrices (N, 3) por miembro y régimen (columnas en el orden de REGIMES):
+    neto (individual), base general, base del ahorro y neto antes de IRPF.
+    """
+    columns = _member_columns(members, region)
+    batch = engine.run_simulation_batch(columns, year=year)
+    net = np.column_stack([batch[name] for name in NET_COLUMNS])
+
+    employee_base = np.maximum(columns["employee_gross"] - columns["employee_ss"] - WORK_INCOME_REDUCTION, 0)
+    autonomo_base = batch["autonomo_neto"] + batch["autonomo_irpf"]
+    dividend = batch["sl_neto"] + batch["sl_dividend_tax"]
+    zeros = np.zeros(len(members))
+
+    general_base = np.column_stack([employee_base, autonomo_base, zeros])
+    savings_base = np.column_stack([zeros, zeros, np.maximum(dividend, 0)])
+    # El IRPF de cada régimen se resta del neto; sin él queda lo que no depende de cómo se declare
+    irpf = np.column_stack([batch["asalariado_irpf"], batch["autonomo_irpf"], batch["sl_dividend_tax"]])
+    return {
+        "net": net,
+        "general_base": general_base,
+        "savings_base": savings_base,
+        "pre_irpf": net + irpf,
+    }
+
+
+def _joint_irpf(engine, region, general, savings):
+    """IRPF de la declaración conjunta para arrays de bases del hogar."""
+    general_reduction = np.minimum(general, JOINT_FILING_REDUCTION)
+    savings_reduction = np.minimum(savings, JOINT_FILING_REDUCTION - general_reduction)
+    general = general - general_reduction
+    savings = savings - savings_reduction
+    regional = engine.dataset.regional_table(region)
+    return (engine.dataset.state_table.tax_array(general) + regional.tax_array(general)
+            + engine.dataset.savings_table.tax_array(savings))
+
+
+def simulate_household(engine, members, region="Madrid", joint_filing=False, year=None, top=None):
+    """
+    Todas las combinaciones de regímenes de un hogar.
+    members: lista de dicts con gross (facturación o sueldo bruto) y, opcionalmente,
+    name, expenses (gastos de la actividad), employee_ss (por defecto 6,35% del bruto),
+    employee_personal_expenses, is_new_company y regimes (regímenes posibles).
+    Devuelve los netos por miembro, la mejor combinación y las combinaciones
+    ordenadas de mayor a menor neto (las `top` primeras si se indica).
+    """
+    if not members:
+        raise ValueError("A household needs at least one member")
+    if len(members) > MAX_MEMBERS:
+        raise ValueError(f"At most {MAX_MEMBERS} members ({len(REGIMES)}^n combinations)")
+
+    engine = engine.for_year(year)
+    results = member_results(engine, members, region)
+    n = len(members)
+
+    # (3^n, n): régimen de cada miembro en cada combinación
+    combos = np.array(list(product(range(len(REGIMES)), repeat=n)), dtype=np.intp)
+    combos = combos[_allowed_mask(members)[np.arange(n), combos].all(axis=1)]
+    if len(combos) == 0:
+        raise ValueError("No regime combination is allowed for every member")
+
+    def total(matrix):
+        return matrix[np.arange(n), combos].sum(axis=1)
+
+    individual = total(results["net"])
+    best_net = individual
+    if joint_filing:
+        joint = total(results["pre_irpf"]) - _joint_irpf(
+            engine, region, total(results["general_base"]), total(results["savings_base"]))
+        joint = np.round(joint, 2)
+        best_net = np.maximum(individual, joint)
+
+    # Orden estable: a igual neto, la combinación que aparece antes en product()
+    order = np.argsort(-best_net, kind="stable")
+    if top is not None:
+        order = order[:top]
+
+    names = [m.get("name", f"miembro_{i + 1}") for i, m in enumerate(members)]
+    combinations = []
+    for k in order:
+        entry = {
+            "regimes": dict(zip(names, (REGIMES[r] for r in combos[k]))),
+            "neto_individual": round(float(individual[k]), 2),
+        }
+        if joint_filing:
+            entry["neto_conjunta"] = round(float(joint[k]), 2)
+            entry["declaracion"] = "conjunta" if joint[k] > individual[k] else "individual"
+        entry["neto"] = round(float(best_net[k]), 2)
+        combinations.append(entry)
+
+    return {
+        "tax_year": engine.dataset.year,
+        "members": {
+            name: dict(zip(REGIMES, (round(float(v), 2) for v in row)))
+            for name, row in zip(names, results["net"])
+        },
+        "evaluations": n * len(REGIMES),
+        "best": combinations[0],
+        "combinations": combinations,
+    }
@@ -0,0 +1,259 @@
+"""
+Instrumentación opcional del camino caliente (Cloud Function, motor y clasificador).
+
+Desactivada por defecto: stage() devuelve un context manager vacío compartido y
+count() retorna tras comprobar un flag, así que el coste en producción es mínimo.
+Con FISCAL_INSTRUMENTATION=1 (o enable()) cada petición abre una traza que acumula
+tiempos por etapa (ms) y contadores; al cerrarla se emite una línea de log JSON y
+las etapas se agregan en histogramas del proceso (metrics_text() para /metrics).
+FISCAL_SERVER_TIMING=1 añade además la cabecera Server-Timing a la respuesta.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+ENABLED = os.environ.get("FISCAL_INSTRUMENTATION", "0") == "1"
+SERVER_TIMING = os.environ.get("FISCAL_SERVER_TIMING", "0") == "1"
+
+# Límites superiores de los buckets de los histogramas (ms)
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_current = ContextVar("fiscal_trace", default=None)
+
+
+def enable(server_timing=None):
+    global ENABLED, SERVER_TIMING
+    ENABLED = True
+    if server_timing is not None:
+        SERVER_TIMING = server_timing
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+class _NullContext:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullContext()
+
+
+class _Stage:
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed_ms = (time.perf_counter() - self.start) * 1000
+        stages = self.trace.stages
+        stages[self.name] = stages.get(self.name, 0.0) + elapsed_ms
+        return False
+
+
+class Trace:
+    """Tiempos por etapa y contadores de una petición."""
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = {}
+        self.counters = {}
+        self.start = time.perf_counter()
+        self.total_ms = None
+        self._token = None
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def server_timing(self):
+        """Valor de la cabecera Server-Timing (etapas y total en ms)."""
+        parts = [f"{name};dur={ms:.2f}" for name, ms in self.stages.items()]
+        parts.append(f"total;dur={self._elapsed_ms():.2f}")
+        return ", ".join(parts)
+
+    def record(self):
+        return {
+            "event": self.name,
+            "total_ms": round(self._elapsed_ms(), 3),
+            "stages_ms": {name: round(ms, 3) for name, ms in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+
+    def _elapsed_ms(self):
+        return self.total_ms if self.total_ms is not None else (time.perf_counter() - self.start) * 1000
+
+    def activate(self):
+        """
+        Traza en curso durante un bloque, sin cerrarla. Para respuestas en streaming:
+        el generador la reactiva en cada paso en vez de dejarla fijada entre yields.
+        """
+        return _Activation(self)
+
+    def finish(self):
+        """Cierra la traza: total, histogramas del proceso y línea de log JSON."""
+        self.total_ms = (time.perf_counter() - self.start) * 1000
+        metrics.observe(self)
+        logging.info(json.dumps(self.record()))
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _current.reset(self._token)
+        self.finish()
+        return False
+
+
+class _Activation:
+    __slots__ = ("trace", "token")
+
+    def __init__(self, trace):
+        self.trace = trace
+
+    def __enter__(self):
+        self.token = _current.set(self.trace)
+        return self.trace
+
+    def __exit__(self, *exc):
+        _current.reset(self.token)
+        return False
+
+
+class _NullTrace(_NullContext):
+    """Traza vacía cuando la instrumentación está desactivada."""
+
+    __slots__ = ()
+    stages = {}
+    counters = {}
+
+    def count(self, name, n=1):
+        pass
+
+    def activate(self):
+        return self
+
+    def finish(self):
+        pass
+
+    def server_timing(self):
+        return None
+
+    def record(self):
+        return None
+
+
+_NULL_TRACE = _NullTrace()
+
+
+def trace(name):
+    """Abre la traza de una petición (context manager). Sin instrumentación, una traza vacía."""
+    return Trace(name) if ENABLED else _NULL_TRACE
+
+
+def stage(name):
+    """Mide una etapa de la traza en curso (no hace nada si no hay traza)."""
+    if not ENABLED:
+        return _NULL
+    current = _current.get()
+    return _NULL if current is None else _Stage(current, name)
+
+
+def count(name, n=1):
+    """Suma n al contador name de la traza en curso."""
+    if not ENABLED:
+        return
+    current = _current.get()
+    if current is not None:
+        current.counters[name] = current.counters.get(name, 0) + n
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)  # el último es +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.buckets[bisect_left(BUCKETS_MS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Metrics:
+    """Agregados del proceso: histograma por etapa (y total) y totales de contadores."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.traces = 0
+
+    def observe(self, trace):
+        with self._lock:
+            self.traces += 1
+            for name, ms in list(trace.stages.items()) + [("total", trace.total_ms)]:
+                self.histograms.setdefault(name, Histogram()).observe(ms)
+            for name, n in trace.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "traces": self.traces,
+                "counters": dict(self.counters),
+                "stages_ms": {
+                    name: {
+                        "count": h.count,
+                        "sum": round(h.sum, 3),
+                        "buckets": dict(zip([str(b) for b in BUCKETS_MS] + ["+Inf"], h.buckets)),
+                    }
+                    for name, h in self.histograms.items()
+                },
+            }
+
+    def text(self):
+        """Volcado en formato de exposición Prometheus (buckets acumulados)."""
+        snapshot = self.snapshot()
+        lines = ["# TYPE fiscal_stage_ms histogram"]
+        for name, h in snapshot["stages_ms"].items():
+            cumulative = 0
+            for le, n in h["buckets"].items():
+                cumulative += n
+                lines.append(f'fiscal_stage_ms_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'fiscal_stage_ms_sum{{stage="{name}"}} {h["sum"]}')
+            lines.append(f'fiscal_stage_ms_count{{stage="{name}"}} {h["count"]}')
+        lines.append("# TYPE fiscal_events_total counter")
+        for name, n in snapshot["counters"].items():
+            lines.append(f'fiscal_events_total{{counter="{name}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.traces = 0
+
+
+metrics = Metrics()
+
+
+def metrics_text():
+    return metrics.text()
@@ -0,0 +1,79 @@
+from collections import deque
+
+
+class KeywordMatcher:
+    """
+    Autómata Aho–Corasick sobre varias listas de palabras clave.
+    groups: listas de keywords ordenadas por prioridad (índice 0 = la más prioritaria).
+    match(text) recorre el texto una sola vez y devuelve el índice del grupo más
+    prioritario con alguna keyword contenida en el texto (None si no hay ninguna),
+    igual que evaluar `any(k in text for k in group)` grupo a grupo.
+    """
+
+    def __init__(self, groups):
+        self._goto = [{}]
+        self._fail = [0]
+        self._best = [None]  # grupo más prioritario que termina en cada estado (incluye enlaces de fallo)
+        self.keyword_count = 0
+
+        for priority, keywords in enumerate(groups):
+            for keyword in keywords:
+                self._add(keyword, priority)
+
+        self._build_fail_links()
+
+    def _add(self, keyword, priority):
+        state = 0
+        for ch in keyword:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._best.append(None)
+            state = next_state
+        self._best[state] = _higher(self._best[state], priority)
+        self.keyword_count += 1
+
+    def _build_fail_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, child in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                self._best[child] = _higher(self._best[child], self._best[self._fail[child]])
+                queue.append(child)
+
+    def match(self, text):
+        goto = self._goto
+        fail = self._fail
+        best_by_state = self._best
+
+        best = best_by_state[0]  # keyword vacía: coincide con cualquier texto
+        if best == 0:
+            return 0
+
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+
+            found = best_by_state[state]
+            if found is not None and (best is None or found < best):
+                if found == 0:
+                    return 0
+                best = found
+        return best
+
+
+def _higher(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a, b)
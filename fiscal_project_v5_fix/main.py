@@ -1,51 +1,159 @@
 import functions_framework
 from google.cloud import bigquery
-from pydantic import BaseModel, Field, ValidationError
-from typing import List, Optional
+from pydantic import ValidationError
+import hashlib
 import json
 import logging
+import os
+import threading
+import time
 
 # Import local modules
+import data_registry
+import instrumentation
+from batch_api import (
+    COMPANY_SS_RATE, EMPLOYEE_SS_RATE, SimulationRequest, run_batch_chunk, validation_details, year_error,
+)
 from engine import FiscalEngine
 from dgt_classifier import DGTAnalyzer
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
-# Pydantic Models for Validation
-class ExpenseItem(BaseModel):
-    description: str
-    amount: float = Field(..., gt=0, description="Amount in EUR")
+LOCAL_TAX_DATA = "tax_data.json"
 
-class SimulationRequest(BaseModel):
-    gross_income: float = Field(..., gt=0, description="Annual Gross Income")
-    expenses: List[ExpenseItem] = []
-    region: str = "Madrid"
-    cnae: str = Field(..., description="CNAE Activity Code")
-    is_new_company: bool = False
+# Tabla de BigQuery con los datos fiscales (columna `payload` con el JSON de tax_data).
+# Si no está configurada se usa directamente el JSON local, sin intentar la conexión.
+BQ_TAX_TABLE = os.environ.get("FISCAL_BQ_TAX_TABLE", "")
+
+# Cada cuánto se vuelve a resolver el origen de datos en un contenedor caliente (segundos)
+DATA_SOURCE_TTL = float(os.environ.get("FISCAL_DATA_SOURCE_TTL", "3600"))
+
+# Peticiones por lote: se validan, clasifican y simulan en bloques de este tamaño y
+# cada bloque se devuelve en cuanto está listo (NDJSON en streaming)
+BATCH_CHUNK_SIZE = int(os.environ.get("FISCAL_BATCH_CHUNK_SIZE", "1000"))
 
 # BigQuery Client (Global for reuse)
 # client = bigquery.Client() # Commented out to prevent errors in local env without creds
 
-def get_tax_data_from_bq():
+def get_tax_data_from_bq(client=None):
     """
     Fetches tax data from BigQuery. 
-    Fallbacks to local JSON if BQ fails or not configured.
+    Returns the tax data dict, or the path to the local JSON if BQ fails or is not configured.
+    client: bigquery.Client (or a stub with the same query().result() interface).
     """
+    if client is None and not BQ_TAX_TABLE:
+        # Sin tabla configurada no hay nada que intentar: evitamos la excepción y el warning
+        return LOCAL_TAX_DATA
+
     try:
-        # client = bigquery.Client()
-        # query = "SELECT * FROM `project.dataset.tax_tables_2026`"
-        # results = client.query(query).result()
-        # ... logic to parse results ...
         logging.info("Attempting BigQuery connection...")
-        raise Exception("BQ Credentials not found (Mock)")
+        if client is None:
+            client = bigquery.Client()
+        query = f"SELECT payload FROM `{BQ_TAX_TABLE or 'project.dataset.tax_tables_2026'}` LIMIT 1"
+        rows = list(client.query(query).result())
+        if not rows:
+            raise Exception("Tax data table is empty")
+        payload = rows[0]["payload"]
+        return json.loads(payload) if isinstance(payload, str) else dict(payload)
     except Exception as e:
         logging.warning(f"BigQuery fetch failed: {e}. Using local tax_data.json")
-        return "tax_data.json" # Return path to local file for Engine to load
+        return LOCAL_TAX_DATA # Return path to local file for Engine to load
+
+
+class Runtime:
+    """Estado que se construye una vez por contenedor y se reutiliza entre peticiones."""
+
+    def __init__(self, engine, dgt, data_source, init_ms):
+        self.engine = engine
+        self.dgt = dgt
+        self.data_source = data_source
+        self.init_ms = init_ms
+        self.resolved_at = time.monotonic()
+        self.served = 0
+
+    def expired(self):
+        return time.monotonic() - self.resolved_at > DATA_SOURCE_TTL
+
+
+_runtime = None
+_runtime_lock = threading.Lock()
+_refresh_thread = None  # reconstrucción en segundo plano tras caducar el TTL
+
+
+def _build_runtime(bq_client=None):
+    start = time.perf_counter()
+    with instrumentation.stage("tax_data_source"):
+        source = get_tax_data_from_bq(bq_client)
+    with instrumentation.stage("engine_init"):
+        if isinstance(source, dict):
+            version = "bigquery:" + hashlib.sha256(json.dumps(source, sort_keys=True).encode("utf-8")).hexdigest()
+            engine = FiscalEngine(dataset=data_registry.register_tax_dataset(version, source))
+            data_source = version
+        else:
+            engine = FiscalEngine(source)
+            data_source = source
+    with instrumentation.stage("dgt_init"):
+        dgt = DGTAnalyzer()
+    init_ms = (time.perf_counter() - start) * 1000
+    logging.info(f"Fiscal runtime initialized from {data_source} in {init_ms:.1f} ms")
+    return Runtime(engine, dgt, data_source, init_ms)
+
+
+def get_runtime(bq_client=None, force=False):
+    """
+    Devuelve (runtime, cold). El origen de datos se resuelve en el arranque del contenedor;
+    cold indica que esta llamada lo ha construido. Cuando caduca el TTL se sigue sirviendo
+    el runtime actual mientras el nuevo se construye en segundo plano (ver _refresh_runtime).
+    """
+    global _runtime
+    runtime = _runtime
+    if runtime is not None and not force:
+        if runtime.expired():
+            _start_refresh(bq_client)
+        return runtime, False
+
+    with _runtime_lock:
+        if _runtime is None or force:
+            _runtime = _build_runtime(bq_client)
+            return _runtime, True
+        return _runtime, False
+
+
+def _start_refresh(bq_client=None):
+    """Lanza la reconstrucción en segundo plano si no hay otra en curso."""
+    global _refresh_thread
+    with _runtime_lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return
+        _refresh_thread = threading.Thread(target=_refresh_runtime, args=(bq_client,),
+                                           name="fiscal-runtime-refresh", daemon=True)
+        _refresh_thread.start()
+
+
+def _refresh_runtime(bq_client=None):
+    """Construye el runtime fuera de la petición (incluida la consulta a BigQuery) y lo publica."""
+    global _runtime
+    try:
+        runtime = _build_runtime(bq_client)
+    except Exception as e:
+        # Seguimos con el runtime anterior y se reintenta cuando vuelva a caducar
+        logging.error(f"Fiscal runtime refresh failed: {e}")
+        if _runtime is not None:
+            _runtime.resolved_at = time.monotonic()
+        return
+    with _runtime_lock:
+        _runtime = runtime
+
+
+# Fase de inicialización: se ejecuta una vez al importar el módulo (arranque en frío del contenedor)
+if os.environ.get("FISCAL_EAGER_INIT", "1") == "1":
+    get_runtime()
 
 @functions_framework.http
 def fiscal_navigator_api(request):
     """HTTP Cloud Function entry point."""
+    request_start = time.perf_counter()
     
     # CORS Headers
     if request.method == 'OPTIONS':
@@ -57,43 +165,72 @@ def fiscal_navigator_api(request):
         }
         return ('', 204, headers)
 
+    # Volcado local de métricas (solo con FISCAL_INSTRUMENTATION=1)
+    if request.method == 'GET' and getattr(request, 'path', '') == '/metrics' and instrumentation.ENABLED:
+        return (instrumentation.metrics_text(), 200, {'Content-Type': 'text/plain; version=0.0.4'})
+
+    if _is_batch_request(request):
+        return _handle_batch(request)
+
+    with instrumentation.trace("fiscal_navigator_api") as trace:
+        status_body, status, headers = _handle_simulation(request, request_start)
+        trace.count("status_" + str(status))
+        server_timing = trace.server_timing() if instrumentation.SERVER_TIMING else None
+        if server_timing:
+            headers['Server-Timing'] = server_timing
+    return (status_body, status, headers)
+
+
+def _handle_simulation(request, request_start):
     headers = {'Access-Control-Allow-Origin': '*'}
 
     # Parsing Request
     try:
-        request_json = request.get_json(silent=True)
-        if not request_json:
-            return ({"error": "Invalid JSON"}, 400, headers)
-            
-        # Validation with Pydantic
-        data = SimulationRequest(**request_json)
+        with instrumentation.stage("validation"):
+            request_json = request.get_json(silent=True)
+            if not request_json:
+                return ({"error": "Invalid JSON"}, 400, headers)
+                
+            # Validation with Pydantic
+            data = SimulationRequest(**request_json)
         
     except ValidationError as e:
-        return ({"error": "Validation Error", "details": e.errors()}, 400, headers)
+        return ({"error": "Validation Error", "details": validation_details(e)}, 400, headers)
     except Exception as e:
         return ({"error": f"Bad Request: {str(e)}"}, 400, headers)
 
     try:
-        # 1. Initialize Engines
-        # In a real cold-start, we might load data here.
-        data_source = get_tax_data_from_bq()
-        engine = FiscalEngine(data_source)
-        dgt = DGTAnalyzer()
+        # 1. Engines ya construidos en el arranque (o reconstruidos si caducó el TTL)
+        with instrumentation.stage("runtime"):
+            runtime, cold = get_runtime()
+        engine = runtime.engine
+        dgt = runtime.dgt
+
+        error = year_error(engine, data.year)
+        if error:
+            return ({"error": error}, 400, headers)
         
         # 2. Process Expenses (Module 2)
         # We process expenses first to determine deductible amount
-        dgt_result = dgt.process_expenses([e.dict() for e in data.expenses], data.cnae)
+        with instrumentation.stage("classification"):
+            dgt_result = dgt.process_expenses([e.model_dump() for e in data.expenses], data.cnae)
         
         deductible_expenses = dgt_result["total_deductible_suggested"]
         
         # 3. Process Calculation (Module 1)
         # We pass the calculated deductible expenses to the engine
-        calc_result = engine.run_simulation(
-            gross_income=data.gross_income,
-            deductibles=deductible_expenses,
-            region=data.region,
-            is_new_company=data.is_new_company
-        )
+        with instrumentation.stage("simulation"):
+            calc_result = engine.run_simulation(
+                employee_gross=data.gross_income,
+                employee_ss=data.gross_income * EMPLOYEE_SS_RATE,
+                company_ss=data.gross_income * COMPANY_SS_RATE,
+                employee_personal_expenses=0,
+                autonomo_gross=data.gross_income,
+                autonomo_expenses=deductible_expenses,
+                region=data.region,
+                is_new_company=data.is_new_company,
+                year=data.year
+            )
         
         # 4. Construct Final Response
         response = {
@@ -106,9 +243,101 @@ def fiscal_navigator_api(request):
             "financial_simulation": calc_result["results"],
             "inputs": calc_result["inputs"]
         }
+        with instrumentation.stage("serialization"):
+            response_body = json.dumps(response)
         
-        return (json.dumps(response), 200, headers)
+        runtime.served += 1
+        request_ms = (time.perf_counter() - request_start) * 1000
+        headers['X-Fiscal-Start'] = 'cold' if cold else 'warm'
+        headers['X-Fiscal-Init-Ms'] = f"{runtime.init_ms:.1f}"
+        headers['X-Fiscal-Request-Ms'] = f"{request_ms:.1f}"
+        logging.info(f"Simulation served ({headers['X-Fiscal-Start']}) in {request_ms:.1f} ms, runtime init {runtime.init_ms:.1f} ms")
+        
+        return (response_body, 200, headers)
 
     except Exception as e:
         logging.error(f"Internal Error: {e}")
         return ({"error": str(e)}, 500, headers)
+
+
+# --- Lotes: varias simulaciones por petición ---
+
+def _is_batch_request(request):
+    """Lote si la ruta es /batch o el cuerpo es NDJSON."""
+    if getattr(request, 'path', '').rstrip('/').endswith('/batch'):
+        return True
+    content_type = getattr(request, 'headers', {}).get('Content-Type', '')
+    return content_type.startswith('application/x-ndjson')
+
+
+def _batch_items(request):
+    """Elementos crudos del lote: NDJSON (una petición por línea) o JSON (lista o {"requests": [...]})."""
+    content_type = getattr(request, 'headers', {}).get('Content-Type', '')
+    if content_type.startswith('application/x-ndjson'):
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                yield e
+        return
+
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict):
+        payload = payload.get("requests")
+    if not isinstance(payload, list):
+        raise ValueError('Expected NDJSON, a JSON list or {"requests": [...]}')
+    yield from payload
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _handle_batch(request):
+    headers = {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/x-ndjson'}
+    try:
+        items = _batch_items(request)
+        first = next(items, None)
+    except Exception as e:
+        return ({"error": f"Bad Request: {str(e)}"}, 400, {'Access-Control-Allow-Origin': '*'})
+    if first is None:
+        return ({"error": "Empty batch"}, 400, {'Access-Control-Allow-Origin': '*'})
+
+    # La traza se abre aquí, en el ámbito de la petición; el generador la reactiva solo
+    # mientras procesa cada bloque (nunca queda fijada en el contexto entre yields)
+    trace = instrumentation.trace("fiscal_navigator_batch")
+    with trace.activate():
+        with instrumentation.stage("runtime"):
+            runtime, cold = get_runtime()
+    headers['X-Fiscal-Start'] = 'cold' if cold else 'warm'
+
+    def stream():
+        index = 0
+        try:
+            for chunk in _chunks(_prepend(first, items), BATCH_CHUNK_SIZE):
+                with trace.activate():
+                    lines = run_batch_chunk(runtime.engine, runtime.dgt, chunk, index)
+                for line in lines:
+                    yield json.dumps(line, default=str) + "\n"
+                index += len(chunk)
+            runtime.served += index
+        finally:
+            trace.count("batch_items", index)
+            trace.finish()
+
+    # Flask (functions-framework) envía el generador como respuesta en streaming
+    return (stream(), 200, headers)
+
+
+def _prepend(first, items):
+    yield first
+    yield from items
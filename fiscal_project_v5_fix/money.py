@@ -0,0 +1,212 @@
+"""
+Modo de cálculo en céntimos enteros.
+
+El motor normal trabaja con floats y redondea solo el resultado final; aquí todos
+los importes son céntimos enteros (int / arrays int64) y los tipos, puntos básicos
+(0,0635 -> 635). Cada paso legal se redondea al céntimo, mitad hacia arriba
+(lejos de cero): cuota de cada tramo, reducción del 7%, cuota de IS y, si se
+calcula con tipo, la cotización a la Seguridad Social. Como son operaciones
+enteras de numpy, la versión por lotes va a la misma velocidad que la de floats.
+
+Los importes de entrada se pasan en euros con, como mucho, dos decimales.
+"""
+from bisect import bisect_right
+from functools import lru_cache
+
+import numpy as np
+
+from engine import (
+    BATCH_OUTPUT_COLUMNS, DIFFICULT_JUSTIFICATION_CAP, DIFFICULT_JUSTIFICATION_RATE, SS_SOCIETARIO,
+    WORK_INCOME_REDUCTION,
+)
+from tax_tables import DEFAULT_REGION_TABLE
+
+BASIS_POINTS = 10_000
+_HALF = BASIS_POINTS // 2
+
+
+def to_cents(euros):
+    """Euros (número o array) a céntimos enteros."""
+    if isinstance(euros, (int, float, np.integer, np.floating)):
+        return int(round(float(euros) * 100))
+    return np.rint(np.asarray(euros, dtype=np.float64) * 100).astype(np.int64)
+
+
+def to_euros(cents):
+    if isinstance(cents, (int, np.integer)):
+        return int(cents) / 100
+    return np.asarray(cents) / 100
+
+
+def to_basis_points(rate):
+    """Tipo (0.0635) a puntos básicos (635); error si el tipo tiene más de 4 decimales."""
+    bp = round(rate * BASIS_POINTS)
+    if abs(bp - rate * BASIS_POINTS) > 1e-6:
+        raise ValueError(f"Rate {rate} is not a whole number of basis points")
+    return int(bp)
+
+
+def apply_rate(cents, bp):
+    """cents x tipo redondeado al céntimo, mitad lejos de cero (escalar o array int64)."""
+    if isinstance(cents, (int, np.integer)) and isinstance(bp, (int, np.integer)):
+        product = int(cents) * int(bp)
+        rounded = (abs(product) + _HALF) // BASIS_POINTS
+        return rounded if product >= 0 else -rounded
+    product = np.asarray(cents, dtype=np.int64) * np.asarray(bp, dtype=np.int64)
+    return np.sign(product) * ((np.abs(product) + _HALF) // BASIS_POINTS)
+
+
+class CentsBracketTable:
+    """
+    BracketTable en céntimos: la cuota de cada tramo completo se redondea por separado
+    y la cuota acumulada es la suma de esas cuotas ya redondeadas.
+    """
+
+    def __init__(self, table):
+        self.lowers = np.array([to_cents(x) for x in table._lowers], dtype=np.int64)
+        self.rates = np.array([to_basis_points(r) for r in table._rates], dtype=np.int64)
+        widths = np.diff(self.lowers)
+        bracket_tax = [apply_rate(int(w), int(r)) for w, r in zip(widths, self.rates[:-1])]
+        self.cumulative = np.concatenate(([0], np.cumsum(bracket_tax, dtype=np.int64))).astype(np.int64)
+        self._lowers = self.lowers.tolist()
+        self._rates = self.rates.tolist()
+        self._cumulative = self.cumulative.tolist()
+
+    def tax(self, base):
+        if base <= 0:
+            return 0
+        i = bisect_right(self._lowers, base) - 1
+        return self._cumulative[i] + apply_rate(base - self._lowers[i], self._rates[i])
+
+    def tax_array(self, bases):
+        bases = np.maximum(np.asarray(bases, dtype=np.int64), 0)
+        idx = np.searchsorted(self.lowers, bases, side="right") - 1
+        return self.cumulative[idx] + apply_rate(bases - self.lowers[idx], self.rates[idx])
+
+
+class _CentsTables:
+    def __init__(self, dataset):
+        self.state = CentsBracketTable(dataset.state_table)
+        self.regional = {name: CentsBracketTable(t) for name, t in dataset.regional_tables.items()}
+        self.savings = CentsBracketTable(dataset.savings_table)
+        self.reta_table = dataset.reta_table
+        self.reta_quotas = np.array([to_cents(q) for q in dataset.reta_table._quotas], dtype=np.int64)
+        self.is_rates = {key: to_basis_points(dataset.data["is_rates"][key]) for key in ("general", "new_entity")}
+
+    def regional_table(self, region):
+        return self.regional.get(region, self.regional[DEFAULT_REGION_TABLE])
+
+
+@lru_cache(maxsize=16)
+def _tables(dataset):
+    # Una compilación por dataset (los datasets del registro viven todo el proceso)
+    return _CentsTables(dataset)
+
+
+WORK_INCOME_REDUCTION_CENTS = to_cents(WORK_INCOME_REDUCTION)
+DIFFICULT_JUSTIFICATION_BP = to_basis_points(DIFFICULT_JUSTIFICATION_RATE)
+DIFFICULT_JUSTIFICATION_CAP_CENTS = to_cents(DIFFICULT_JUSTIFICATION_CAP)
+SS_SOCIETARIO_CENTS = to_cents(SS_SOCIETARIO)
+
+
+class CentsEngine:
+    """
+    Los mismos cálculos que FiscalEngine.run_simulation / run_simulation_batch en céntimos.
+    simulate devuelve un dict de céntimos (int); simulate_batch, arrays int64 con las
+    columnas de BATCH_OUTPUT_COLUMNS.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.tables = _tables(engine.dataset)
+
+    def _reta_annual(self, net_yield):
+        monthly = net_yield / 1200  # céntimos anuales -> euros mensuales (solo para elegir tramo)
+        return self.tables.reta_quotas[self.tables.reta_table.tramo_index_array(monthly)] * 12
+
+    def simulate(self, employee_gross, employee_ss=None, employee_personal_expenses=0, autonomo_gross=0,
+                 autonomo_expenses=0, region="Madrid", is_new_company=False, employee_ss_rate=None):
+        """
+        Importes en euros; resultado en céntimos. employee_ss_rate (en vez de employee_ss)
+        calcula la cotización con su propio redondeo al céntimo.
+        """
+        tables = self.tables
+        regional = tables.regional_table(region)
+        gross = to_cents(employee_gross)
+        ss = apply_rate(gross, to_basis_points(employee_ss_rate)) if employee_ss is None else to_cents(employee_ss)
+
+        # 1. Asalariado
+        base_employee = max(gross - ss - WORK_INCOME_REDUCTION_CENTS, 0)
+        irpf_employee = tables.state.tax(base_employee) + regional.tax(base_employee)
+        net_employee = gross - ss - irpf_employee - to_cents(employee_personal_expenses)
+
+        # 2. Autónomo
+        income = to_cents(autonomo_gross)
+        expenses = to_cents(autonomo_expenses)
+        reta = int(self._reta_annual(income - expenses))
+        net_yield = income - expenses - reta
+        reduction = min(apply_rate(net_yield, DIFFICULT_JUSTIFICATION_BP), DIFFICULT_JUSTIFICATION_CAP_CENTS)
+        base_autonomo = max(net_yield - reduction, 0)
+        irpf_autonomo = tables.state.tax(base_autonomo) + regional.tax(base_autonomo)
+
+        # 3. SL (salario de administrador 0, como run_simulation)
+        profit = income - expenses - SS_SOCIETARIO_CENTS
+        corporate_tax = max(apply_rate(profit, tables.is_rates["new_entity" if is_new_company else "general"]), 0)
+        dividend = profit - corporate_tax
+        dividend_tax = tables.savings.tax(dividend)
+
+        return {
+            "asalariado_neto": net_employee,
+            "asalariado_irpf": irpf_employee,
+            "autonomo_neto": base_autonomo - irpf_autonomo,
+            "autonomo_irpf": irpf_autonomo,
+            "autonomo_reta": reta,
+            "sl_neto": dividend - dividend_tax,
+            "sl_is": corporate_tax,
+            "sl_dividend_tax": dividend_tax,
+        }
+
+    def simulate_batch(self, profiles):
+        """profiles: mismas columnas que FiscalEngine.run_simulation_batch (employee_ss o employee_ss_rate)."""
+        tables = self.tables
+        gross = to_cents(profiles["employee_gross"])
+        n = len(gross)
+        if "employee_ss" in profiles:
+            ss = to_cents(profiles["employee_ss"])
+        else:
+            ss = apply_rate(gross, to_basis_points(float(profiles["employee_ss_rate"])))
+        personal = to_cents(profiles["employee_personal_expenses"]) if "employee_personal_expenses" in profiles \
+            else np.zeros(n, dtype=np.int64)
+        regions = np.asarray(profiles["region"]) if "region" in profiles else np.full(n, "Madrid", dtype=object)
+        is_new_company = (np.asarray(profiles["is_new_company"], dtype=bool) if "is_new_company" in profiles
+                          else np.zeros(n, dtype=bool))
+        income = to_cents(profiles["autonomo_gross"])
+        expenses = to_cents(profiles["autonomo_expenses"])
+
+        base_employee = np.maximum(gross - ss - WORK_INCOME_REDUCTION_CENTS, 0)
+        reta = self._reta_annual(income - expenses)
+        net_yield = income - expenses - reta
+        reduction = np.minimum(apply_rate(net_yield, DIFFICULT_JUSTIFICATION_BP), DIFFICULT_JUSTIFICATION_CAP_CENTS)
+        base_autonomo = np.maximum(net_yield - reduction, 0)
+
+        irpf_employee = tables.state.tax_array(base_employee)
+        irpf_autonomo = tables.state.tax_array(base_autonomo)
+        unique_regions, inverse = np.unique(regions.astype(str), return_inverse=True)
+        for k, name in enumerate(unique_regions):
+            rows = inverse == k
+            regional = tables.regional_table(name)
+            irpf_employee[rows] += regional.tax_array(base_employee[rows])
+            irpf_autonomo[rows] += regional.tax_array(base_autonomo[rows])
+
+        profit = income - expenses - SS_SOCIETARIO_CENTS
+        is_bp = np.where(is_new_company, tables.is_rates["new_entity"], tables.is_rates["general"])
+        corporate_tax = np.maximum(apply_rate(profit, is_bp), 0)
+        dividend = profit - corporate_tax
+        dividend_tax = tables.savings.tax_array(dividend)
+
+        values = (
+            gross - ss - irpf_employee - personal, irpf_employee,
+            base_autonomo - irpf_autonomo, irpf_autonomo, reta,
+            dividend - dividend_tax, corporate_tax, dividend_tax,
+        )
+        return dict(zip(BATCH_OUTPUT_COLUMNS, values))
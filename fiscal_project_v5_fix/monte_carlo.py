@@ -0,0 +1,130 @@
+"""
+Simulación Monte Carlo de la comparación de regímenes.
+
+Los ingresos y gastos se describen como distribuciones; cada escenario se evalúa
+con run_simulation_batch (vectorizado sobre las tablas de tax_data.json). Los
+escenarios se generan por bloques, cada uno con su propia semilla derivada de
+`seed` (numpy SeedSequence), de modo que el resultado es reproducible y no
+depende de si los bloques se ejecutan en serie o en un pool de procesos.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import data_registry
+from engine import REGIMES, FiscalEngine
+
+NET_COLUMNS = ("asalariado_neto", "autonomo_neto", "sl_neto")
+
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+# A partir de este número de escenarios se reparten los bloques en un pool de procesos
+PARALLEL_THRESHOLD = 1_000_000
+
+
+def sample(spec, rng, size):
+    """
+    Muestras de una distribución (nunca negativas: son importes).
+    spec: número fijo o dict con "dist" y sus parámetros:
+      normal (mean, std), lognormal (mean, sigma: de log), uniform (low, high),
+      triangular (left, mode, right).
+    """
+    if isinstance(spec, (int, float)):
+        return np.full(size, float(spec))
+
+    dist = spec["dist"]
+    if dist == "normal":
+        values = rng.normal(spec["mean"], spec["std"], size)
+    elif dist == "lognormal":
+        values = rng.lognormal(spec["mean"], spec["sigma"], size)
+    elif dist == "uniform":
+        values = rng.uniform(spec["low"], spec["high"], size)
+    elif dist == "triangular":
+        values = rng.triangular(spec["left"], spec["mode"], spec["right"], size)
+    else:
+        raise ValueError(f"Unsupported distribution: {dist}")
+    return np.maximum(values, 0)
+
+
+def _simulate_chunk(engine, params, seed_seq, size):
+    rng = np.random.default_rng(seed_seq)
+    employee_gross = sample(params["employee_gross"], rng, size)
+    result = engine.run_simulation_batch({
+        "employee_gross": employee_gross,
+        "employee_ss": employee_gross * params["employee_ss_rate"],
+        "autonomo_gross": sample(params["autonomo_gross"], rng, size),
+        "autonomo_expenses": sample(params["autonomo_expenses"], rng, size),
+        "employee_personal_expenses": np.full(size, float(params["employee_personal_expenses"])),
+        "region": np.full(size, params["region"], dtype=object),
+        "is_new_company": np.full(size, params["is_new_company"]),
+    })
+    return np.stack([result[column] for column in NET_COLUMNS])
+
+
+# Estado de cada proceso del pool: un motor caliente por worker
+_worker_engine = None
+
+
+def _init_worker(version, data):
+    global _worker_engine
+    _worker_engine = FiscalEngine(dataset=data_registry.register_tax_dataset(version, data))
+
+
+def _simulate_chunk_in_worker(params, seed_seq, size):
+    return _simulate_chunk(_worker_engine, params, seed_seq, size)
+
+
+def run_monte_carlo(engine, autonomo_gross, autonomo_expenses, employee_gross, n_scenarios=100_000,
+                    region="Madrid", is_new_company=False, employee_ss_rate=0.0635,
+                    employee_personal_expenses=0.0, seed=None, chunk_size=100_000, workers=None,
+                    percentiles=DEFAULT_PERCENTILES):
+    """
+    Probabilidad de que gane cada régimen y percentiles de su neto.
+    Un escenario en el que dos o más regímenes empatan en el neto máximo (al céntimo) no
+    cuenta como victoria de ninguno: se reporta aparte en "tie_probability".
+    autonomo_gross, autonomo_expenses, employee_gross: número o distribución (ver sample).
+    workers: procesos del pool (None = automático a partir de PARALLEL_THRESHOLD, 1 = en serie).
+    """
+    params = {
+        "autonomo_gross": autonomo_gross,
+        "autonomo_expenses": autonomo_expenses,
+        "employee_gross": employee_gross,
+        "employee_ss_rate": employee_ss_rate,
+        "employee_personal_expenses": employee_personal_expenses,
+        "region": region,
+        "is_new_company": is_new_company,
+    }
+    sizes = [min(chunk_size, n_scenarios - start) for start in range(0, n_scenarios, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    if workers is None:
+        workers = (os.cpu_count() or 1) if n_scenarios >= PARALLEL_THRESHOLD else 1
+    workers = min(workers, len(sizes))
+
+    if workers > 1:
+        version = f"monte-carlo:{engine.dataset.source}"
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(version, data_registry.thaw(engine.data))) as pool:
+            chunks = list(pool.map(_simulate_chunk_in_worker, [params] * len(sizes), seeds, sizes))
+    else:
+        chunks = [_simulate_chunk(engine, params, s, size) for s, size in zip(seeds, sizes)]
+
+    nets = np.concatenate(chunks, axis=1)
+    tied = (nets == nets.max(axis=0)).sum(axis=0) > 1
+    winners = np.bincount(np.argmax(nets[:, ~tied], axis=0), minlength=len(REGIMES))
+    quantiles = np.percentile(nets, percentiles, axis=1)
+
+    return {
+        "n_scenarios": n_scenarios,
+        "seed": seed,
+        "tie_probability": float(tied.sum() / n_scenarios),
+        "regimes": {
+            regime: {
+                "win_probability": float(winners[i] / n_scenarios),
+                "mean": round(float(nets[i].mean()), 2),
+                "percentiles": {f"p{p}": round(float(quantiles[k, i]), 2) for k, p in enumerate(percentiles)},
+            }
+            for i, regime in enumerate(REGIMES)
+        },
+    }
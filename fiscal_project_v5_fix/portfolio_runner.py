@@ -0,0 +1,274 @@
+"""
+Procesado nocturno de carteras de clientes desde línea de comandos.
+
+    python portfolio_runner.py cartera.jsonl resultados.jsonl --workers 8
+    python portfolio_runner.py cartera.csv resultados.jsonl --resume
+
+Cada cliente es un elemento de POST /batch (gross_income, cnae, region,
+is_new_company, year, expenses y un id opcional). Formatos de entrada:
+  - JSONL: un cliente por línea con su lista expenses.
+  - CSV / Parquet: una fila por cliente con expenses en JSON, o una fila por gasto
+    (columnas description y amount) con las filas de un mismo id seguidas; en este
+    formato el id es obligatorio.
+Una línea o celda expenses que no es JSON válido, o una fila de gasto sin id, sale
+como línea de error de ese cliente sin detener la ejecución.
+La cartera se lee en streaming y se parte en bloques de --chunk-size clientes; cada
+bloque se clasifica y simula con batch_api.run_batch_chunk (lo mismo que /batch) en
+un ProcessPoolExecutor con un motor y un analizador calientes por worker. Los resultados se escriben en NDJSON
+(las mismas líneas que /batch) según termina cada bloque, y <salida>.progress apunta
+los bloques completos: con --resume se salta lo ya hecho y se descarta cualquier
+escritura a medias de una ejecución interrumpida.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+from batch_api import ItemError, run_batch_chunk
+from dgt_classifier import DGTAnalyzer
+from engine import FiscalEngine
+from expense_io import detect_format, parse_amount
+
+DEFAULT_CHUNK_SIZE = 500
+PARQUET_BATCH_ROWS = 10_000
+
+
+# --- Lectura de la cartera ---
+
+def _clean(row):
+    """
+    Fila de CSV/Parquet a elemento de lote: sin celdas vacías y con expenses decodificado.
+    Si expenses no es JSON válido devuelve un ItemError (línea de error de ese cliente).
+    """
+    item = {k: v for k, v in row.items() if v is not None and v != ""}
+    if isinstance(item.get("expenses"), str):
+        try:
+            item["expenses"] = json.loads(item["expenses"])
+        except json.JSONDecodeError as e:
+            return ItemError(f"Invalid expenses JSON: {e}", item.get("id"))
+    return item
+
+
+def _client_id(client):
+    return client.item_id if isinstance(client, ItemError) else client["id"]
+
+
+def _group_expense_rows(rows):
+    """
+    Filas de un gasto cada una (description, amount) -> un cliente por id con su lista expenses.
+    Sin id no se pueden agrupar: cada una de esas filas sale como ItemError. Un importe
+    ilegible convierte a su cliente en un ItemError (el resto de sus filas se descarta).
+    """
+    client = None
+    for row in rows:
+        if isinstance(row, Exception) or "expenses" in row or "description" not in row:
+            if client is not None:
+                yield client
+                client = None
+            yield row
+            continue
+        if "id" not in row:
+            if client is not None:
+                yield client
+                client = None
+            yield ItemError("Expense rows (description, amount) need an id column to group them per client")
+            continue
+        same = client is not None and _client_id(client) == row["id"]
+        amount = row.pop("amount", 0)
+        try:
+            expense = {"description": row.pop("description"), "amount": parse_amount(amount)}
+        except (ValueError, TypeError):
+            if client is not None and not same:
+                yield client
+            client = ItemError(f"Invalid expense amount: {amount!r}", row["id"])
+            continue
+        if same:
+            if not isinstance(client, ItemError):
+                client["expenses"].append(expense)
+        else:
+            if client is not None:
+                yield client
+            client = dict(row, expenses=[expense])
+    if client is not None:
+        yield client
+
+
+def _parquet_rows(path):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Parquet input needs pyarrow (pip install pyarrow)") from e
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=PARQUET_BATCH_ROWS):
+        yield from batch.to_pylist()
+
+
+def iter_clients(path, fmt=None):
+    """Clientes de la cartera de uno en uno (ver formatos en el docstring del módulo)."""
+    if fmt is None and str(path).lower().endswith(".parquet"):
+        fmt = "parquet"
+    fmt = detect_format(path, fmt)
+    if fmt == "jsonl":
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield ItemError(f"Invalid JSON line: {e}")
+    elif fmt == "csv":
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            yield from _group_expense_rows(_clean(row) for row in csv.DictReader(f))
+    elif fmt == "parquet":
+        yield from _group_expense_rows(_clean(row) for row in _parquet_rows(path))
+    else:
+        raise ValueError(f"Unsupported portfolio format: {fmt}")
+
+
+def _chunks(clients, size):
+    clients = iter(clients)
+    while True:
+        chunk = list(islice(clients, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# --- Workers ---
+
+# Estado de cada proceso del pool: motor y analizador calientes
+_worker_engine = None
+_worker_dgt = None
+
+
+def _init_worker(data_path):
+    global _worker_engine, _worker_dgt
+    _worker_engine = FiscalEngine(data_path)
+    _worker_dgt = DGTAnalyzer()
+
+
+def _process_chunk(number, chunk, offset):
+    lines = run_batch_chunk(_worker_engine, _worker_dgt, chunk, offset)
+    errors = sum(1 for line in lines if line.get("status") != "success")
+    payload = "".join(json.dumps(line, default=str) + "\n" for line in lines).encode("utf-8")
+    return number, len(chunk), errors, payload
+
+
+# --- Progreso y reanudación ---
+
+def _progress_path(output_path):
+    return output_path + ".progress"
+
+
+def _load_progress(output_path, header):
+    """(bloques hechos, bytes válidos de la salida) de una ejecución anterior."""
+    path = _progress_path(output_path)
+    if not os.path.exists(path):
+        return set(), 0
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if not lines or lines[0] != header:
+        raise ValueError(f"{path} belongs to a different run (input or chunk size changed)")
+    done = {entry["chunk"] for entry in lines[1:]}
+    offset = max((entry["offset"] for entry in lines[1:]), default=0)
+    return done, offset
+
+
+def run_portfolio(input_path, output_path, data_path="tax_data.json", fmt=None,
+                  chunk_size=DEFAULT_CHUNK_SIZE, workers=None, resume=False, progress=None):
+    """
+    Procesa la cartera y escribe una línea NDJSON por cliente en output_path.
+    workers: procesos del pool (None = os.cpu_count(), 1 = en este proceso).
+    progress: fichero donde ir mostrando el progreso (p.ej. sys.stderr).
+    Devuelve un resumen con clientes, errores, bloques procesados y saltados y segundos.
+    """
+    header = {"input": os.path.abspath(input_path), "chunk_size": chunk_size}
+    done, valid_bytes = _load_progress(output_path, header) if resume else (set(), 0)
+
+    # Lo escrito después del último bloque apuntado es de un bloque a medias: se descarta
+    with open(output_path, "ab") as out:
+        out.truncate(valid_bytes)
+    progress_mode = "a" if done else "w"
+
+    workers = workers or os.cpu_count() or 1
+    summary = {"clients": 0, "errors": 0, "chunks": 0, "skipped_chunks": len(done), "seconds": 0.0}
+    start = time.perf_counter()
+
+    with open(output_path, "ab") as out, open(_progress_path(output_path), progress_mode, encoding="utf-8") as log:
+        if not done:
+            log.write(json.dumps(header) + "\n")
+            log.flush()
+
+        def write(result):
+            number, clients, errors, payload = result
+            out.write(payload)
+            out.flush()
+            os.fsync(out.fileno())
+            # El bloque cuenta como hecho solo cuando sus líneas ya están en disco
+            log.write(json.dumps({"chunk": number, "offset": out.tell(), "clients": clients}) + "\n")
+            log.flush()
+            summary["clients"] += clients
+            summary["errors"] += errors
+            summary["chunks"] += 1
+            if progress:
+                elapsed = time.perf_counter() - start
+                print(f"\r{summary['clients']} clientes, {summary['chunks']} bloques, "
+                      f"{summary['errors']} errores, {summary['clients'] / max(elapsed, 1e-9):.0f} clientes/s",
+                      end="", file=progress, flush=True)
+
+        pending_chunks = (
+            (number, chunk, number * chunk_size)
+            for number, chunk in enumerate(_chunks(iter_clients(input_path, fmt), chunk_size))
+            if number not in done
+        )
+
+        if workers == 1:
+            _init_worker(data_path)
+            for args in pending_chunks:
+                write(_process_chunk(*args))
+        else:
+            with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(data_path,)) as pool:
+                # Como mucho dos bloques por worker en vuelo: la cartera no se carga entera en memoria
+                in_flight = set()
+                for args in pending_chunks:
+                    in_flight.add(pool.submit(_process_chunk, *args))
+                    if len(in_flight) >= 2 * workers:
+                        finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            write(future.result())
+                for future in wait(in_flight).done:
+                    write(future.result())
+
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    if progress:
+        print(file=progress)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clasificación y simulación de una cartera de clientes")
+    parser.add_argument("input", help="cartera (CSV, Parquet o JSONL)")
+    parser.add_argument("output", help="resultados NDJSON (una línea por cliente)")
+    parser.add_argument("--format", choices=("csv", "jsonl", "parquet"), help="formato de entrada (por extensión)")
+    parser.add_argument("--data", default="tax_data.json", help="datos fiscales")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=None, help="procesos (por defecto, uno por CPU)")
+    parser.add_argument("--resume", action="store_true", help="continúa una ejecución interrumpida")
+    parser.add_argument("--quiet", action="store_true", help="sin progreso")
+    args = parser.parse_args(argv)
+
+    summary = run_portfolio(args.input, args.output, args.data, args.format, args.chunk_size, args.workers,
+                            args.resume, progress=None if args.quiet else sys.stderr)
+    rate = summary["clients"] / summary["seconds"] if summary["seconds"] else 0
+    print(f"{summary['clients']} clientes en {summary['seconds']:.1f} s ({rate:.0f} clientes/s), "
+          f"{summary['errors']} con error, {summary['skipped_chunks']} bloques ya hechos")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+Paquetes de reglas por actividad (CNAE) para el clasificador de gastos.
+
+rule_packs/<prefijo CNAE>.json tiene las mismas tres listas que rules.json. Para un
+CNAE se usa el paquete de prefijo más largo (6201 -> 6201.json, 620.json, 62.json,
+6.json) y, si no hay ninguno, solo rules.json. Las keywords del paquete se suman a
+las generales y mandan sobre ellas: una keyword del paquete sale de las listas
+generales (p.ej. "comida" es conflictiva en general pero deducible en hostelería).
+
+Los paquetes se leen y compilan al pedirlos por primera vez y se guardan en una LRU
+acotada a maxsize autómatas (el JSON del paquete no se retiene: se vuelve a leer si
+el autómata sale de la LRU). Con cache_dir el autómata compilado se guarda además en
+pickle, con la huella del contenido y del código de keyword_matcher.py en el nombre:
+un arranque nuevo no recompila y un cambio en el autómata invalida los pickles viejos.
+"""
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+import data_registry
+import keyword_matcher
+from keyword_matcher import KeywordMatcher
+
+PACKS_DIR = "rule_packs"
+DEFAULT_MAX_PACKS = int(os.environ.get("FISCAL_RULE_PACKS_MAX", "32"))
+DEFAULT_CACHE_DIR = os.environ.get("FISCAL_RULE_PACKS_CACHE_DIR") or None
+
+BASE_PACK = ""  # prefijo del conjunto general (solo rules.json)
+
+
+def _fingerprint(value):
+    return hashlib.sha1(json.dumps(value, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def _code_version(module):
+    with open(module.__file__, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:8]
+
+
+# Versión del formato de los pickles: cambia con el código de KeywordMatcher
+MATCHER_VERSION = _code_version(keyword_matcher)
+
+# Errores de un pickle ilegible o de otra versión del código (se recompila)
+_STALE_PICKLE_ERRORS = (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, IndexError, TypeError)
+
+
+class RulePackSet:
+    """Autómatas por paquete de reglas, cargados bajo demanda con LRU y caché en pickle."""
+
+    def __init__(self, base_rules, rule_lists, packs_dir=PACKS_DIR, maxsize=DEFAULT_MAX_PACKS,
+                 cache_dir=DEFAULT_CACHE_DIR):
+        """rule_lists: nombres de las listas en orden de prioridad (dgt_classifier.RULE_LISTS)."""
+        self.base_rules = base_rules
+        self.rule_lists = tuple(rule_lists)
+        self.packs_dir = data_registry.resolve_path(packs_dir)
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._compiled = OrderedDict()  # prefijo -> KeywordMatcher
+        self.compiles = 0
+        self.pickle_loads = 0
+
+        # Solo se listan los nombres: el contenido se lee al usar cada paquete
+        self._paths = {}
+        if os.path.isdir(self.packs_dir):
+            for name in os.listdir(self.packs_dir):
+                prefix, ext = os.path.splitext(name)
+                if ext == ".json" and prefix.isdigit():
+                    self._paths[prefix] = os.path.join(self.packs_dir, name)
+        self._max_prefix = max((len(p) for p in self._paths), default=0)
+
+        # Huella barata de los paquetes (nombre, tamaño, mtime) para la clave de la caché de clasificaciones
+        signature = sorted((p, os.stat(path).st_size, os.stat(path).st_mtime_ns) for p, path in self._paths.items())
+        self.version = _fingerprint([self.rules_for(BASE_PACK), signature])
+
+    @property
+    def prefixes(self):
+        return sorted(self._paths)
+
+    def pack_for(self, cnae) -> str:
+        """Prefijo del paquete que aplica a un CNAE (BASE_PACK si ninguno)."""
+        digits = "".join(ch for ch in str(cnae or "") if ch.isdigit())
+        for length in range(min(len(digits), self._max_prefix), 0, -1):
+            if digits[:length] in self._paths:
+                return digits[:length]
+        return BASE_PACK
+
+    def rules_for(self, prefix):
+        """Listas del paquete ya combinadas con las generales."""
+        if prefix == BASE_PACK:
+            return {name: list(self.base_rules.get(name, ())) for name in self.rule_lists}
+        # Lectura directa (sin el registro, que retendría el JSON toda la vida del proceso)
+        with open(self._paths[prefix], 'r', encoding='utf-8') as f:
+            pack = json.load(f)
+        pack_keywords = {k for name in self.rule_lists for k in pack.get(name, ())}
+        return {
+            name: list(dict.fromkeys(
+                [k for k in self.base_rules.get(name, ()) if k not in pack_keywords] + list(pack.get(name, ()))
+            ))
+            for name in self.rule_lists
+        }
+
+    def matcher(self, cnae) -> KeywordMatcher:
+        prefix = self.pack_for(cnae)
+        with self._lock:
+            matcher = self._compiled.get(prefix)
+            if matcher is not None:
+                self._compiled.move_to_end(prefix)
+                return matcher
+
+        matcher = self._load(prefix)
+        with self._lock:
+            self._compiled[prefix] = matcher
+            self._compiled.move_to_end(prefix)
+            while len(self._compiled) > self.maxsize:
+                self._compiled.popitem(last=False)
+        return matcher
+
+    def _load(self, prefix):
+        rules = self.rules_for(prefix)
+        path = None
+        if self.cache_dir:
+            path = os.path.join(self.cache_dir, f"{prefix or 'base'}-{MATCHER_VERSION}-{_fingerprint(rules)}.pickle")
+            try:
+                with open(path, "rb") as f:
+                    matcher = pickle.load(f)
+                if isinstance(matcher, KeywordMatcher):
+                    self.pickle_loads += 1
+                    return matcher
+            except _STALE_PICKLE_ERRORS:
+                pass
+
+        matcher = KeywordMatcher([rules[name] for name in self.rule_lists])
+        self.compiles += 1
+
+        if path:
+            # Escritura atómica: otro proceso nunca ve un pickle a medias
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump(matcher, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        return matcher
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_pack_set(base_rules, rule_lists, packs_dir=PACKS_DIR):
+    """RulePackSet compartido por todos los analizadores del proceso con las mismas reglas."""
+    key = (data_registry.resolve_path(packs_dir), tuple(rule_lists),
+           _fingerprint({name: list(base_rules.get(name, ())) for name in rule_lists}))
+    with _shared_lock:
+        packs = _shared.get(key)
+        if packs is None:
+            packs = _shared[key] = RulePackSet(base_rules, rule_lists, packs_dir)
+        return packs
@@ -0,0 +1,149 @@
+"""
+Reparto óptimo entre salario del administrador y dividendos en la SL.
+
+run_simulation fija el salario del administrador en 0 y reparte todo el beneficio
+como dividendo. Aquí se busca el salario s en [0, beneficio] que maximiza
+    neto(s) = s - SS(s) - IRPF(s) + dividendo_neto(beneficio - s).
+neto(s) es lineal a trozos: el máximo está en uno de sus puntos de quiebre
+(límites de los tramos IRPF y del ahorro trasladados a s, beneficio cero y los
+extremos), así que basta evaluar esos candidatos. Sin bucles de búsqueda: cada
+optimización son unas decenas de búsquedas binarias, y la versión por lotes
+evalúa la matriz clientes x candidatos con numpy.
+
+El salario tributa como rendimiento del trabajo (IRPF estatal + autonómico con la
+reducción estándar). La cotización del administrador ya está en SS_SOCIETARIO;
+admin_ss_rate añade una cotización proporcional al salario. Por defecto se toma
+de los datos fiscales (ss_rates.administrador_sl; 0 si el dataset no la trae).
+"""
+import numpy as np
+
+from engine import SS_SOCIETARIO, WORK_INCOME_REDUCTION, _round_cents
+
+
+def admin_ss_rate_for(engine):
+    """Cotización proporcional al salario del administrador según los datos del engine."""
+    return engine.data.get("ss_rates", {}).get("administrador_sl", 0.0)
+
+
+def _salary_candidates(engine, region, profit, admin_ss_rate, is_rate):
+    """Salarios candidatos (puntos de quiebre de neto(s)) dentro de [0, beneficio]."""
+    candidates = {0.0}
+    if profit <= 0:
+        return candidates
+    candidates.add(profit)
+
+    irpf_limits = engine.dataset.state_table.limits() + engine.dataset.regional_table(region).limits()
+    for base in irpf_limits + [0]:
+        candidates.add((base + WORK_INCOME_REDUCTION) / (1 - admin_ss_rate))
+    for dividend in engine.dataset.savings_table.limits():
+        candidates.add(profit - dividend / (1 - is_rate))
+    return {s for s in candidates if 0 <= s <= profit}
+
+
+def _split_result(engine, region, profit, salary, admin_ss_rate, is_rate):
+    admin_ss = salary * admin_ss_rate
+    base = salary - admin_ss - WORK_INCOME_REDUCTION
+    if base < 0: base = 0
+    admin_irpf = engine.dataset.state_table.tax(base) + engine.dataset.regional_table(region).tax(base)
+    admin_salary_net = salary - admin_ss - admin_irpf
+
+    corporate_profit_base = profit - salary
+    corporate_tax = corporate_profit_base * is_rate
+    if corporate_tax < 0: corporate_tax = 0
+    dividend_gross = corporate_profit_base - corporate_tax
+    dividend_tax = engine.calculate_savings_tax(dividend_gross)
+
+    return {
+        "admin_salary_gross": salary,
+        "admin_ss": admin_ss,
+        "admin_irpf": admin_irpf,
+        "admin_salary_net": admin_salary_net,
+        "base_imponible_is": corporate_profit_base,
+        "cuota_is": corporate_tax,
+        "dividendo_bruto": dividend_gross,
+        "retencion_dividendo": dividend_tax,
+        "neto": admin_salary_net + dividend_gross - dividend_tax,
+    }
+
+
+def optimize_admin_salary(engine, autonomo_gross, autonomo_expenses, region="Madrid",
+                          is_new_company=False, admin_ss_rate=None):
+    """
+    Salario de administrador que maximiza el neto de la SL para un perfil.
+    Devuelve el desglose del reparto óptimo y, en "neto_solo_dividendos", el neto
+    de run_simulation (salario 0) como referencia.
+    """
+    if admin_ss_rate is None:
+        admin_ss_rate = admin_ss_rate_for(engine)
+    profit = autonomo_gross - autonomo_expenses - SS_SOCIETARIO
+    is_rate = engine.data["is_rates"]["new_entity"] if is_new_company else engine.data["is_rates"]["general"]
+
+    best = None
+    for salary in sorted(_salary_candidates(engine, region, profit, admin_ss_rate, is_rate)):
+        split = _split_result(engine, region, profit, salary, admin_ss_rate, is_rate)
+        # En empate se queda el salario más bajo
+        if best is None or split["neto"] > best["neto"] + 1e-9:
+            best = split
+
+    best["neto_solo_dividendos"] = _split_result(engine, region, profit, 0.0, admin_ss_rate, is_rate)["neto"]
+    best["tipo_is"] = is_rate
+    return best
+
+
+def optimize_admin_salary_batch(engine, profiles, admin_ss_rate=None):
+    """
+    Versión vectorizada para carteras completas.
+    profiles: DataFrame o dict de arrays con autonomo_gross, autonomo_expenses y,
+    opcionalmente, region e is_new_company (mismas columnas que run_simulation_batch).
+    Devuelve arrays admin_salary_gross, sl_neto y sl_neto_solo_dividendos.
+    """
+    if admin_ss_rate is None:
+        admin_ss_rate = admin_ss_rate_for(engine)
+    autonomo_gross = np.asarray(profiles["autonomo_gross"], dtype=np.float64)
+    n = len(autonomo_gross)
+    profit = autonomo_gross - np.asarray(profiles["autonomo_expenses"], dtype=np.float64) - SS_SOCIETARIO
+    region = np.asarray(profiles["region"]) if "region" in profiles else np.full(n, "Madrid", dtype=object)
+    is_new_company = (np.asarray(profiles["is_new_company"], dtype=bool) if "is_new_company" in profiles
+                      else np.zeros(n, dtype=bool))
+    is_rate = np.where(is_new_company, engine.data["is_rates"]["new_entity"], engine.data["is_rates"]["general"])
+
+    best_salary = np.zeros(n)
+    best_net = np.full(n, -np.inf)
+    baseline = np.zeros(n)
+
+    unique_regions, inverse = np.unique(region.astype(str), return_inverse=True)
+    for k, name in enumerate(unique_regions):
+        rows = np.flatnonzero(inverse == k)
+        regional = engine.dataset.regional_table(name)
+        p = np.maximum(profit[rows], 0)[:, None]
+        rate = is_rate[rows][:, None]
+
+        # Matriz filas x candidatos: extremos, límites IRPF y límites del ahorro
+        irpf_points = (np.array(engine.dataset.state_table.limits() + regional.limits() + [0.0])
+                       + WORK_INCOME_REDUCTION) / (1 - admin_ss_rate)
+        savings_points = p - np.array(engine.dataset.savings_table.limits()) / (1 - rate)
+        candidates = np.concatenate([
+            np.zeros_like(p), p, np.broadcast_to(irpf_points, (len(rows), len(irpf_points))), savings_points,
+        ], axis=1)
+        candidates = np.clip(candidates, 0, p)
+
+        salary = candidates
+        admin_ss = salary * admin_ss_rate
+        base = np.maximum(salary - admin_ss - WORK_INCOME_REDUCTION, 0)
+        admin_irpf = engine.dataset.state_table.tax_array(base) + regional.tax_array(base)
+        corporate_profit_base = profit[rows][:, None] - salary
+        corporate_tax = np.maximum(corporate_profit_base * rate, 0)
+        dividend_gross = corporate_profit_base - corporate_tax
+        net = (salary - admin_ss - admin_irpf) + dividend_gross - engine.dataset.savings_table.tax_array(dividend_gross)
+
+        # argmax devuelve el primer máximo; la columna 0 es salario 0 (run_simulation)
+        best = np.argmax(net >= net.max(axis=1, keepdims=True) - 1e-9, axis=1)
+        best_salary[rows] = salary[np.arange(len(rows)), best]
+        best_net[rows] = net[np.arange(len(rows)), best]
+        baseline[rows] = net[:, 0]
+
+    return {
+        "admin_salary_gross": _round_cents(best_salary),
+        "sl_neto": _round_cents(best_net),
+        "sl_neto_solo_dividendos": _round_cents(baseline),
+    }
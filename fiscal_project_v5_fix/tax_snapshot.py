@@ -0,0 +1,131 @@
+"""
+Paso de compilación de los datos fiscales.
+
+    python tax_snapshot.py                 # valida y compila todos los tax_data*.json
+    python tax_snapshot.py --check         # solo valida
+    python tax_snapshot.py tax_data.json   # un fichero concreto
+
+Cada tax_data*.json se valida (límites crecientes, "mas_de" final, tipos en [0, 1],
+tabla "Otros" y cobertura RETA) y se guarda junto a él un .snapshot binario (pickle)
+con los datos y las tablas ya compiladas (límites, tipos, cuota acumulada por límite,
+índice de comunidades y tramos RETA). El registro de datos carga el snapshot en lugar
+del JSON si su huella SHA-256 coincide con la del JSON actual y se compiló con el mismo
+código de tax_tables.py; si no, vuelve al JSON.
+Los snapshots son artefactos de build locales: no se cargan de fuentes no confiables.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import pickle
+import sys
+import tempfile
+
+import tax_tables
+from tax_tables import TaxDataset, validate_tax_data
+
+SNAPSHOT_SUFFIX = ".snapshot"
+FORMAT_VERSION = 1
+
+
+def _code_version(module):
+    with open(module.__file__, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:8]
+
+
+# Las tablas compiladas dependen del código que las genera: un snapshot de otra
+# versión de tax_tables.py se descarta aunque el JSON no haya cambiado
+COMPILER_VERSION = _code_version(tax_tables)
+
+# Errores de un snapshot ilegible o de otra versión del código (se vuelve al JSON)
+_STALE_SNAPSHOT_ERRORS = (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, IndexError,
+                          TypeError, ValueError)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def snapshot_path(json_path):
+    return os.path.splitext(json_path)[0] + SNAPSHOT_SUFFIX
+
+
+def fingerprint(raw):
+    return hashlib.sha256(raw).hexdigest()
+
+
+def compile_snapshot(json_path, output=None):
+    """Valida json_path y escribe su snapshot (ValueError si los datos no son válidos)."""
+    with open(json_path, "rb") as f:
+        raw = f.read()
+    data = json.loads(raw)
+    dataset = TaxDataset(data, source=json_path)  # valida y compila
+
+    output = output or snapshot_path(json_path)
+    payload = {
+        "format": FORMAT_VERSION,
+        "compiler": COMPILER_VERSION,
+        "source_sha256": fingerprint(raw),
+        "data": data,
+        "compiled": dataset.compiled_arrays(),
+    }
+    # Escritura atómica: un proceso que arranca nunca ve un snapshot a medias
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, output)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return output
+
+
+def load_snapshot(json_path, raw=None):
+    """
+    (data, compiled) del snapshot de json_path, o None si no existe, es de otro formato
+    o de otro código de compilación, o está desfasado respecto al JSON (raw: bytes del
+    JSON si ya se han leído).
+    """
+    path = snapshot_path(json_path)
+    try:
+        with open(path, "rb") as f:
+            payload = pickle.load(f)
+    except _STALE_SNAPSHOT_ERRORS:
+        return None
+    if not isinstance(payload, dict) or payload.get("format") != FORMAT_VERSION:
+        return None
+    if payload.get("compiler") != COMPILER_VERSION:
+        return None
+    if raw is None:
+        with open(json_path, "rb") as f:
+            raw = f.read()
+    if payload.get("source_sha256") != fingerprint(raw):
+        return None
+    return payload["data"], payload["compiled"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Valida y compila los datos fiscales a snapshots binarios")
+    parser.add_argument("paths", nargs="*", help="ficheros tax_data (por defecto, todos los tax_data*.json)")
+    parser.add_argument("--check", action="store_true", help="solo valida, sin escribir snapshots")
+    args = parser.parse_args(argv)
+
+    paths = args.paths or sorted(glob.glob(os.path.join(BASE_DIR, "tax_data*.json")))
+    failed = 0
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            errors = validate_tax_data(json.load(f))
+        if errors:
+            failed += 1
+            print(f"ERROR {path}:")
+            for error in errors:
+                print(f"  - {error}")
+        elif args.check:
+            print(f"OK {path}")
+        else:
+            print(f"OK {path} -> {compile_snapshot(path)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,346 @@
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+DEFAULT_REGION_TABLE = "Otros (Ceuta/Melilla/Resto)"
+
+
+def _freeze_arrays(*arrays):
+    # Las tablas se comparten entre motores e hilos: nadie debe poder modificarlas
+    for array in arrays:
+        array.flags.writeable = False
+
+
+class BracketTable:
+    """
+    Tabla progresiva compilada a arrays.
+    lowers[i] es el límite inferior del tramo i, rates[i] su tipo y cumulative[i]
+    la cuota acumulada de todos los tramos anteriores a lowers[i].
+    """
+
+    def __init__(self, table):
+        lowers = []
+        rates = []
+        previous_limit = 0
+        has_top = False
+
+        for bracket in table:
+            if "hasta" in bracket:
+                lowers.append(previous_limit)
+                rates.append(bracket["tipo"])
+                previous_limit = bracket["hasta"]
+            elif "mas_de" in bracket:
+                # Tramo superior: como en el cálculo original, empieza en el último "hasta"
+                lowers.append(previous_limit)
+                rates.append(bracket["tipo"])
+                has_top = True
+                break
+
+        if not has_top:
+            # Sin tramo "mas_de" la base que supera el último límite no tributa
+            lowers.append(previous_limit)
+            rates.append(0.0)
+
+        lowers = np.asarray(lowers, dtype=np.float64)
+        rates = np.asarray(rates, dtype=np.float64)
+        cumulative = np.concatenate(([0.0], np.cumsum(np.diff(lowers) * rates[:-1])))
+        self._set_arrays(lowers, rates, cumulative)
+
+    @classmethod
+    def from_arrays(cls, lowers, rates, cumulative):
+        """Tabla ya compilada (p.ej. desde un snapshot): sin recalcular la cuota acumulada."""
+        table = cls.__new__(cls)
+        table._set_arrays(np.asarray(lowers, dtype=np.float64), np.asarray(rates, dtype=np.float64),
+                          np.asarray(cumulative, dtype=np.float64))
+        return table
+
+    def arrays(self):
+        return self.lowers, self.rates, self.cumulative
+
+    def limits(self):
+        """Límites entre tramos (los límites inferiores salvo el 0 inicial), como lista."""
+        return self._lowers[1:]
+
+    def _set_arrays(self, lowers, rates, cumulative):
+        self.lowers = lowers
+        self.rates = rates
+        self.cumulative = cumulative
+        _freeze_arrays(self.lowers, self.rates, self.cumulative)
+
+        # Copias en listas de Python: bisect sobre listas es más rápido que numpy para un único valor
+        self._lowers = self.lowers.tolist()
+        self._rates = self.rates.tolist()
+        self._cumulative = self.cumulative.tolist()
+
+    def tax(self, base):
+        """Cuota para una base: búsqueda binaria del tramo más una multiplicación-suma."""
+        if base <= 0:
+            return 0
+        i = bisect_right(self._lowers, base) - 1
+        return self._cumulative[i] + (base - self._lowers[i]) * self._rates[i]
+
+    def tax_array(self, bases):
+        """Cuota para un array de bases (las bases negativas no tributan)."""
+        bases = np.maximum(np.asarray(bases, dtype=np.float64), 0)
+        idx = np.searchsorted(self.lowers, bases, side="right") - 1
+        return self.cumulative[idx] + (bases - self.lowers[idx]) * self.rates[idx]
+
+
+class RegionalMatrix:
+    """
+    Todas las tablas autonómicas en matrices (comunidades x tramos), rellenadas por la
+    derecha con límite inferior +inf: los huecos nunca se eligen como tramo. Evalúa
+    la escala de todas las comunidades para un array de bases en una operación.
+    """
+
+    # Filas por bloque en tax_matrix (la comparación intermedia es filas x comunidades x tramos)
+    CHUNK_ROWS = 65536
+
+    def __init__(self, tables):
+        """tables: dict comunidad -> BracketTable (en el orden de las columnas)."""
+        self.regions = tuple(tables)
+        shape = (len(self.regions), max(len(t.lowers) for t in tables.values()))
+        self.lowers = np.full(shape, np.inf)
+        self.rates = np.zeros(shape)
+        self.cumulative = np.zeros(shape)
+        for r, table in enumerate(tables.values()):
+            k = len(table.lowers)
+            self.lowers[r, :k] = table.lowers
+            self.rates[r, :k] = table.rates
+            self.cumulative[r, :k] = table.cumulative
+        _freeze_arrays(self.lowers, self.rates, self.cumulative)
+        self._rows = np.arange(len(self.regions))[None, :]
+
+    def tax_matrix(self, bases):
+        """Cuota (n, comunidades) para un array de bases (n,); las bases negativas no tributan."""
+        bases = np.maximum(np.asarray(bases, dtype=np.float64), 0)
+        result = np.empty((len(bases), len(self.regions)))
+        for start in range(0, len(bases), self.CHUNK_ROWS):
+            chunk = bases[start:start + self.CHUNK_ROWS]
+            # Mismo tramo que searchsorted(side="right") - 1 en cada comunidad
+            idx = (self.lowers[None, :, :] <= chunk[:, None, None]).sum(axis=2) - 1
+            result[start:start + len(chunk)] = (
+                self.cumulative[self._rows, idx]
+                + (chunk[:, None] - self.lowers[self._rows, idx]) * self.rates[self._rows, idx]
+            )
+        return result
+
+
+class RetaTable:
+    """
+    Tramos RETA compilados y validados al cargar.
+    Cada tramo cubre [ingresos_min, ingresos_max] de rendimiento neto mensual; en el
+    límite compartido entre dos tramos se aplica el inferior (como en el cálculo original).
+    Fuera de la tabla (rendimientos negativos o por encima del último tramo) se aplica
+    el tramo superior de los datos, que sustituye al 590 fijo del cálculo original.
+    """
+
+    # Hueco admitido entre ingresos_max y el siguiente ingresos_min (tablas con 670 / 670,01)
+    GAP_TOLERANCE = 0.01
+
+    def __init__(self, tramos):
+        if not tramos:
+            raise ValueError("RETA table has no tramos")
+        tramos = sorted(tramos, key=lambda t: t["ingresos_min"])
+        for i, tramo in enumerate(tramos):
+            cuota = tramo["cuota"]
+            if isinstance(cuota, bool) or not isinstance(cuota, (int, float)):
+                raise ValueError(f"RETA tramo {i}: non-numeric cuota {cuota!r}")
+            if tramo["ingresos_max"] < tramo["ingresos_min"]:
+                raise ValueError(f"RETA tramo {i}: ingresos_max below ingresos_min")
+            if i:
+                previous_max = tramos[i - 1]["ingresos_max"]
+                if tramo["ingresos_min"] < previous_max:
+                    raise ValueError(f"RETA tramo {i} overlaps the previous one ({tramo['ingresos_min']} < {previous_max})")
+                if tramo["ingresos_min"] - previous_max > self.GAP_TOLERANCE:
+                    raise ValueError(f"RETA gap between {previous_max} and {tramo['ingresos_min']}")
+
+        self._set_arrays(
+            np.array([t["ingresos_min"] for t in tramos], dtype=np.float64),
+            np.array([t["ingresos_max"] for t in tramos], dtype=np.float64),
+            np.array([t["cuota"] for t in tramos], dtype=np.float64),
+        )
+
+    @classmethod
+    def from_arrays(cls, lowers, uppers, quotas):
+        table = cls.__new__(cls)
+        table._set_arrays(*(np.asarray(a, dtype=np.float64) for a in (lowers, uppers, quotas)))
+        return table
+
+    def arrays(self):
+        return self.lowers, self.uppers, self.quotas
+
+    def _set_arrays(self, lowers, uppers, quotas):
+        self.lowers = lowers
+        self.uppers = uppers
+        self.quotas = quotas
+        _freeze_arrays(self.lowers, self.uppers, self.quotas)
+
+        self._uppers = self.uppers.tolist()
+        self._quotas = self.quotas.tolist()
+        self._last = len(self._quotas) - 1
+        self._first_lower = float(self.lowers[0])
+
+    def tramo_index(self, monthly_yield):
+        """Tramo aplicado: primero cuyo ingresos_max cubre el rendimiento (búsqueda binaria)."""
+        if monthly_yield < self._first_lower:
+            return self._last
+        i = bisect_left(self._uppers, monthly_yield)
+        # Dentro de un hueco tolerado se aplica el tramo siguiente; por encima del último, el último
+        return i if i < self._last else self._last
+
+    def tramo_index_array(self, monthly_yields):
+        monthly_yields = np.asarray(monthly_yields, dtype=np.float64)
+        idx = np.minimum(np.searchsorted(self.uppers, monthly_yields, side="left"), self._last)
+        return np.where(monthly_yields < self._first_lower, self._last, idx)
+
+    def monthly_quota(self, monthly_yield):
+        return self._quotas[self.tramo_index(monthly_yield)]
+
+    def annual_quota(self, net_yield):
+        return self.monthly_quota(net_yield / 12) * 12
+
+    def annual_quota_array(self, net_yields):
+        return self.quotas[self.tramo_index_array(np.asarray(net_yields, dtype=np.float64) / 12)] * 12
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _bracket_errors(name, table):
+    """Límites "hasta" crecientes, un único "mas_de" al final (igual al último límite) y tipos en [0, 1]."""
+    if not table:
+        return [f"{name}: empty table"]
+    errors = []
+    previous = 0
+    for i, bracket in enumerate(table):
+        where = f"{name}[{i}]"
+        rate = bracket.get("tipo")
+        if not _is_number(rate) or not 0 <= rate <= 1:
+            errors.append(f"{where}: tipo {rate!r} outside [0, 1]")
+        if ("hasta" in bracket) == ("mas_de" in bracket):
+            errors.append(f"{where}: needs exactly one of 'hasta' or 'mas_de'")
+        elif "mas_de" in bracket:
+            if i != len(table) - 1:
+                errors.append(f"{where}: 'mas_de' must be the last bracket")
+            elif bracket["mas_de"] != previous:
+                errors.append(f"{where}: 'mas_de' {bracket['mas_de']!r} does not match the last limit {previous}")
+        else:
+            limit = bracket["hasta"]
+            if not _is_number(limit) or limit <= previous:
+                errors.append(f"{where}: 'hasta' {limit!r} is not above the previous limit {previous}")
+            else:
+                previous = limit
+    if "mas_de" not in table[-1]:
+        errors.append(f"{name}: last bracket must be 'mas_de' (income above {previous} would not be taxed)")
+    return errors
+
+
+def validate_tax_data(data):
+    """Lista de errores de un tax_data (vacía si es válido)."""
+    errors = []
+    for key in ("tax_year", "irpf_table_estatal", "irpf_tables_autonomicas", "is_rates", "ahorro_table"):
+        if key not in data:
+            errors.append(f"missing key {key!r}")
+    if errors:
+        return errors
+
+    if not isinstance(data["tax_year"], int) or isinstance(data["tax_year"], bool):
+        errors.append(f"tax_year {data['tax_year']!r} is not an integer")
+    errors += _bracket_errors("irpf_table_estatal", data["irpf_table_estatal"])
+    errors += _bracket_errors("ahorro_table", data["ahorro_table"])
+
+    regions = data["irpf_tables_autonomicas"]
+    if DEFAULT_REGION_TABLE not in regions:
+        errors.append(f"irpf_tables_autonomicas: missing fallback table {DEFAULT_REGION_TABLE!r}")
+    for region, table in regions.items():
+        errors += _bracket_errors(f"irpf_tables_autonomicas[{region!r}]", table)
+
+    for key in ("general", "new_entity"):
+        rate = data["is_rates"].get(key)
+        if not _is_number(rate) or not 0 <= rate <= 1:
+            errors.append(f"is_rates[{key!r}]: {rate!r} outside [0, 1]")
+    for key, rate in data.get("ss_rates", {}).items():
+        if not _is_number(rate) or not 0 <= rate < 1:
+            errors.append(f"ss_rates[{key!r}]: {rate!r} outside [0, 1)")
+
+    try:
+        tramos = data[reta_key(data)]["tramos"]
+        RetaTable(tramos)
+        if min(t["ingresos_min"] for t in tramos) > 0:
+            errors.append("RETA: tramos do not cover net yields from 0")
+    except (KeyError, TypeError, ValueError) as e:
+        errors.append(f"RETA: {e}")
+    return errors
+
+
+def check_tax_data(data, source=None):
+    """ValueError con todos los errores si el tax_data no es válido."""
+    errors = validate_tax_data(data)
+    if errors:
+        raise ValueError(f"Invalid tax data{f' ({source})' if source else ''}:\n  - " + "\n  - ".join(errors))
+
+
+def reta_key(data):
+    """Clave del bloque RETA del año: reta_<año>, reta_<año>_provisional o, si no, la primera reta_*."""
+    year = data.get("tax_year")
+    for key in (f"reta_{year}", f"reta_{year}_provisional"):
+        if key in data:
+            return key
+    for key in data:
+        if key.startswith("reta_"):
+            return key
+    raise KeyError("No RETA block (reta_*) in tax data")
+
+
+class TaxDataset:
+    """
+    Un año/escenario de tax_data.json ya compilado.
+    data es la versión de solo lectura del JSON; el resto son las tablas compiladas
+    que comparten todos los FiscalEngine que usan el mismo dataset.
+    """
+
+    def __init__(self, data, source=None, compiled=None):
+        """compiled: arrays de compiled_arrays() (snapshot ya validado); si no, se valida y compila data."""
+        if compiled is None:
+            check_tax_data(data, source)
+        self.data = data
+        self.source = source
+        self.version = data.get("tax_year")
+        self.year = self.version
+        self.scenario = data.get("scenario", "base")
+        self.reta_key = reta_key(data)
+
+        if compiled is None:
+            self.state_table = BracketTable(data["irpf_table_estatal"])
+            self.regional_tables = {
+                name: BracketTable(table) for name, table in data["irpf_tables_autonomicas"].items()
+            }
+            self.savings_table = BracketTable(data["ahorro_table"])
+            self.reta_table = RetaTable(data[self.reta_key]["tramos"])
+        else:
+            self.state_table = BracketTable.from_arrays(*compiled["state"])
+            self.regional_tables = {
+                name: BracketTable.from_arrays(*arrays) for name, arrays in zip(compiled["regions"], compiled["regional"])
+            }
+            self.savings_table = BracketTable.from_arrays(*compiled["savings"])
+            self.reta_table = RetaTable.from_arrays(*compiled["reta"])
+
+        # Posición de cada comunidad (orden de tax_data) y todas sus escalas en una matriz
+        self.region_index = {name: i for i, name in enumerate(self.regional_tables)}
+        self.regional_matrix = RegionalMatrix(self.regional_tables)
+
+    def compiled_arrays(self):
+        """Tablas compiladas como arrays (lo que guarda el snapshot binario)."""
+        return {
+            "state": self.state_table.arrays(),
+            "regions": tuple(self.regional_tables),
+            "regional": [table.arrays() for table in self.regional_tables.values()],
+            "savings": self.savings_table.arrays(),
+            "reta": self.reta_table.arrays(),
+        }
+
+    def regional_table(self, region):
+        """Tabla autonómica compilada, con fallback a "Otros" si la comunidad no existe."""
+        return self.regional_tables.get(region, self.regional_tables[DEFAULT_REGION_TABLE])
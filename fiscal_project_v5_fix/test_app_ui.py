@@ -0,0 +1,27 @@
+from streamlit.testing.v1 import AppTest
+
+from engine import FiscalEngine
+
+
+def _neto_metrics(at):
+    return [m.value for m in at.metric if m.label == "Neto en Bolsillo"]
+
+
+def test_results_render_live_and_follow_widgets():
+    at = AppTest.from_file("app_ui.py", default_timeout=30).run()
+    assert not at.exception
+
+    engine = FiscalEngine()
+    expected = engine.run_simulation(30000, int(30000 * 0.0635), int(30000 * 0.299), 0, 45000, 0, "Madrid")["results"]
+    assert _neto_metrics(at)[0] == f"{expected['asalariado']['neto']:,.2f} €"
+
+    at.session_state.expenses = [
+        {"description": f"Servidor cloud {i}", "amount": 100, "also_employee": False} for i in range(300)
+    ]
+    at.selectbox[0].select("Cataluña").run()
+    assert not at.exception
+
+    expected = engine.run_simulation(30000, int(30000 * 0.0635), int(30000 * 0.299), 0, 45000, 30000,
+                                     "Cataluña")["results"]
+    assert _neto_metrics(at)[2] == f"{expected['sociedad_limitada']['neto']:,.2f} €"
+    assert at.metric[0].value.endswith("/10")
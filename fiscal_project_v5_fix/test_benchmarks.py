@@ -0,0 +1,37 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+
+import harness  # noqa: E402
+
+
+def _stats(median):
+    return {"min": median, "median": median, "mean": median, "number": 1, "repeat": 1}
+
+
+def test_compare_flags_only_cases_over_threshold():
+    baseline = {"fast": _stats(1.0), "slow": _stats(1.0), "gone": _stats(1.0)}
+    results = {"fast": _stats(1.1), "slow": _stats(1.5), "new": _stats(9.0)}
+    assert harness.compare(results, baseline, threshold=0.2) == [("slow", 1.0, 1.5, 1.5)]
+    assert harness.compare(results, baseline, threshold=0.05) == [("fast", 1.0, 1.1, 1.1), ("slow", 1.0, 1.5, 1.5)]
+
+
+def test_main_fails_on_regression_against_saved_baseline(tmp_path, monkeypatch, capsys):
+    baseline = str(tmp_path / "baseline.json")
+    monkeypatch.setattr(harness, "run", lambda *args: {"case": _stats(1.0)})
+    assert harness.main(["--baseline", baseline, "--save-baseline"]) == 0
+    assert harness.main(["--baseline", baseline]) == 0
+
+    monkeypatch.setattr(harness, "run", lambda *args: {"case": _stats(1.3)})
+    assert harness.main(["--baseline", baseline]) == 1
+    assert "REGRESIÓN case" in capsys.readouterr().out
+    assert harness.main(["--baseline", baseline, "--threshold", "0.5"]) == 0
+
+
+def test_committed_baseline_is_readable():
+    with open(harness.DEFAULT_BASELINE, encoding="utf-8") as f:
+        results = json.load(f)["results"]
+    assert "engine.run_simulation" in results
+    assert all(stats["median"] > 0 for stats in results.values())
@@ -0,0 +1,61 @@
+import random
+
+from breakeven import REGIMES, _crossings, evaluate_curve, solve_break_even
+from engine import FiscalEngine
+
+
+def test_curves_match_engine():
+    engine = FiscalEngine()
+    rng = random.Random(1)
+    for region, expenses in (("Madrid", 5000), ("Cataluña", 0), ("Atlántida", 20000)):
+        result = solve_break_even(engine, region, autonomo_expenses=expenses, income_max=400000)
+        for _ in range(300):
+            x = rng.uniform(0, 400000)
+            expected = engine.net_incomes(x, x * 0.0635, 0, x, expenses, region)
+            for regime, value in zip(REGIMES, expected):
+                assert abs(evaluate_curve(result["curves"][regime], x) - value) < 1e-6, (region, regime, x)
+
+
+def test_break_even_points_match_brute_force_sweep():
+    engine = FiscalEngine()
+    result = solve_break_even(engine, "Madrid", autonomo_expenses=8000, income_max=300000)
+    points = result["break_even"]
+    assert points
+
+    for point in points:
+        first, second = point["regimes"]
+        i, j = REGIMES.index(first), REGIMES.index(second)
+        x = point["income"]
+        below = engine.net_incomes(x - 5, (x - 5) * 0.0635, 0, x - 5, 8000, "Madrid")
+        above = engine.net_incomes(x + 5, (x + 5) * 0.0635, 0, x + 5, 8000, "Madrid")
+        winner_above = first if above[i] > above[j] else second
+        assert winner_above == point["above"]
+        assert (below[i] > below[j]) != (above[i] > above[j])
+
+    # Cada cambio de signo del barrido cae cerca de un punto calculado
+    step = 50
+    for first, second in (("autonomo", "sociedad_limitada"), ("asalariado", "autonomo")):
+        i, j = REGIMES.index(first), REGIMES.index(second)
+        computed = [p["income"] for p in points if p["regimes"] == (first, second)]
+        previous = None
+        for x in range(step, 300000, step):
+            nets = engine.net_incomes(x, x * 0.0635, 0, x, 8000, "Madrid")
+            sign = nets[i] > nets[j]
+            if previous is not None and sign != previous:
+                assert any(x - step <= c <= x for c in computed), (first, second, x)
+            previous = sign
+
+
+def test_crossing_exactly_at_a_cut_point():
+    # Diferencia x - 10: vale 0 justo en el corte entre los dos tramos
+    first = [(0, 10, 1, -10), (10, 20, 1, -10)]
+    second = [(0, 10, 0, 0), (10, 20, 0, 0)]
+    assert _crossings(first, second, "a", "b") == [{"income": 10, "regimes": ("a", "b"), "above": "a"}]
+
+    # Salto a 0 en el corte y cambio de signo en el tramo siguiente
+    first = [(0, 10, 0, 5), (10, 20, -1, 10)]
+    assert _crossings(first, second, "a", "b") == [{"income": 10, "regimes": ("a", "b"), "above": "b"}]
+
+    # Toca 0 sin cambiar de signo: no es un cruce
+    first = [(0, 10, -1, 10), (10, 20, 1, -10)]
+    assert _crossings(first, second, "a", "b") == []
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from cashflow import simulate_timeline
+from engine import FiscalEngine
+
+INCOME = np.array([4000, 4000, 9000, 2000, 6000, 6000, 0, 3000, 8000, 5000, 5000, 12000], dtype=float)
+EXPENSES = np.full(12, 800.0)
+
+
+def test_timeline_adds_up_to_annual_results():
+    engine = FiscalEngine()
+    timeline = simulate_timeline(engine, INCOME, EXPENSES, region="Valencia")
+    gross, expenses = INCOME.sum(), EXPENSES.sum()
+    annual = engine.run_simulation(gross, gross * 0.0635, 0, 0, gross, expenses, "Valencia")["results"]
+
+    assert timeline["asalariado"]["flujo"].shape == (12,)
+    assert timeline["asalariado"]["neto_caja"] == pytest.approx(annual["asalariado"]["neto"], abs=0.02)
+    assert timeline["sociedad_limitada"]["neto_caja"] == pytest.approx(annual["sociedad_limitada"]["neto"], abs=0.02)
+
+    autonomo = annual["autonomo"]
+    cash = gross - expenses - autonomo["reta"] - autonomo["irpf"]
+    assert timeline["autonomo"]["neto_caja"] == pytest.approx(cash, abs=0.02)
+    assert timeline["autonomo"]["acumulado"][-1] == pytest.approx(timeline["autonomo"]["flujo"].sum(), abs=0.01)
+
+
+def test_quarterly_payments_fall_in_their_months():
+    engine = FiscalEngine()
+    timeline = simulate_timeline(engine, np.full(12, 5000.0), np.full(12, 1000.0))
+    reta = engine.calculate_reta(48000) / 12
+
+    taxes = timeline["autonomo"]["impuestos"] - round(reta, 2)
+    assert np.flatnonzero(np.abs(taxes) > 0.01).tolist() == [3, 6, 9]
+    q1_yield = 3 * (4000 - reta)
+    assert taxes[3] == pytest.approx(0.2 * (q1_yield - q1_yield * 0.07), abs=0.01)
+
+    sl_taxes = timeline["sociedad_limitada"]["impuestos"] - 375
+    assert np.flatnonzero(np.abs(sl_taxes) > 0.01).tolist() == [3, 9, 11]
+    assert sl_taxes[3] == pytest.approx(0.17 * 3 * (4000 - 375), abs=0.01)
+
+
+def test_portfolio_matches_single_client_rows():
+    engine = FiscalEngine()
+    rng = np.random.default_rng(5)
+    income = rng.uniform(0, 15000, (50, 12))
+    expenses = rng.uniform(0, 3000, (50, 12))
+    regions = rng.choice(["Madrid", "Cataluña", "Andalucía"], 50)
+    new = rng.random(50) < 0.5
+
+    portfolio = simulate_timeline(engine, income, expenses, region=regions, is_new_company=new)
+    for i in (0, 17, 49):
+        single = simulate_timeline(engine, income[i], expenses[i], region=regions[i], is_new_company=new[i])
+        for regime, columns in single.items():
+            for name, values in columns.items():
+                np.testing.assert_allclose(portfolio[regime][name][i], values, atol=0.01)
+
+    with pytest.raises(ValueError):
+        simulate_timeline(engine, np.zeros((2, 11)), 0)
+
+
+def test_scalar_income_returns_single_client_rows():
+    engine = FiscalEngine()
+    scalar = simulate_timeline(engine, 60000, 12000)
+    monthly = simulate_timeline(engine, np.full(12, 5000.0), np.full(12, 1000.0))
+
+    for regime, columns in monthly.items():
+        for name, values in columns.items():
+            assert np.shape(scalar[regime][name]) == np.shape(values)
+            np.testing.assert_allclose(scalar[regime][name], values)
@@ -0,0 +1,241 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import pytest
+
+import data_registry
+from engine import FiscalEngine
+from dgt_classifier import DGTAnalyzer
+import tax_snapshot
+from tax_tables import TaxDataset, reta_key, validate_tax_data
+
+
+def test_engines_share_one_frozen_dataset():
+    first = FiscalEngine()
+    second = FiscalEngine("tax_data.json")
+    assert first.dataset is second.dataset
+    assert first.data["tax_year"] == 2026
+
+    with pytest.raises(TypeError):
+        first.data["tax_year"] = 2027
+    with pytest.raises(ValueError):
+        first._state_table.rates[0] = 0.5
+
+
+def test_concurrent_loads_return_same_instance():
+    data_registry.clear()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(data_registry.get_tax_dataset())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(r is results[0] for r in results)
+
+
+def test_reloads_only_when_file_changes(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"deduccion_total_keywords": ["aws"]}), encoding="utf-8")
+
+    first = data_registry.load_json(str(path))
+    assert data_registry.load_json(str(path)) is first
+
+    path.write_text(json.dumps({"deduccion_total_keywords": ["aws", "gcp"]}), encoding="utf-8")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    second = data_registry.load_json(str(path))
+    assert second is not first
+    assert second["deduccion_total_keywords"] == ("aws", "gcp")
+    assert data_registry.thaw(second) == {"deduccion_total_keywords": ["aws", "gcp"]}
+
+
+def test_memory_datasets_are_bounded(monkeypatch):
+    monkeypatch.setattr(data_registry, "MAX_MEMORY_DATASETS", 2)
+    monkeypatch.setattr(data_registry, "_memory_datasets", OrderedDict())
+    data = data_registry.thaw(data_registry.load_json("tax_data.json"))
+    first = data_registry.register_tax_dataset("v1", data)
+    data_registry.register_tax_dataset("v2", data)
+    assert data_registry.register_tax_dataset("v1", data) is first  # v1 pasa a ser la más reciente
+
+    data_registry.register_tax_dataset("v3", data)
+    assert list(data_registry._memory_datasets) == ["v1", "v3"]
+
+
+def test_analyzers_share_rules():
+    assert DGTAnalyzer().rules is DGTAnalyzer().rules
+
+
+def _write_year(directory, year, scenario=None, general_is=None):
+    data = data_registry.thaw(data_registry.load_json("tax_data.json"))
+    data["tax_year"] = year
+    if scenario:
+        data["scenario"] = scenario
+    if general_is is not None:
+        data["is_rates"]["general"] = general_is
+    name = f"tax_data_{year}{'_' + scenario if scenario else ''}.json"
+    with open(directory / name, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def _store(tmp_path):
+    _write_year(tmp_path, 2026)
+    _write_year(tmp_path, 2027, general_is=0.20)
+    _write_year(tmp_path, 2027, scenario="propuesta", general_is=0.10)
+    return data_registry.TaxDataStore.from_directory(str(tmp_path))
+
+
+def test_store_resolves_years_and_scenarios(tmp_path):
+    store = _store(tmp_path)
+    assert store.years() == [2026, 2027]
+    assert store.scenarios() == ["base", "propuesta"]
+    assert store.resolve_year() == 2027
+    with pytest.raises(KeyError):
+        store.resolve_year(2020)
+    # Un año sin datos posterior al último se rechaza, salvo en proyecciones (las reglas se arrastran)
+    with pytest.raises(KeyError, match="latest is 2027"):
+        store.resolve_year(2029)
+    assert store.resolve_year(2029, carry_forward=True) == 2027
+    assert store.dataset(2027, "propuesta").data["is_rates"]["general"] == 0.10
+
+
+def test_invalid_tax_file_only_breaks_its_own_year(tmp_path):
+    store_dir = tmp_path / "store"
+    store_dir.mkdir()
+    _write_year(store_dir, 2026)
+    (store_dir / "tax_data_2025.json").write_text(json.dumps({"tax_year": 2025}), encoding="utf-8")
+    (store_dir / "tax_data_broken.json").write_text("{not json", encoding="utf-8")
+
+    store = data_registry.TaxDataStore.from_directory(str(store_dir))
+    assert store.years() == [2025, 2026]
+    assert store.dataset(2026).year == 2026
+    with pytest.raises(ValueError, match="missing key"):
+        store.dataset(2025)
+
+
+def test_engine_per_year_simulation_and_batch(tmp_path):
+    store = _store(tmp_path)
+    engine = FiscalEngine(dataset=store.dataset(2026), store=store)
+    args = dict(employee_gross=40000, employee_ss=2540, company_ss=0, employee_personal_expenses=0,
+                autonomo_gross=90000, autonomo_expenses=10000)
+
+    sl_2026 = engine.run_simulation(**args)["results"]["sociedad_limitada"]
+    sl_2027 = engine.run_simulation(**args, year=2027)["results"]["sociedad_limitada"]
+    assert sl_2027["is"] < sl_2026["is"]
+    assert engine.for_year(2027) is engine.for_year(2028, carry_forward=True)
+    with pytest.raises(KeyError):
+        engine.run_simulation(**args, year=2028)
+
+    profiles = {
+        "employee_gross": [40000, 40000], "employee_ss": [2540, 2540],
+        "autonomo_gross": [90000, 90000], "autonomo_expenses": [10000, 10000], "year": [2027, 2026],
+    }
+    batch = engine.run_simulation_batch(profiles)
+    assert list(batch["sl_neto"]) == [sl_2027["neto"], sl_2026["neto"]]
+
+
+def test_projection_applies_new_company_years(tmp_path):
+    store = _store(tmp_path)
+    engine = FiscalEngine(dataset=store.dataset(2026), store=store)
+    projection = engine.run_projection([2026, 2027, 2028], employee_gross=40000, employee_ss=2540,
+                                       autonomo_gross=[80000, 90000, 100000], autonomo_expenses=10000,
+                                       new_company_years=2)
+
+    is_paid = [y["results"]["sociedad_limitada"]["is"] for y in projection["by_year"]]
+    assert is_paid[0] == round((80000 - 10000 - 4500) * 0.15, 2)
+    assert is_paid[1] == round((90000 - 10000 - 4500) * 0.15, 2)
+    assert is_paid[2] == round((100000 - 10000 - 4500) * 0.20, 2)
+    assert [y["tax_year"] for y in projection["by_year"]] == [2026, 2027, 2027]
+    assert projection["totals"]["autonomo"] == round(
+        sum(y["results"]["autonomo"]["neto"] for y in projection["by_year"]), 2)
+
+
+def test_validation_catches_broken_tables():
+    data = data_registry.thaw(data_registry.load_json("tax_data.json"))
+    assert validate_tax_data(data) == []
+
+    data["irpf_table_estatal"][2]["hasta"] = 10000  # límites no crecientes
+    data["ahorro_table"].pop()  # sin "mas_de": lo que supera 300.000 no tributaría
+    data["irpf_tables_autonomicas"]["Madrid"][0]["tipo"] = 9.5  # porcentaje en vez de tipo
+    del data["irpf_tables_autonomicas"]["Otros (Ceuta/Melilla/Resto)"]
+    data[reta_key(data)]["tramos"][0]["ingresos_min"] = 100  # RETA sin cubrir rendimientos bajos
+
+    errors = validate_tax_data(data)
+    assert len(errors) == 5
+    assert any("irpf_table_estatal[2]" in e for e in errors)
+    assert any("ahorro_table: last bracket must be 'mas_de'" in e for e in errors)
+    assert any("Madrid" in e and "tipo 9.5" in e for e in errors)
+    assert any("Otros" in e for e in errors)
+    assert any(e.startswith("RETA") for e in errors)
+    with pytest.raises(ValueError, match="Invalid tax data"):
+        TaxDataset(data)
+
+
+def test_snapshot_is_loaded_while_it_matches_the_json(tmp_path, monkeypatch):
+    path = tmp_path / "tax_data.json"
+    data = data_registry.thaw(data_registry.load_json("tax_data.json"))
+    path.write_text(json.dumps(data), encoding="utf-8")
+    assert tax_snapshot.main([str(path)]) == 0
+
+    # Desde el snapshot no se vuelve a validar ni compilar
+    monkeypatch.setattr("tax_tables.check_tax_data", lambda *a: pytest.fail("JSON recompiled"))
+    compiled = data_registry.get_tax_dataset(str(path))
+    monkeypatch.undo()
+    reference = TaxDataset(data_registry.freeze(data))
+    for a, b in zip(compiled.compiled_arrays()["regional"], reference.compiled_arrays()["regional"]):
+        assert all((x == y).all() for x, y in zip(a, b))
+    assert compiled.regional_table("Cataluña").tax(75000) == reference.regional_table("Cataluña").tax(75000)
+    assert compiled.region_index["Madrid"] == list(data["irpf_tables_autonomicas"]).index("Madrid")
+    with pytest.raises(ValueError):
+        compiled.state_table.cumulative[1] = 0
+
+    # JSON cambiado sin recompilar: el snapshot desfasado se ignora
+    data["is_rates"]["general"] = 0.2
+    path.write_text(json.dumps(data), encoding="utf-8")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert tax_snapshot.load_snapshot(str(path)) is None
+    assert data_registry.get_tax_dataset(str(path)).data["is_rates"]["general"] == 0.2
+
+    # Datos inválidos: el build falla y no escribe snapshot
+    data["ahorro_table"].pop()
+    bad = tmp_path / "tax_data_bad.json"
+    bad.write_text(json.dumps(data), encoding="utf-8")
+    assert tax_snapshot.main([str(bad)]) == 1
+    assert not os.path.exists(tax_snapshot.snapshot_path(str(bad)))
+
+
+def test_snapshot_from_other_compiler_code_is_ignored(tmp_path, monkeypatch):
+    path = tmp_path / "tax_data.json"
+    path.write_text(json.dumps(data_registry.thaw(data_registry.load_json("tax_data.json"))), encoding="utf-8")
+    tax_snapshot.compile_snapshot(str(path))
+    assert tax_snapshot.load_snapshot(str(path)) is not None
+
+    # tax_tables.py cambió después de compilar: se vuelve al JSON
+    monkeypatch.setattr(tax_snapshot, "COMPILER_VERSION", "otro")
+    assert tax_snapshot.load_snapshot(str(path)) is None
+
+
+def test_unreadable_snapshot_falls_back_to_json(tmp_path):
+    path = tmp_path / "tax_data.json"
+    path.write_text(json.dumps(data_registry.thaw(data_registry.load_json("tax_data.json"))), encoding="utf-8")
+    # Protocolo de pickle que este Python no entiende: ValueError al cargar
+    with open(tax_snapshot.snapshot_path(str(path)), "wb") as f:
+        f.write(b"\x80\x09.")
+    assert tax_snapshot.load_snapshot(str(path)) is None
+    assert data_registry.get_tax_dataset(str(path)).data["tax_year"] == 2026
+
+
+def test_failed_snapshot_write_leaves_no_temp_file(tmp_path, monkeypatch):
+    path = tmp_path / "tax_data.json"
+    path.write_text(json.dumps(data_registry.thaw(data_registry.load_json("tax_data.json"))), encoding="utf-8")
+
+    def fail(*args, **kwargs):
+        raise OSError("disco lleno")
+
+    monkeypatch.setattr(tax_snapshot.pickle, "dump", fail)
+    with pytest.raises(OSError):
+        tax_snapshot.compile_snapshot(str(path))
+    assert sorted(os.listdir(tmp_path)) == ["tax_data.json"]
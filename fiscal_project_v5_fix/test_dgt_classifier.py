@@ -0,0 +1,315 @@
+import asyncio
+import io
+import json
+import random
+import threading
+import time
+
+import data_registry
+import rule_packs
+from classification_cache import ClassificationCache
+import classifier_backends
+from classifier_backends import AsyncLLMBackend, GeminiTransport
+from dgt_classifier import DGTAnalyzer, RULE_LISTS
+from keyword_matcher import KeywordMatcher
+from rule_packs import BASE_PACK, RulePackSet
+
+
+def _naive_match(groups, text):
+    for priority, keywords in enumerate(groups):
+        if any(k in text for k in keywords):
+            return priority
+    return None
+
+
+def test_matcher_agrees_with_naive_scan():
+    rng = random.Random(7)
+    alphabet = "abcde "
+    for _ in range(200):
+        groups = [
+            ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(0, 6))]
+            for _ in range(3)
+        ]
+        matcher = KeywordMatcher(groups)
+        for _ in range(20):
+            text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+            assert matcher.match(text) == _naive_match(groups, text), (groups, text)
+
+
+def test_overlapping_keywords_keep_priority():
+    # "internet" (parcial) contiene "net"; "cloud" (total) solapa con "clou" (conflictiva)
+    matcher = KeywordMatcher([["cloud", "net"], ["internet"], ["clou", "comida"]])
+    assert matcher.match("fibra internet") == 0
+    assert matcher.match("icloud") == 0
+    assert matcher.match("clou") == 2
+    assert matcher.match("nada") is None
+
+
+def test_analyzer_precedence_total_over_parcial_over_conflictiva():
+    dgt = DGTAnalyzer()
+    assert dgt._mock_llm_classification("Comida con cliente en casa", "6201")["category"] == "DEDUCCIÓN_PARCIAL"
+    assert dgt._mock_llm_classification("Hosting AWS viaje", "6201")["category"] == "DEDUCCIÓN_TOTAL"
+    assert dgt._mock_llm_classification("Cena Navidad", "6201")["confidence"] == 0.5
+
+    groups = [dgt.rules[name] for name in RULE_LISTS]
+    words = [k for group in groups for k in group]
+    rng = random.Random(3)
+    for _ in range(300):
+        text = " ".join(rng.sample(words, 2))
+        assert dgt.keyword_backend._matcher.match(text) == _naive_match(groups, text)
+
+
+LEDGER = [
+    {"description": "AWS Hosting", "amount": 200.0},
+    {"description": "Comida Cliente", "amount": 150.0},
+    {"description": "Factura Luz Casa", "amount": 100.0},
+    {"description": "Cena Navidad", "amount": 80.5},
+]
+
+
+def test_stream_matches_process_expenses(tmp_path):
+    dgt = DGTAnalyzer()
+    expected = dgt.process_expenses(LEDGER, "6201")
+
+    csv_path = tmp_path / "ledger.csv"
+    csv_path.write_text("description,amount\n" + "".join(
+        f"{e['description']},\"{str(e['amount']).replace('.', ',')}\"\n" for e in LEDGER), encoding="utf-8")
+    jsonl_path = tmp_path / "ledger.jsonl"
+    jsonl_path.write_text("\n".join(json.dumps(e) for e in LEDGER) + "\n\n", encoding="utf-8")
+
+    for source in (str(csv_path), jsonl_path):
+        stream = dgt.stream_expenses(source, "6201")
+        assert list(stream) == expected["analyzed_expenses"]
+        assert stream.fiscal_risk_score == expected["fiscal_risk_score"]
+        assert stream.total_deductible_suggested == expected["total_deductible_suggested"]
+
+    with open(jsonl_path, "rb") as f:
+        out = io.StringIO()
+        summary = dgt.stream_expenses(f, "6201", fmt="jsonl").write_jsonl(out)
+        assert not f.closed
+    assert summary["expenses_processed"] == len(LEDGER)
+    assert [json.loads(line) for line in out.getvalue().splitlines()] == expected["analyzed_expenses"]
+
+
+def test_classification_cache_shared_and_bounded(tmp_path):
+    cache = ClassificationCache(maxsize=2, path=str(tmp_path / "cache.sqlite"))
+    first, second = DGTAnalyzer(cache=cache), DGTAnalyzer(cache=cache)
+
+    first.analyze_expense({"description": "AWS Hosting", "amount": 10}, "6201")
+    result = second.analyze_expense({"description": "  aws   HOSTING", "amount": 20}, "6201")
+    assert result["category"] == "DEDUCCIÓN_TOTAL" and result["amount"] == 20
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Otro CNAE es otra entrada; la tercera clave desaloja la menos usada
+    second.analyze_expense({"description": "AWS Hosting", "amount": 10}, "5610")
+    second.analyze_expense({"description": "Fibra Movistar", "amount": 10}, "6201")
+    assert cache.stats()["size"] == 2 and cache.evictions == 1
+
+    # Tras reiniciar, la entrada desalojada sigue en SQLite
+    cache.close()
+    reopened = ClassificationCache(maxsize=2, path=str(tmp_path / "cache.sqlite"))
+    DGTAnalyzer(cache=reopened).analyze_expense({"description": "aws hosting", "amount": 1}, "6201")
+    assert reopened.disk_hits == 1 and reopened.misses == 0
+    reopened.close()
+
+
+def test_classification_cache_commits_once_per_batch(tmp_path):
+    cache = ClassificationCache(maxsize=10, path=str(tmp_path / "cache.sqlite"))
+    statements = []
+    cache._db.set_trace_callback(statements.append)
+
+    DGTAnalyzer(cache=cache).classify_descriptions(["AWS Hosting", "Fibra Movistar", "Comida", "aws hosting"], "6201")
+    assert statements.count("COMMIT") == 1
+    assert cache._db.execute("SELECT COUNT(*) FROM classifications").fetchone()[0] == 3
+    cache.close()
+
+
+def test_cache_key_includes_rules_version():
+    dgt = DGTAnalyzer(cache=False)
+    assert dgt.cache is None
+    assert dgt.rules_version != DGTAnalyzer(rules_path="missing_rules.json").rules_version
+
+
+class FakeLLM:
+    """Transporte falso con latencia configurable que cuenta las peticiones en vuelo."""
+
+    name = "fake"
+
+    def __init__(self, latency=0.01, category="DEDUCCIÓN_TOTAL"):
+        self.latency = latency
+        self.category = category
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, descriptions, cnae):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            return [{"category": self.category, "reason": "LLM", "confidence": 0.9} for _ in descriptions]
+        finally:
+            self.in_flight -= 1
+
+
+def test_async_backend_batches_and_limits_concurrency():
+    llm = FakeLLM(latency=0.02)
+    dgt = DGTAnalyzer(cache=False, backend=AsyncLLMBackend(llm, batch_size=100, max_concurrency=4))
+    ledger = [{"description": f"Gasto {i}", "amount": 1} for i in range(5000)]
+
+    start = time.perf_counter()
+    result = dgt.process_expenses(ledger, "6201")
+    elapsed = time.perf_counter() - start
+
+    assert llm.calls == 50 and llm.max_in_flight == 4
+    assert elapsed < 5 * 50 * llm.latency
+    assert {e["category"] for e in result["analyzed_expenses"]} == {"DEDUCCIÓN_TOTAL"}
+    assert result["total_deductible_suggested"] == 5000
+
+
+def test_async_backend_falls_back_to_rules_on_timeout():
+    cache = ClassificationCache(maxsize=100)
+    backend = AsyncLLMBackend(FakeLLM(latency=1.0), timeout=0.01)
+    dgt = DGTAnalyzer(cache=cache, backend=backend)
+    assert backend.fallback is dgt.keyword_backend
+
+    result = asyncio.run(dgt.aprocess_expenses(LEDGER, "6201"))
+    expected = DGTAnalyzer(cache=False).process_expenses(LEDGER, "6201")
+    assert result["analyzed_expenses"] == expected["analyzed_expenses"]
+    assert backend.fallbacks == 1
+    # Los resultados de fallback no se guardan en caché
+    assert cache.stats()["size"] == 0
+
+
+def test_async_backend_sync_call_inside_running_loop():
+    llm = FakeLLM()
+    dgt = DGTAnalyzer(cache=False, backend=AsyncLLMBackend(llm))
+
+    async def handler():
+        # p.ej. un framework asíncrono que llama a la API síncrona
+        return dgt.process_expenses(LEDGER, "6201")
+
+    result = asyncio.run(handler())
+    assert llm.calls == 1
+    assert len(result["analyzed_expenses"]) == len(LEDGER)
+
+
+def test_sync_call_returns_on_timeout_without_waiting_for_hung_thread():
+    release = threading.Event()
+
+    async def hung_transport(descriptions, cnae):
+        # Transporte bloqueante colgado (p.ej. urlopen sin respuesta)
+        await asyncio.to_thread(release.wait, 10)
+        return []
+
+    backend = AsyncLLMBackend(hung_transport, timeout=0.2)
+    dgt = DGTAnalyzer(cache=False, backend=backend)
+    try:
+        start = time.perf_counter()
+        result = dgt.process_expenses(LEDGER, "6201")
+        assert time.perf_counter() - start < 1.0
+        assert backend.fallbacks == 1 and len(result["analyzed_expenses"]) == len(LEDGER)
+    finally:
+        release.set()
+        backend.close()
+
+
+def test_concurrency_limit_is_shared_across_calls():
+    llm = FakeLLM(latency=0.05)
+    backend = AsyncLLMBackend(llm, batch_size=1, max_concurrency=2)
+    threads = [threading.Thread(target=backend.classify_batch, args=(["a", "b", "c"], "6201")) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    backend.close()
+    assert llm.calls == 12 and llm.max_in_flight == 2
+
+
+def test_gemini_transport_passes_its_timeout_to_urlopen(monkeypatch):
+    seen = {}
+
+    class Response(io.BytesIO):
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+    def urlopen(request, timeout=None):
+        seen["timeout"] = timeout
+        text = json.dumps([{"category": "DEDUCCIÓN_TOTAL", "reason": "LLM", "confidence": 0.9}])
+        return Response(json.dumps({"candidates": [{"content": {"parts": [{"text": text}]}}]}).encode("utf-8"))
+
+    monkeypatch.setattr(classifier_backends.urllib.request, "urlopen", urlopen)
+    assert len(GeminiTransport("key", timeout=5)._post("prompt")) == 1
+    assert seen["timeout"] == 5
+
+
+def test_llm_and_rule_results_use_distinct_cache_entries():
+    cache = ClassificationCache(maxsize=100)
+    DGTAnalyzer(cache=cache).process_expenses(LEDGER, "6201")
+    llm = FakeLLM(category="DEDUCCIÓN_CONFLICTIVA")
+    result = DGTAnalyzer(cache=cache, backend=AsyncLLMBackend(llm)).process_expenses(LEDGER, "6201")
+    assert llm.calls == 1
+    assert {e["category"] for e in result["analyzed_expenses"]} == {"DEDUCCIÓN_CONFLICTIVA"}
+
+
+def test_rule_packs_by_cnae_prefix():
+    dgt = DGTAnalyzer(cache=False)
+    packs = dgt.keyword_backend.packs
+    assert packs.pack_for("5610") == "56" and packs.pack_for("6201") == "62" and packs.pack_for("0111") == BASE_PACK
+
+    # El paquete manda sobre las listas generales
+    assert dgt.classify_descriptions(["Comida proveedores"], "5610")[0]["category"] == "DEDUCCIÓN_TOTAL"
+    assert dgt.classify_descriptions(["Comida proveedores"], "6201")[0]["category"] == "DEDUCCIÓN_CONFLICTIVA"
+    assert dgt.classify_descriptions(["Peaje AP-7"], "4941")[0]["category"] == "DEDUCCIÓN_TOTAL"
+    assert dgt.classify_descriptions(["Peaje AP-7"], "6201")[0]["reason"].startswith("No encontrado")
+
+
+def test_rule_packs_lru_and_pickle_cache(tmp_path):
+    packs_dir = tmp_path / "packs"
+    packs_dir.mkdir()
+    for prefix in ("1", "12", "123", "2"):
+        (packs_dir / f"{prefix}.json").write_text(json.dumps({RULE_LISTS[0]: [f"kw{prefix}"]}), encoding="utf-8")
+    base = {RULE_LISTS[2]: ["kw12", "ocio"]}
+    cache_dir = tmp_path / "compiled"
+
+    packs = RulePackSet(base, RULE_LISTS, str(packs_dir), maxsize=2, cache_dir=str(cache_dir))
+    assert [packs.pack_for(c) for c in ("1299", "1234", "1", "3")] == ["12", "123", "1", BASE_PACK]
+    assert packs.matcher("1299").match("kw12 ocio") == 0
+    assert packs.matcher("3").match("kw12 ocio") == 2
+    packs.matcher("2")
+    assert len(packs._compiled) == 2 and packs.compiles == 3
+
+    # Un arranque nuevo carga los autómatas del pickle en vez de recompilar
+    restarted = RulePackSet(base, RULE_LISTS, str(packs_dir), cache_dir=str(cache_dir))
+    assert restarted.matcher("1299").match("kw12") == 0
+    assert restarted.compiles == 0 and restarted.pickle_loads == 1
+
+    # Cambiar un paquete cambia la versión (clave de la caché de clasificaciones) y el pickle
+    (packs_dir / "12.json").write_text(json.dumps({RULE_LISTS[1]: ["kw12", "otra"]}), encoding="utf-8")
+    changed = RulePackSet(base, RULE_LISTS, str(packs_dir), cache_dir=str(cache_dir))
+    assert changed.version != packs.version
+    assert changed.matcher("12").match("kw12") == 1 and changed.compiles == 1
+
+
+def test_stale_rule_pack_pickles_are_rebuilt(tmp_path):
+    packs_dir = tmp_path / "packs"
+    packs_dir.mkdir()
+    (packs_dir / "1.json").write_text(json.dumps({RULE_LISTS[0]: ["kw1"]}), encoding="utf-8")
+    cache_dir = tmp_path / "compiled"
+    cache_dir.mkdir()
+    packs = RulePackSet({}, RULE_LISTS, str(packs_dir), cache_dir=str(cache_dir))
+    name = f"1-{rule_packs.MATCHER_VERSION}-{rule_packs._fingerprint(packs.rules_for('1'))}.pickle"
+
+    # Pickles de otra versión del código: clase renombrada y módulo que ya no existe
+    for stale in (b"ckeyword_matcher\nRemovedMatcher\n)\x81.", b"cmissing_module\nMatcher\n)\x81."):
+        (cache_dir / name).write_bytes(stale)
+        packs._compiled.clear()
+        assert packs.matcher("1").match("kw1") == 0
+    assert packs.compiles == 2 and packs.pickle_loads == 0
+
+    # El JSON del paquete no queda retenido en el registro compartido
+    assert str(packs_dir / "1.json") not in data_registry._json_cache
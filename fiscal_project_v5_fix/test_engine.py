@@ -0,0 +1,172 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine import FiscalEngine, BATCH_OUTPUT_COLUMNS
+from tax_tables import RetaTable
+
+SCALAR_KEYS = {
+    "asalariado_neto": ("asalariado", "neto"),
+    "asalariado_irpf": ("asalariado", "irpf"),
+    "autonomo_neto": ("autonomo", "neto"),
+    "autonomo_irpf": ("autonomo", "irpf"),
+    "autonomo_reta": ("autonomo", "reta"),
+    "sl_neto": ("sociedad_limitada", "neto"),
+    "sl_is": ("sociedad_limitada", "is"),
+    "sl_dividend_tax": ("sociedad_limitada", "dividend_tax"),
+}
+
+
+def _random_profiles(engine, n, seed=0):
+    rng = random.Random(seed)
+    regions = list(engine.data["irpf_tables_autonomicas"].keys()) + ["Atlántida"]
+    rows = []
+    for _ in range(n):
+        employee_gross = rng.uniform(0, 400000)
+        autonomo_gross = rng.uniform(0, 600000)
+        rows.append({
+            "employee_gross": employee_gross,
+            "employee_ss": employee_gross * 0.0635,
+            "autonomo_gross": autonomo_gross,
+            "autonomo_expenses": rng.uniform(0, autonomo_gross * 1.2),
+            "region": rng.choice(regions),
+            "is_new_company": rng.random() < 0.5,
+            "employee_personal_expenses": rng.choice([0, 600, 2000]),
+        })
+    return rows
+
+
+def test_batch_matches_scalar():
+    engine = FiscalEngine()
+    rows = _random_profiles(engine, 500)
+    batch = engine.run_simulation_batch(pd.DataFrame(rows))
+
+    for i, row in enumerate(rows):
+        scalar = engine.run_simulation(company_ss=0, **row)["results"]
+        for column, (regime, key) in SCALAR_KEYS.items():
+            assert batch[column].iloc[i] == scalar[regime][key], (column, row)
+
+
+def test_simulate_batch_returns_scalar_results():
+    engine = FiscalEngine()
+    rows = _random_profiles(engine, 300, seed=5)
+    results = engine.simulate_batch({k: [r[k] for r in rows] for k in rows[0]})
+    for result, row in zip(results, rows):
+        assert result.to_dict() == engine.run_simulation(company_ss=0, **row)
+
+
+def test_batch_rounds_half_cent_ties_like_scalar():
+    engine = FiscalEngine()
+    # IRPF del autónomo = 17322.825: np.round daría .82 y round() escalar da .83
+    row = dict(employee_gross=65000, employee_ss=4127.5, employee_personal_expenses=0, autonomo_gross=65000,
+               autonomo_expenses=50, region="Cataluña", is_new_company=True)
+    batch = engine.run_simulation_batch({k: [v] for k, v in row.items()})
+    scalar = engine.run_simulation(company_ss=0, **row)["results"]
+    for column, (regime, key) in SCALAR_KEYS.items():
+        assert batch[column][0] == scalar[regime][key], column
+    assert batch["autonomo_irpf"][0] == round(17322.825, 2) != np.round(17322.825, 2)
+
+
+def test_batch_accepts_dict_of_arrays_with_defaults():
+    engine = FiscalEngine()
+    result = engine.run_simulation_batch({
+        "employee_gross": np.array([30000.0, 65000.0]),
+        "employee_ss": np.array([1905.0, 4127.5]),
+        "autonomo_gross": np.array([45000.0, 65000.0]),
+        "autonomo_expenses": np.array([0.0, 5500.0]),
+    })
+    assert set(result) == set(BATCH_OUTPUT_COLUMNS)
+    scalar = engine.run_simulation(65000, 4127.5, 0, 0, 65000, 5500)["results"]
+    assert result["sl_neto"][1] == scalar["sociedad_limitada"]["neto"]
+    assert result["autonomo_neto"][1] == scalar["autonomo"]["neto"]
+
+
+def _all_tables(engine):
+    yield engine.data["irpf_table_estatal"], engine._state_table
+    for name, table in engine.data["irpf_tables_autonomicas"].items():
+        yield table, engine._regional_tables[name]
+    yield engine.data["ahorro_table"], engine._savings_table
+
+
+def test_compiled_tables_agree_with_reference():
+    engine = FiscalEngine()
+    rng = random.Random(42)
+    for table, compiled in _all_tables(engine):
+        limits = [b.get("hasta", b.get("mas_de")) for b in table]
+        bases = [0, -100, 0.01, 1e7] + [rng.uniform(0, 1e6) for _ in range(2000)]
+        bases += [limit + delta for limit in limits for delta in (-0.01, 0, 0.01)]
+        for base in bases:
+            expected = engine._calculate_progressive_tax(base, table)
+            assert abs(compiled.tax(base) - expected) < 1e-6, (base, table)
+        np.testing.assert_allclose(compiled.tax_array(bases), [compiled.tax(b) for b in bases], rtol=0, atol=1e-9)
+
+
+def test_simulation_result_is_compact_and_lazy():
+    engine = FiscalEngine()
+    result = engine.simulate(45000, 2857.5, 3000, 70000, 12000, "Cataluña", True)
+    assert not hasattr(result, "__dict__")
+    assert result._details is None
+    assert result.nets == engine.net_incomes(45000, 2857.5, 3000, 70000, 12000, "Cataluña", True)
+
+    expected = engine.run_simulation(45000, 2857.5, 0, 3000, 70000, 12000, "Cataluña", True)
+    assert result.to_dict() == expected
+    assert result.details["sociedad_limitada"]["tipo_is"] == engine.data["is_rates"]["new_entity"]
+
+
+def test_reta_boundaries_use_data_tramos():
+    engine = FiscalEngine()
+    tramos = engine.data[engine.dataset.reta_key]["tramos"]
+    first, top = tramos[0]["cuota"] * 12, tramos[-1]["cuota"] * 12
+
+    # Fuera de la tabla, por abajo (pérdidas) y por arriba, se aplica el tramo superior de los datos
+    assert engine.calculate_reta(-50000) == top == 590 * 12
+    assert engine.calculate_reta(-0.01) == top
+    assert engine.calculate_reta(0) == first
+    assert engine.calculate_reta(1e9) == top
+    # En el límite compartido se aplica el tramo inferior, justo por encima el siguiente
+    assert engine.calculate_reta(tramos[0]["ingresos_max"] * 12) == first
+    assert engine.calculate_reta(tramos[0]["ingresos_max"] * 12 + 1) == tramos[1]["cuota"] * 12
+
+    yields = [-1000, 0, 1e9] + [t[k] * 12 + d for t in tramos for k in ("ingresos_min", "ingresos_max") for d in (-1, 0, 1)]
+    assert engine._reta_array(yields).tolist() == [engine.calculate_reta(y) for y in yields]
+
+
+def test_reta_table_validation():
+    ok = [{"ingresos_min": 0, "ingresos_max": 670, "cuota": 200},
+          {"ingresos_min": 670.01, "ingresos_max": 900, "cuota": 220}]
+    assert RetaTable(ok).monthly_quota(670.005) == 220
+
+    with pytest.raises(ValueError, match="overlaps"):
+        RetaTable([ok[0], dict(ok[1], ingresos_min=600)])
+    with pytest.raises(ValueError, match="gap"):
+        RetaTable([ok[0], dict(ok[1], ingresos_min=700)])
+    with pytest.raises(ValueError, match="cuota"):
+        RetaTable([ok[0], dict(ok[1], cuota="variable")])
+
+
+def test_compare_regions_matches_per_region_simulations():
+    engine = FiscalEngine()
+    regions = list(engine.data["irpf_tables_autonomicas"])
+    rows = _random_profiles(engine, 200, seed=4)
+    for row in rows:
+        row.pop("region")
+
+    columns = {k: [row[k] for row in rows] for k in rows[0]}
+    batch = engine.compare_regions_batch(columns)
+    assert list(batch["regions"]) == regions
+    assert batch["asalariado_neto"].shape == (200, len(regions))
+    for r, region in enumerate(regions):
+        per_region = engine.run_simulation_batch({**columns, "region": [region] * 200})
+        for column in BATCH_OUTPUT_COLUMNS:
+            assert (batch[column][:, r] == per_region[column]).all(), (column, region)
+
+    row = rows[0]
+    compared = engine.compare_regions(row["employee_gross"], row["employee_ss"], row["employee_personal_expenses"],
+                                      row["autonomo_gross"], row["autonomo_expenses"], row["is_new_company"])
+    for region in regions:
+        scalar = engine.run_simulation(company_ss=0, region=region, **row)["results"]
+        assert compared["regions"][region] == {regime: scalar[regime]["neto"] for regime in scalar}
+    best = compared["best"]["asalariado"]
+    assert compared["regions"][best]["asalariado"] == max(v["asalariado"] for v in compared["regions"].values())
@@ -0,0 +1,74 @@
+from itertools import product
+
+import pytest
+
+import household
+from engine import FiscalEngine
+from household import JOINT_FILING_REDUCTION, REGIMES, simulate_household
+
+MEMBERS = [
+    {"name": "ana", "gross": 45000, "expenses": 3000},
+    {"name": "luis", "gross": 90000, "expenses": 12000, "is_new_company": True},
+    {"name": "eva", "gross": 18000, "employee_ss": 1000},
+]
+
+
+def _nets(engine, member, region="Madrid"):
+    ss = member.get("employee_ss", member["gross"] * 0.0635)
+    results = engine.run_simulation(member["gross"], ss, 0, 0, member["gross"], member.get("expenses", 0),
+                                    region, member.get("is_new_company", False))["results"]
+    return {regime: results[regime]["neto"] for regime in REGIMES}
+
+
+def test_combinations_match_brute_force_with_n_times_3_evaluations(monkeypatch):
+    engine = FiscalEngine()
+    calls = []
+    original = engine.run_simulation_batch
+    monkeypatch.setattr(engine, "run_simulation_batch", lambda *a, **kw: calls.append(a) or original(*a, **kw))
+
+    result = simulate_household(engine, MEMBERS, "Cataluña")
+    assert len(calls) == 1 and len(calls[0][0]["employee_gross"]) == 3
+    assert result["evaluations"] == 9 and len(result["combinations"]) == 27
+
+    monkeypatch.undo()
+    nets = [_nets(engine, m, "Cataluña") for m in MEMBERS]
+    expected = {combo: round(sum(n[r] for n, r in zip(nets, combo)), 2) for combo in product(REGIMES, repeat=3)}
+    for entry in result["combinations"]:
+        assert entry["neto"] == pytest.approx(expected[tuple(entry["regimes"].values())], abs=0.01)
+    assert result["best"]["neto"] == pytest.approx(max(expected.values()), abs=0.01)
+    assert result["members"]["ana"] == pytest.approx(nets[0], abs=0.01)
+
+
+def test_joint_filing_applies_reduction_to_combined_bases():
+    engine = FiscalEngine()
+    members = [{"name": "a", "gross": 60000, "regimes": ["asalariado"]},
+               {"name": "b", "gross": 0, "regimes": ["asalariado"]}]
+    result = simulate_household(engine, members, joint_filing=True)
+    assert len(result["combinations"]) == 1
+
+    entry = result["best"]
+    base = 60000 - 60000 * 0.0635 - 2000 - JOINT_FILING_REDUCTION
+    irpf = engine._state_table.tax(base) + engine._regional_table("Madrid").tax(base)
+    assert entry["neto_conjunta"] == pytest.approx(60000 - 60000 * 0.0635 - irpf, abs=0.01)
+    assert entry["neto_conjunta"] > entry["neto_individual"]
+    assert entry["declaracion"] == "conjunta" and entry["neto"] == entry["neto_conjunta"]
+
+
+def test_joint_filing_of_two_high_earners_stays_individual():
+    engine = FiscalEngine()
+    members = [{"gross": 150000}, {"gross": 150000}]
+    best = simulate_household(engine, members, joint_filing=True, top=3)["best"]
+    assert best["declaracion"] == "individual" and best["neto"] == best["neto_individual"]
+
+
+def test_restrictions_and_limits():
+    engine = FiscalEngine()
+    members = [{"gross": 50000, "regimes": ["asalariado", "autonomo"]}, {"gross": 30000}]
+    result = simulate_household(engine, members)
+    assert len(result["combinations"]) == 6
+    assert all(entry["regimes"]["miembro_1"] != "sociedad_limitada" for entry in result["combinations"])
+
+    with pytest.raises(ValueError):
+        simulate_household(engine, [{"gross": 1, "regimes": ["funcionario"]}])
+    with pytest.raises(ValueError):
+        simulate_household(engine, [{"gross": 1}] * (household.MAX_MEMBERS + 1))
@@ -0,0 +1,207 @@
+import json
+
+import pytest
+
+import data_registry
+import instrumentation
+import main
+
+
+class FakeRequest:
+    def __init__(self, payload=None, method="POST", path="/", data="", content_type="application/json"):
+        self.method = method
+        self.path = path
+        self.headers = {"Content-Type": content_type}
+        self._payload = payload
+        self._data = data
+
+    def get_json(self, silent=False):
+        return self._payload
+
+    def get_data(self, as_text=False):
+        return self._data
+
+
+class StubQueryJob:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def result(self):
+        return self._rows
+
+
+class StubBigQueryClient:
+    def __init__(self, rows=None, error=None):
+        self.rows = rows or []
+        self.error = error
+        self.queries = []
+
+    def query(self, sql):
+        self.queries.append(sql)
+        if self.error:
+            raise self.error
+        return StubQueryJob(self.rows)
+
+
+@pytest.fixture
+def restore_runtime(monkeypatch):
+    """Restaura el runtime global del módulo al acabar el test (aunque falle)."""
+    monkeypatch.setattr(main, "_runtime", main._runtime)
+    yield
+    if main._refresh_thread is not None:
+        main._refresh_thread.join()
+
+
+PAYLOAD = {
+    "gross_income": 65000,
+    "cnae": "6201",
+    "region": "Madrid",
+    "expenses": [{"description": "AWS Hosting", "amount": 200}],
+}
+
+
+def test_simulation_request_warm_after_init(restore_runtime):
+    main.get_runtime(force=True)
+    body, status, headers = main.fiscal_navigator_api(FakeRequest(PAYLOAD))
+    assert status == 200
+    assert headers["X-Fiscal-Start"] == "warm"
+    assert float(headers["X-Fiscal-Init-Ms"]) >= 0
+
+    response = json.loads(body)
+    assert response["dgt_analysis"]["total_deductible"] == 200
+    assert set(response["financial_simulation"]) == {"asalariado", "autonomo", "sociedad_limitada"}
+
+
+def test_runtime_reused_until_ttl_expires(monkeypatch, restore_runtime):
+    runtime, cold = main.get_runtime(force=True)
+    assert cold
+    assert main.get_runtime() == (runtime, False)
+
+    # Al caducar se sigue sirviendo el runtime actual y el nuevo se construye en segundo plano
+    monkeypatch.setattr(main, "DATA_SOURCE_TTL", 0)
+    assert main.get_runtime() == (runtime, False)
+    main._refresh_thread.join()
+    assert main._runtime is not runtime
+
+
+def test_runtime_refresh_failure_keeps_serving(monkeypatch, restore_runtime):
+    runtime, _ = main.get_runtime(force=True)
+    monkeypatch.setattr(main, "DATA_SOURCE_TTL", 0)
+    monkeypatch.setattr(main, "get_tax_data_from_bq", lambda client=None: 1 / 0)
+
+    assert main.get_runtime() == (runtime, False)
+    main._refresh_thread.join()
+    assert main._runtime is runtime
+
+
+def test_stubbed_bigquery_source(restore_runtime):
+    with open(data_registry.resolve_path("tax_data.json"), encoding="utf-8") as f:
+        tax_data = json.load(f)
+    tax_data["is_rates"] = dict(tax_data["is_rates"], general=0.2)
+    client = StubBigQueryClient(rows=[{"payload": json.dumps(tax_data)}])
+
+    runtime, cold = main.get_runtime(bq_client=client, force=True)
+    assert cold and len(client.queries) == 1
+    assert runtime.data_source.startswith("bigquery:")
+    assert runtime.engine.data["is_rates"]["general"] == 0.2
+
+    # Un segundo contenedor con los mismos datos comparte el dataset compilado
+    again, _ = main.get_runtime(bq_client=client, force=True)
+    assert again.engine.dataset is runtime.engine.dataset
+
+
+def test_bigquery_failure_falls_back_to_local_json():
+    client = StubBigQueryClient(error=RuntimeError("no credentials"))
+    assert main.get_tax_data_from_bq(client) == main.LOCAL_TAX_DATA
+    assert main.get_tax_data_from_bq() == main.LOCAL_TAX_DATA
+
+
+def test_validation_error():
+    body, status, _ = main.fiscal_navigator_api(FakeRequest({"gross_income": -1}))
+    assert status == 400
+    assert body["error"] == "Validation Error"
+
+
+def test_instrumentation_stages_counters_and_metrics(monkeypatch, caplog, restore_runtime):
+    _, _, headers = main.fiscal_navigator_api(FakeRequest(PAYLOAD))
+    assert "Server-Timing" not in headers
+
+    monkeypatch.setattr(instrumentation, "ENABLED", True)
+    monkeypatch.setattr(instrumentation, "SERVER_TIMING", True)
+    instrumentation.metrics.reset()
+    main.get_runtime(force=True)
+
+    with caplog.at_level("INFO"):
+        _, status, headers = main.fiscal_navigator_api(FakeRequest(PAYLOAD))
+    assert status == 200
+    stages = [part.split(";")[0] for part in headers["Server-Timing"].split(", ")]
+    assert stages == ["validation", "runtime", "classification", "simulation", "serialization", "total"]
+
+    # La primera petición (sin instrumentación) ya dejó el gasto en la caché compartida
+    record = next(json.loads(r.message) for r in caplog.records if r.message.startswith('{"event"'))
+    assert record["counters"] == {
+        "expenses_classified": 1, "classification_cache_hits": 1, "classification_cache_misses": 0, "status_200": 1,
+    }
+
+    body, status, _ = main.fiscal_navigator_api(FakeRequest(method="GET", path="/metrics"))
+    assert status == 200
+    assert 'fiscal_stage_ms_count{stage="simulation"} 1' in body
+    assert 'fiscal_events_total{counter="expenses_classified"} 1' in body
+
+
+def _batch_lines(request):
+    body, status, headers = main.fiscal_navigator_api(request)
+    assert status == 200 and headers["Content-Type"] == "application/x-ndjson"
+    return [json.loads(line) for line in "".join(body).splitlines()]
+
+
+def test_batch_endpoint_matches_single_requests(monkeypatch):
+    monkeypatch.setattr(main, "BATCH_CHUNK_SIZE", 2)
+    items = [
+        dict(PAYLOAD, id="a"),
+        {"gross_income": -1, "cnae": "6201", "id": "b"},
+        dict(PAYLOAD, region="Cataluña", is_new_company=True, expenses=[{"description": "Comida", "amount": 50}]),
+        dict(PAYLOAD, year=2020),
+        dict(PAYLOAD, cnae="4321", gross_income=30000),
+    ]
+    lines = _batch_lines(FakeRequest(items, path="/batch"))
+
+    assert [line["index"] for line in lines] == [0, 1, 2, 3, 4]
+    assert [line["status"] for line in lines] == ["success", "error", "success", "error", "success"]
+    assert lines[0]["id"] == "a" and lines[1]["error"] == "Validation Error"
+    assert "2020" in lines[3]["error"]
+
+    # Cada línea lleva el mismo payload que la petición individual (errores de validación incluidos)
+    for line, item in zip(lines, items):
+        body, status, _ = main.fiscal_navigator_api(FakeRequest(item))
+        single = json.loads(body) if status == 200 else body
+        if line["status"] == "success":
+            for key in ("dgt_analysis", "financial_simulation", "inputs"):
+                assert line[key] == single[key], key
+        elif line["error"] == "Validation Error":
+            assert line["details"] == single["details"]
+
+
+def test_batch_ndjson_reports_malformed_lines():
+    ndjson = json.dumps(PAYLOAD) + "\n{not json\n\n" + json.dumps(PAYLOAD) + "\n"
+    lines = _batch_lines(FakeRequest(data=ndjson, content_type="application/x-ndjson"))
+    assert [line["status"] for line in lines] == ["success", "error", "success"]
+
+    body, status, _ = main.fiscal_navigator_api(FakeRequest({"requests": "nope"}, path="/batch"))
+    assert status == 400
+
+
+def test_batch_trace_is_opened_by_the_handler(monkeypatch, caplog):
+    monkeypatch.setattr(instrumentation, "ENABLED", True)
+    monkeypatch.setattr(main, "BATCH_CHUNK_SIZE", 2)
+    with caplog.at_level("INFO"):
+        body, status, _ = main.fiscal_navigator_api(FakeRequest([PAYLOAD] * 3, path="/batch"))
+        # La traza no queda fijada en el contexto mientras se consume el streaming
+        assert instrumentation._current.get() is None
+        lines = [json.loads(line) for line in "".join(body).splitlines()]
+        assert instrumentation._current.get() is None
+
+    assert [line["status"] for line in lines] == ["success"] * 3
+    record = next(json.loads(r.message) for r in caplog.records if r.message.startswith('{"event": "fiscal_navigator_batch"'))
+    assert list(record["stages_ms"]) == ["runtime", "validation", "classification", "simulation"]
+    assert record["counters"]["batch_items"] == 3 and record["counters"]["expenses_classified"] == 3
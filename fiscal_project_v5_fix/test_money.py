@@ -0,0 +1,113 @@
+import json
+import random
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+
+import data_registry
+from engine import FiscalEngine, BATCH_OUTPUT_COLUMNS
+from money import CentsEngine, apply_rate, to_cents
+
+CENT = Decimal("0.01")
+
+
+def _round(x):
+    return x.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _bracket_tax(base, table):
+    """Referencia con Decimal: cada tramo redondeado al céntimo (mitad hacia arriba)."""
+    if base <= 0:
+        return Decimal(0)
+    tax, previous = Decimal(0), Decimal(0)
+    for bracket in table:
+        rate = Decimal(str(bracket["tipo"]))
+        limit = Decimal(str(bracket["hasta"])) if "hasta" in bracket else None
+        if limit is None or base <= limit:
+            return tax + _round((base - previous) * rate)
+        tax += _round((limit - previous) * rate)
+        previous = limit
+    return tax
+
+
+def _reference(data, employee_gross, employee_ss, personal, income, expenses, region, is_new_company):
+    D = lambda x: Decimal(str(x))  # noqa: E731
+    regions = data["irpf_tables_autonomicas"]
+    regional = regions.get(region, regions["Otros (Ceuta/Melilla/Resto)"])
+    state = data["irpf_table_estatal"]
+
+    base = max(D(employee_gross) - D(employee_ss) - 2000, Decimal(0))
+    irpf_employee = _bracket_tax(base, state) + _bracket_tax(base, regional)
+
+    monthly = (D(income) - D(expenses)) / 12
+    tramos = data["reta_2026_provisional"]["tramos"]
+    quota = next((t["cuota"] for t in tramos if D(tramos[0]["ingresos_min"]) <= monthly <= D(t["ingresos_max"])),
+                 tramos[-1]["cuota"])
+    reta = D(quota) * 12
+    net_yield = D(income) - D(expenses) - reta
+    reduction = min(_round(net_yield * D("0.07")) if net_yield >= 0 else -_round(-net_yield * D("0.07")), D(2000))
+    base_autonomo = max(net_yield - reduction, Decimal(0))
+    irpf_autonomo = _bracket_tax(base_autonomo, state) + _bracket_tax(base_autonomo, regional)
+
+    profit = D(income) - D(expenses) - 4500
+    is_rate = D(data["is_rates"]["new_entity" if is_new_company else "general"])
+    corporate_tax = max(_round(profit * is_rate) if profit >= 0 else -_round(-profit * is_rate), Decimal(0))
+    dividend = profit - corporate_tax
+    dividend_tax = _bracket_tax(dividend, data["ahorro_table"])
+
+    values = (
+        D(employee_gross) - D(employee_ss) - irpf_employee - D(personal), irpf_employee,
+        base_autonomo - irpf_autonomo, irpf_autonomo, reta,
+        dividend - dividend_tax, corporate_tax, dividend_tax,
+    )
+    return {name: int(v * 100) for name, v in zip(BATCH_OUTPUT_COLUMNS, values)}
+
+
+def _profiles(data, n=1500, seed=11):
+    rng = random.Random(seed)
+    regions = list(data["irpf_tables_autonomicas"]) + ["Desconocida"]
+    limits = [b["hasta"] for b in data["irpf_table_estatal"] if "hasta" in b]
+    rows = []
+    for i in range(n):
+        gross = round(rng.uniform(0, 400000), 2) if i % 3 else float(rng.choice(limits) + 2000 + rng.choice([-0.01, 0, 0.01]))
+        rows.append({
+            "employee_gross": gross,
+            "employee_ss": round(gross * 0.0635, 2),
+            "employee_personal_expenses": rng.choice([0, 99.99, 1500]),
+            "autonomo_gross": round(rng.uniform(0, 400000), 2),
+            "autonomo_expenses": round(rng.uniform(0, 60000), 2),
+            "region": rng.choice(regions),
+            "is_new_company": rng.random() < 0.4,
+        })
+    return rows
+
+
+def test_cents_mode_reconciles_with_decimal_reference():
+    engine = FiscalEngine()
+    data = json.loads(json.dumps(data_registry.thaw(engine.data)))
+    cents = CentsEngine(engine)
+    rows = _profiles(data)
+
+    batch = cents.simulate_batch({k: np.array([r[k] for r in rows]) for k in rows[0]})
+    for i, row in enumerate(rows):
+        expected = _reference(data, row["employee_gross"], row["employee_ss"], row["employee_personal_expenses"],
+                              row["autonomo_gross"], row["autonomo_expenses"], row["region"], row["is_new_company"])
+        scalar = cents.simulate(**row)
+        assert scalar == expected, row
+        assert {name: int(batch[name][i]) for name in BATCH_OUTPUT_COLUMNS} == expected, row
+
+        # El modo float se desvía como mucho unos céntimos (un redondeo por tramo)
+        floats = engine.simulate(**row)
+        assert abs(floats.asalariado_neto * 100 - expected["asalariado_neto"]) <= 10
+        assert abs(floats.sl_neto * 100 - expected["sl_neto"]) <= 10
+
+
+def test_rounding_is_half_up_per_step():
+    assert apply_rate(5, 1000) == 1  # 0,5 céntimos -> 1
+    assert apply_rate(-5, 1000) == -1
+    assert apply_rate(np.array([5, 4, -5]), 1000).tolist() == [1, 0, -1]
+    assert to_cents(0.1 + 0.2) == 30
+
+    ss = CentsEngine(FiscalEngine()).simulate(30000.10, employee_ss_rate=0.0635)
+    base = to_cents(30000.10) - apply_rate(to_cents(30000.10), 635) - 200000
+    assert ss["asalariado_irpf"] > 0 and base == 3000010 - 190501 - 200000
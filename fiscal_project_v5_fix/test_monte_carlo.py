@@ -0,0 +1,40 @@
+import numpy as np
+
+import monte_carlo
+from engine import FiscalEngine
+from monte_carlo import run_monte_carlo
+
+INCOME = {"dist": "normal", "mean": 70000, "std": 15000}
+EXPENSES = {"dist": "uniform", "low": 2000, "high": 12000}
+
+
+def test_seeded_runs_are_reproducible_and_independent_of_workers():
+    engine = FiscalEngine()
+    serial = run_monte_carlo(engine, INCOME, EXPENSES, 45000, n_scenarios=20000, seed=11, chunk_size=5000, workers=1)
+    pooled = run_monte_carlo(engine, INCOME, EXPENSES, 45000, n_scenarios=20000, seed=11, chunk_size=5000, workers=2)
+    assert serial == pooled
+    assert run_monte_carlo(engine, INCOME, EXPENSES, 45000, n_scenarios=20000, seed=12, chunk_size=5000) != serial
+
+    probabilities = [r["win_probability"] for r in serial["regimes"].values()]
+    assert abs(sum(probabilities) + serial["tie_probability"] - 1) < 1e-9
+
+
+def test_degenerate_distributions_match_point_simulation():
+    engine = FiscalEngine()
+    result = run_monte_carlo(engine, 65000, 5500, 65000, n_scenarios=1000, seed=0)
+    point = engine.run_simulation(65000, 65000 * 0.0635, 0, 0, 65000, 5500)["results"]
+    for regime, stats in result["regimes"].items():
+        assert stats["percentiles"]["p50"] == point[regime]["neto"]
+    assert result["regimes"]["asalariado"]["win_probability"] == 1.0
+
+
+def test_ties_are_reported_not_given_to_the_first_regime(monkeypatch):
+    # Netos por escenario (filas: asalariado, autónomo, SL)
+    nets = np.array([[100.0, 100.0, 90.0, 50.0],
+                     [100.0, 80.0, 95.0, 70.0],
+                     [60.0, 100.0, 95.0, 60.0]])
+    monkeypatch.setattr(monte_carlo, "_simulate_chunk", lambda engine, params, seed_seq, size: nets)
+
+    result = run_monte_carlo(FiscalEngine(), 0, 0, 0, n_scenarios=4, seed=0, chunk_size=4)
+    assert result["tie_probability"] == 0.75
+    assert [r["win_probability"] for r in result["regimes"].values()] == [0.0, 0.25, 0.0]
@@ -0,0 +1,153 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+import portfolio_runner
+from batch_api import run_batch_chunk
+from portfolio_runner import iter_clients, run_portfolio
+
+
+def _clients(n=25):
+    descriptions = ["AWS Hosting", "Comida cliente", "Luz oficina", "Material oficina"]
+    clients = [{
+        "id": f"c{i}",
+        "gross_income": 30000 + 1000 * i,
+        "cnae": "6201" if i % 2 else "5610",
+        "region": "Cataluña" if i % 3 else "Madrid",
+        "expenses": [{"description": descriptions[(i + k) % 4], "amount": 100 + k} for k in range(i % 4)],
+    } for i in range(n)]
+    clients[7]["gross_income"] = -1  # error de validación por cliente
+    return clients
+
+
+def _write_jsonl(path, clients):
+    path.write_text("".join(json.dumps(c) + "\n" for c in clients), encoding="utf-8")
+
+
+def _read(path):
+    return sorted((json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()),
+                  key=lambda line: line["index"])
+
+
+def test_runs_in_chunks_and_matches_batch_endpoint(tmp_path):
+    source, output = tmp_path / "cartera.jsonl", tmp_path / "out.jsonl"
+    clients = _clients()
+    _write_jsonl(source, clients)
+
+    summary = run_portfolio(str(source), str(output), chunk_size=4, workers=1)
+    assert summary["clients"] == 25 and summary["chunks"] == 7 and summary["errors"] == 1
+
+    lines = _read(output)
+    assert [line["index"] for line in lines] == list(range(25))
+    assert lines[7]["status"] == "error" and lines[7]["id"] == "c7"
+
+    portfolio_runner._init_worker("tax_data.json")
+    expected = run_batch_chunk(portfolio_runner._worker_engine, portfolio_runner._worker_dgt, clients, 0)
+    assert lines == json.loads(json.dumps(expected, default=str))
+
+
+def test_resume_skips_done_chunks_and_drops_partial_writes(tmp_path):
+    source, output = tmp_path / "cartera.jsonl", tmp_path / "out.jsonl"
+    _write_jsonl(source, _clients())
+    run_portfolio(str(source), str(output), chunk_size=4, workers=1)
+    complete = _read(output)
+
+    # Interrupción tras dos bloques con un tercero escrito a medias
+    progress = tmp_path / "out.jsonl.progress"
+    log = progress.read_text(encoding="utf-8").splitlines()
+    progress.write_text("\n".join(log[:3]) + "\n", encoding="utf-8")
+    offset = json.loads(log[2])["offset"]
+    with open(output, "r+b") as f:
+        f.truncate(offset)
+        f.seek(offset)
+        f.write(b'{"index": 8, "sta')
+
+    summary = run_portfolio(str(source), str(output), chunk_size=4, workers=1, resume=True)
+    assert summary["skipped_chunks"] == 2 and summary["clients"] == 17
+    assert _read(output) == complete
+
+    with pytest.raises(ValueError):
+        run_portfolio(str(source), str(output), chunk_size=5, workers=1, resume=True)
+
+
+def test_csv_expense_rows_are_grouped_per_client(tmp_path):
+    source = tmp_path / "cartera.csv"
+    source.write_text(
+        "id,gross_income,cnae,region,description,amount\n"
+        "a,50000,6201,Madrid,AWS Hosting,\"1.200,50\"\n"
+        "a,50000,6201,Madrid,Luz oficina,80\n"
+        "b,40000,5610,,Comida cliente,30\n",
+        encoding="utf-8",
+    )
+    clients = list(iter_clients(str(source)))
+    assert [c["id"] for c in clients] == ["a", "b"]
+    assert clients[0]["expenses"] == [{"description": "AWS Hosting", "amount": 1200.5},
+                                      {"description": "Luz oficina", "amount": 80.0}]
+    assert "region" not in clients[1]
+
+
+def test_process_pool_gives_same_results(tmp_path):
+    source = tmp_path / "cartera.jsonl"
+    _write_jsonl(source, _clients(12))
+    run_portfolio(str(source), str(tmp_path / "serial.jsonl"), chunk_size=3, workers=1)
+    summary = run_portfolio(str(source), str(tmp_path / "pool.jsonl"), chunk_size=3, workers=2)
+    assert summary["clients"] == 12
+    assert _read(tmp_path / "pool.jsonl") == _read(tmp_path / "serial.jsonl")
+
+
+def test_unreadable_rows_become_error_lines(tmp_path):
+    source, output = tmp_path / "cartera.csv", tmp_path / "out.jsonl"
+    source.write_text(
+        "id,gross_income,cnae,expenses\n"
+        "a,50000,6201,\"[{\"\"description\"\": \"\"AWS Hosting\"\", \"\"amount\"\": 100}]\"\n"
+        "b,40000,6201,[{not json\n"
+        "c,45000,6201,[]\n",
+        encoding="utf-8",
+    )
+    summary = run_portfolio(str(source), str(output), chunk_size=2, workers=2)
+    assert summary["clients"] == 3 and summary["errors"] == 1
+    lines = _read(output)
+    assert [line["status"] for line in lines] == ["success", "error", "success"]
+    assert lines[1]["id"] == "b" and "Invalid expenses JSON" in lines[1]["error"]
+
+    jsonl = tmp_path / "cartera.jsonl"
+    jsonl.write_text('{"gross_income": 30000, "cnae": "6201"}\n{"gross_income": \n', encoding="utf-8")
+    assert run_portfolio(str(jsonl), str(output), workers=1)["errors"] == 1
+
+
+def test_bad_expense_amount_fails_only_its_client(tmp_path):
+    source, output = tmp_path / "cartera.csv", tmp_path / "out.jsonl"
+    source.write_text(
+        "id,gross_income,cnae,description,amount\n"
+        "a,50000,6201,AWS Hosting,100\n"
+        "b,40000,6201,AWS Hosting,abc\n"
+        "b,40000,6201,Luz oficina,80\n"
+        "c,45000,6201,Luz oficina,80\n",
+        encoding="utf-8",
+    )
+    summary = run_portfolio(str(source), str(output), workers=1)
+    assert summary["clients"] == 3 and summary["errors"] == 1
+    lines = _read(output)
+    assert [(line["id"], line["status"]) for line in lines] == [("a", "success"), ("b", "error"), ("c", "success")]
+    assert "Invalid expense amount" in lines[1]["error"]
+
+
+def test_expense_rows_without_id_are_not_merged(tmp_path):
+    source = tmp_path / "cartera.csv"
+    source.write_text(
+        "gross_income,cnae,description,amount\n"
+        "50000,6201,AWS Hosting,100\n"
+        "40000,5610,Comida cliente,30\n",
+        encoding="utf-8",
+    )
+    clients = list(iter_clients(str(source)))
+    assert len(clients) == 2
+    assert all(isinstance(c, ValueError) and "need an id" in str(c) for c in clients)
+
+
+def test_runner_does_not_import_the_cloud_function():
+    code = "import sys, portfolio_runner; print('main' in sys.modules, 'functions_framework' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert out.split() == ["False", "False"]
@@ -0,0 +1,51 @@
+import random
+
+import numpy as np
+
+import data_registry
+from engine import FiscalEngine
+from sl_optimizer import _split_result, optimize_admin_salary, optimize_admin_salary_batch
+
+
+def test_optimum_beats_dense_grid_and_matches_run_simulation_at_zero():
+    engine = FiscalEngine()
+    for gross, region, new in ((40000, "Madrid", False), (120000, "Cataluña", True), (400000, "Andalucía", False)):
+        best = optimize_admin_salary(engine, gross, 5000, region, new)
+        profit = gross - 5000 - 4500
+        is_rate = best["tipo_is"]
+        grid = [_split_result(engine, region, profit, s, 0.0, is_rate)["neto"] for s in np.linspace(0, profit, 4001)]
+        assert best["neto"] >= max(grid) - 1e-6
+        assert best["neto"] >= best["neto_solo_dividendos"]
+
+        sl = engine.run_simulation(0, 0, 0, 0, gross, 5000, region, new)["results"]["sociedad_limitada"]
+        assert round(best["neto_solo_dividendos"], 2) == sl["neto"]
+
+
+def test_batch_matches_scalar():
+    engine = FiscalEngine()
+    rng = random.Random(3)
+    regions = list(engine.data["irpf_tables_autonomicas"])
+    rows = [{
+        "autonomo_gross": rng.uniform(0, 500000),
+        "autonomo_expenses": rng.uniform(0, 50000),
+        "region": rng.choice(regions),
+        "is_new_company": rng.random() < 0.5,
+    } for _ in range(300)]
+    batch = optimize_admin_salary_batch(engine, {k: [r[k] for r in rows] for k in rows[0]}, admin_ss_rate=0.0635)
+
+    for i, row in enumerate(rows):
+        best = optimize_admin_salary(engine, admin_ss_rate=0.0635, **row)
+        assert abs(batch["sl_neto"][i] - round(best["neto"], 2)) <= 0.01
+
+
+def test_admin_ss_rate_defaults_to_tax_data():
+    data = data_registry.thaw(data_registry.load_json("tax_data.json"))
+    data["ss_rates"] = {"administrador_sl": 0.05}
+    engine = FiscalEngine(dataset=data_registry.register_tax_dataset("test:ss_rates", data))
+
+    assert optimize_admin_salary(engine, 120000, 5000) == optimize_admin_salary(engine, 120000, 5000, admin_ss_rate=0.05)
+    profiles = {"autonomo_gross": [120000.0], "autonomo_expenses": [5000.0]}
+    default = optimize_admin_salary_batch(engine, profiles)
+    explicit = optimize_admin_salary_batch(engine, profiles, admin_ss_rate=0.05)
+    assert all((default[k] == explicit[k]).all() for k in default)
+    assert optimize_admin_salary(FiscalEngine(), 120000, 5000)["admin_ss"] == 0